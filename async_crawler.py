@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import socket
+import time
+from urllib.parse import urlparse
+import aiohttp
+from aiohttp.abc import AbstractResolver
+import redis
+from fake_useragent import UserAgent
+from config import REDIS_CONFIG, CRAWLER_CONFIG, HTTP_POOL_CONFIG, PROXY_CONFIG, RETRY_CONFIG
+from crawler import Crawler
+from rate_limiter import HostRateLimiter
+from frontier import Frontier
+from image_store import ImageStore
+from page_cache import PageCache
+from proxy_manager import ProxyManager, ProxyUnavailable
+from retry_queue import RetryQueue
+
+# 代理本身的故障：连不上代理、代理拒绝建立隧道或通过代理建立连接超时。这类失败换一个代理重试，不计入URL的重试次数。
+# aiohttp 3.10 之前连接超时没有单独的异常类型，无法与读取超时区分，只按前两种判断
+PROXY_ERRORS = (
+    aiohttp.ClientProxyConnectionError,
+    aiohttp.ClientHttpProxyError,
+    getattr(aiohttp, 'ConnectionTimeoutError', aiohttp.ClientProxyConnectionError)
+)
+
+
+class CachedResolver(AbstractResolver):
+    """通过共享的DNS缓存解析主机，缓存无法解析时使用 aiohttp 默认的解析器"""
+
+    def __init__(self, dns_cache):
+        self.dns_cache = dns_cache
+        self.fallback = aiohttp.DefaultResolver()
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        # 进程内缓存命中时直接返回，否则查询 Redis 或解析，放到线程池中执行避免阻塞事件循环
+        ips = self.dns_cache.get_ips(host, local_only=True)
+        if ips is None:
+            ips = await asyncio.to_thread(self.dns_cache.get_ips, host)
+        if ips == [] and family != socket.AF_INET6:  # 最近解析失败过，直接失败，不再回退到系统解析
+            raise OSError(f"无法解析主机 {host}")
+        if not ips or family == socket.AF_INET6:
+            return await self.fallback.resolve(host, port, family)
+        return [
+            {'hostname': host, 'host': ip, 'port': port, 'family': socket.AF_INET, 'proto': 0,
+             'flags': socket.AI_NUMERICHOST}
+            for ip in ips
+        ]
+
+    async def close(self):
+        await self.fallback.close()
+
+
+class AsyncCrawler(Crawler):
+    """基于 asyncio 的爬虫，一个进程内同时处理多个在途请求"""
+
+    def __init__(self, parse_queue, max_in_flight=None):
+        """初始化异步爬虫"""
+        super().__init__(parse_queue)
+        self.max_in_flight = max_in_flight or CRAWLER_CONFIG['max_in_flight']  # 每个进程的最大在途请求数
+        self.pool_stats = {'connection_hits': 0, 'connection_misses': 0}
+
+    def create_session(self):
+        """创建 aiohttp 会话。连接器按 (主机, 端口, SSL, 代理) 分池，页面和图片请求共用"""
+        connector = aiohttp.TCPConnector(
+            limit=self.max_in_flight,  # 连接数上限与在途请求数一致
+            # 使用共享的DNS缓存时关闭 aiohttp 自带的固定时间缓存，解析结果按记录的 TTL 过期
+            resolver=CachedResolver(self.dns_cache) if self.dns_cache else None,
+            use_dns_cache=not self.dns_cache,
+            keepalive_timeout=HTTP_POOL_CONFIG['idle_timeout'],  # 空闲连接超时后关闭
+            force_close=not HTTP_POOL_CONFIG['keep_alive']
+        )
+        timeout = aiohttp.ClientTimeout(total=CRAWLER_CONFIG['timeout'])
+        return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[self.create_trace_config()])
+
+    def create_trace_config(self):
+        """统计连接复用情况：新建连接记为未命中，复用连接记为命中"""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_connection_create_end(session, context, params):
+            self.pool_stats['connection_misses'] += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.pool_stats['connection_hits'] += 1
+
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    def get_pool_stats(self):
+        """获取连接池命中统计"""
+        return dict(self.pool_stats)
+
+    def get_request_proxy(self, url):
+        """获取与URL协议匹配的代理地址，aiohttp 每个请求只接受一个代理"""
+        proxy = self.get_proxy()
+        if not proxy:
+            return None
+        return proxy.get(urlparse(url).scheme)
+
+    def get_request_timeout(self, proxy):
+        """使用代理时连接超时单独设置，死代理不会占用完整的请求超时"""
+        if not proxy:
+            return None
+        return aiohttp.ClientTimeout(total=CRAWLER_CONFIG['timeout'], sock_connect=PROXY_CONFIG['connect_timeout'])
+
+    async def wait_for_rate_limit_async(self, url):
+        """等待URL所在主机的令牌，等待期间不阻塞其他请求"""
+        if self.rate_limiter:
+            wait = await asyncio.to_thread(self.rate_limiter.reserve, url)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def fetch_page(self, session, url, crawler_id, headers=None):
+        """请求页面，返回 (状态码, 页面文本, 响应头)。页面未修改（304）或请求失败的状态码下页面文本为 None，网络错误时抛出异常。
+        代理出错时与同步爬虫一样立即换一个代理重试，代理都失败且不允许直接连接时抛出 ProxyUnavailable"""
+        proxy = self.get_request_proxy(url)
+        attempts = 0
+        while proxy:
+            attempts += 1
+            try:
+                result = await self.fetch_once(session, url, crawler_id, headers, proxy)
+                if result[0] not in PROXY_CONFIG['failure_statuses']:
+                    return result
+                print(f"代理 {proxy} 返回状态码 {result[0]}，换一个代理")
+            except PROXY_ERRORS as e:
+                print(f"代理 {proxy} 连接失败，换一个代理: {str(e) or type(e).__name__}")
+            if attempts >= PROXY_CONFIG['proxy_attempts']:
+                if not PROXY_CONFIG['allow_direct']:
+                    raise ProxyUnavailable(f"{attempts} 个代理都请求失败")
+                print(f"{attempts} 个代理都请求失败，直接连接: {url}")
+                break
+            proxy = self.get_request_proxy(url)
+        return await self.fetch_once(session, url, crawler_id, headers, None)
+
+    async def fetch_once(self, session, url, crawler_id, headers, proxy):
+        """通过指定代理（None 表示直接连接）请求一次页面。读完响应体后向代理池报告一次代理的可用性和延迟，
+        读取响应体时出错只记一次失败"""
+        print(f"爬虫 {crawler_id} 请求 {url}")
+        await self.wait_for_rate_limit_async(url)
+        start = time.time()
+        kwargs = {'timeout': self.get_request_timeout(proxy)} if proxy else {}
+        try:
+            async with session.get(url, headers=headers, proxy=proxy, **kwargs) as response:
+                print(f"爬虫 {crawler_id} 获得响应状态码: {response.status}")
+                content = None
+                if response.status == 200:
+                    content = await response.text(encoding='utf-8', errors='replace')
+                status, response_headers = response.status, response.headers
+        except Exception:
+            self.proxy_manager.report(proxy, False)
+            raise
+        self.proxy_manager.report(proxy, status not in PROXY_CONFIG['failure_statuses'], time.time() - start)
+        return status, content, response_headers
+
+    async def download_image(self, session, url, crawler_id, title=None):
+        """异步流式下载图片，按内容摘要去重保存。已保存过的图片直接跳过，中断的下载会在下次用 Range 请求续传。
+        返回 (是否成功, 响应状态码)，没有收到响应（网络错误）时状态码为 None"""
+        status = None
+        try:
+            known = await asyncio.to_thread(self.image_store.lookup, url)
+            if known:
+                self.image_store.skip_known(known)
+                print(f"爬虫 {crawler_id} 图片已保存过，跳过下载: {url}")
+                return True, status
+
+            name = self.build_image_filename(url, title)
+            await self.wait_for_rate_limit_async(url)
+            async with session.get(url, headers=self.image_store.range_headers(url)) as response:
+                status = response.status
+                etag = response.headers.get('ETag')
+                if await asyncio.to_thread(
+                        self.image_store.reuse_by_etag, url, status, response.headers, title, name):
+                    print(f"爬虫 {crawler_id} ETag 对应的图片已保存过，跳过下载: {url}")
+                    return True, status
+                download = await asyncio.to_thread(
+                    self.image_store.open_for_response, url, status, response.headers)
+                if download is None:
+                    print(f"下载图片失败 {url}: 状态码 {status}")
+                    return False, status
+                try:
+                    # 逐块读取并写入，每个下载只占用一个块大小的内存；写文件放到线程池中执行，避免阻塞事件循环
+                    async for chunk in response.content.iter_chunked(self.image_store.chunk_size):
+                        await asyncio.to_thread(download.write, chunk)
+                finally:
+                    await asyncio.to_thread(download.close)
+
+            if not await asyncio.to_thread(self.image_store.is_complete, url, download):
+                print(f"图片下载不完整，等待续传: {url}")
+                return False, None
+            path = await asyncio.to_thread(self.image_store.commit, url, download, title, name, etag)
+            print(f"爬虫 {crawler_id} 成功下载图片: {name} -> {path}")
+            return True, status
+        except Exception as e:
+            print(f"下载图片失败 {url}: {str(e)}")
+        return False, None
+
+    async def fail_url_async(self, url, error, kind, retriable=True, charge=True, depth=0):
+        """处理失败的URL：可以重试的放入延迟重试队列，到期后按原深度放回，否则标记为失败。charge 为 False 时不计入重试次数"""
+        await asyncio.to_thread(self.fail_url, url, error, kind, retriable, charge, depth)
+
+    async def handle_url(self, session, redis_client, ua, url, crawler_id, depth=0):
+        """处理单个URL：图片直接下载，页面内容交给解析器。失败的URL放入延迟重试队列"""
+        if await asyncio.to_thread(self.is_image_task, url, redis_client):
+            print(f"爬虫 {crawler_id} 检测到图片URL，开始下载...")
+            title = await asyncio.to_thread(self.get_image_title, url, redis_client)
+            success, status = await self.download_image(session, url, crawler_id, title)
+            if success:
+                await asyncio.to_thread(self.retry_queue.mark_success, url)
+                self.heartbeat.incr('images_downloaded')
+            else:
+                await self.fail_url_async(
+                    url, self.image_error(status), 'images', self.is_retriable_image_failure(status), depth=depth)
+            return
+
+        # 带上条件请求头，页面没有变化时服务器返回 304
+        cached = await asyncio.to_thread(self.page_cache.get, url)
+        headers = self.build_headers(ua)
+        headers.update(self.page_cache.conditional_headers(cached))
+        self.update_status("requesting")
+        try:
+            status, content, response_headers = await self.fetch_page(session, url, crawler_id, headers)
+        except ProxyUnavailable as e:  # 代理的问题，稍后重试，不计入URL的重试次数
+            self.update_status("request fail")
+            print(f"爬虫 {crawler_id} 请求失败: {str(e)}")
+            await self.fail_url_async(url, str(e), 'pages', charge=False, depth=depth)
+            return
+        except Exception as e:
+            self.update_status("request fail")
+            print(f"爬虫 {crawler_id} 请求失败: {str(e)}")
+            await self.fail_url_async(url, str(e) or type(e).__name__, 'pages', depth=depth)
+            return
+
+        if status == 304:  # 页面没有变化，不需要再次解析
+            self.update_status("request success")
+            print(f"爬虫 {crawler_id} 页面未修改，跳过解析: {url}")
+            await asyncio.to_thread(self.retry_queue.mark_success, url)
+            self.heartbeat.incr('pages_not_modified')
+            return
+
+        if status != 200:
+            self.update_status("request fail")
+            # 限流和服务器错误稍后重试，其余状态码（如404）直接标记为失败
+            await self.fail_url_async(url, f"HTTP {status}", 'pages', status in RETRY_CONFIG['retry_statuses'],
+                                      depth=depth)
+            return
+
+        self.update_status("request success")
+        print(f"爬虫 {crawler_id} 成功获取页面内容，长度: {len(content)}")
+        body_hash = self.page_cache.body_hash(content)
+        if self.page_cache.is_unchanged(cached, body_hash):  # 服务器不支持条件请求时按内容判断
+            print(f"爬虫 {crawler_id} 页面内容未变化，跳过解析: {url}")
+            await asyncio.to_thread(self.retry_queue.mark_success, url)
+            self.heartbeat.incr('pages_unchanged')
+            return
+        try:
+            self.parse_queue.put({
+                'url': url,
+                'content': content,
+                'crawler_id': crawler_id,
+                'depth': depth,
+                'validators': self.page_cache.validators(response_headers, body_hash)  # 解析完成后由解析器保存
+            })  # 爬取到的非图片内容传入共享队列
+            await asyncio.to_thread(self.retry_queue.mark_success, url)
+            self.heartbeat.incr('pages_fetched')
+        except Exception as e:
+            print(f"发送数据到解析器失败: {str(e)}")
+
+    async def fetch_loop(self, redis_client, crawler_id, task_queue):
+        """从 Redis 拉取URL放入本地队列，本地队列满时自然停止拉取"""
+        while self.running:
+            try:
+                # Redis 操作（包括阻塞等待）放到线程池中执行，避免阻塞事件循环
+                task = await asyncio.to_thread(self.next_task, self.frontier, crawler_id)
+                if not task:
+                    print(f"爬虫 {crawler_id} 等待任务...")
+                    self.update_status("waiting")
+                    if CRAWLER_CONFIG['fetch_mode'] != 'blocking':
+                        await asyncio.sleep(1)
+                    continue
+                print(f"爬虫 {crawler_id} 获取到URL: {task[0]}")
+                await task_queue.put(task)
+            except Exception as e:
+                print(f"爬虫 {crawler_id} 获取任务时发生错误: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def handle_loop(self, session, redis_client, ua, crawler_id, task_queue):
+        """从本地队列取出URL并处理"""
+        while True:
+            url, depth = await task_queue.get()
+            try:
+                await self.handle_url(session, redis_client, ua, url, crawler_id, depth or 0)
+            except Exception as e:
+                print(f"爬虫 {crawler_id} 处理URL时发生错误: {str(e)}")
+            finally:
+                await asyncio.to_thread(self.frontier.ack, url)  # 释放租约
+                self.heartbeat.incr('tasks_done')
+                task_queue.task_done()
+
+    async def run(self, crawler_id):
+        """异步爬虫主循环"""
+        redis_client = redis.Redis(**REDIS_CONFIG)
+        self.rate_limiter = HostRateLimiter(redis_client)
+        self.proxy_manager = ProxyManager(redis_client=redis_client)
+        self.start_heartbeat(crawler_id, redis_client)
+        self.start_dns_cache(redis_client)
+        self.image_store = ImageStore(redis_client=redis_client, on_stat=self.heartbeat.incr)
+        self.page_cache = PageCache(redis_client)
+        self.retry_queue = RetryQueue(redis_client)
+        self.frontier = Frontier(redis_client, crawler_id)
+        ua = UserAgent()
+        # 本地队列长度与在途请求数一致，避免从 Redis 中预取过多URL
+        task_queue = asyncio.Queue(maxsize=self.max_in_flight)
+
+        print(f"爬虫 {crawler_id} 开始工作（异步模式，最大在途请求数: {self.max_in_flight}）")
+        async with self.create_session() as session:
+            handlers = [
+                asyncio.create_task(self.handle_loop(session, redis_client, ua, crawler_id, task_queue))
+                for _ in range(self.max_in_flight)
+            ]
+            try:
+                await self.fetch_loop(redis_client, crawler_id, task_queue)
+                await task_queue.join()
+            finally:
+                for handler in handlers:
+                    handler.cancel()
+
+    def crawler_worker(self, crawler_id):
+        """爬虫工作进程"""
+        try:
+            asyncio.run(self.run(crawler_id))
+        except Exception as e:
+            print(f"爬虫 {crawler_id} 初始化失败: {str(e)}")
@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+# 性能基准测试。用本地的模拟 HTTP 服务代替真实网站，对比不同实现的吞吐量
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import os
+import tempfile
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from multiprocessing import Process
+from config import CRAWLER_CONFIG, DISPATCHER_CONFIG, RATE_LIMIT_CONFIG, REDIS_CONFIG, REDIS_KEYS, SEEN_CONFIG
+
+BENCH_HEADERS = {'User-Agent': 'crawler-benchmark'}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """模拟站长之家的页面和图片，每个响应前等待固定延迟以模拟网络耗时"""
+    protocol_version = 'HTTP/1.1'  # 支持长连接
+    latency = 0.05
+    image_size = 200 * 1024
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if self.path.endswith('.jpg'):
+            body = b'\xff' * self.image_size
+            content_type = 'image/jpeg'
+        else:
+            imgs = ''.join(
+                f'<img class="lazy" data-original="/img_{i}.jpg" alt="图片{i}">' for i in range(20)
+            )
+            body = f'<html><body><div class="tupian-list">{imgs}</div></body></html>'.encode('utf-8')
+            content_type = 'text/html; charset=utf-8'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 不打印访问日志
+
+
+def run_stand_in_server(port, latency, image_size):
+    """启动模拟服务（在独立进程中运行，避免与被测客户端争抢 GIL）"""
+    StandInHandler.latency = latency
+    StandInHandler.image_size = image_size
+    ThreadingHTTPServer.request_queue_size = 1024
+    ThreadingHTTPServer.daemon_threads = True
+    server = ThreadingHTTPServer(('127.0.0.1', port), StandInHandler)
+    server.serve_forever()
+
+
+def start_stand_in_server(port, latency, image_size):
+    """启动模拟服务进程并等待其就绪"""
+    import socket
+    server_process = Process(target=run_stand_in_server, args=(port, latency, image_size), daemon=True)
+    server_process.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return server_process
+
+
+def without_proxies(crawler):
+    """清空代理池，两种模型都直接连接本地的模拟服务，不经过 PROXY_POOL 中的远程代理"""
+    from proxy_manager import ProxyManager
+    crawler.proxy_manager = ProxyManager(proxies=[])
+    return crawler
+
+
+def process_model_worker(urls, download_dir):
+    """当前的进程模型：每个进程同时只处理一个请求"""
+    from crawler import Crawler
+    CRAWLER_CONFIG['download_path'] = download_dir
+    crawler = without_proxies(Crawler(None))
+    for url in urls:
+        if crawler.is_image_url(url):
+            crawler.download_image(url, 'bench')
+        else:
+            crawler.request_page(url, BENCH_HEADERS, None)
+
+
+def run_process_model(urls, processes, download_dir):
+    """用多个进程均分URL，返回耗时"""
+    start = time.time()
+    workers = [
+        Process(target=process_model_worker, args=(urls[i::processes], download_dir))
+        for i in range(processes)
+    ]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    return time.time() - start
+
+
+def run_async_model(urls, max_in_flight, download_dir):
+    """用单个异步爬虫进程处理全部URL，返回耗时"""
+    from async_crawler import AsyncCrawler
+    CRAWLER_CONFIG['download_path'] = download_dir
+    crawler = without_proxies(AsyncCrawler(None, max_in_flight))
+
+    async def fetch_all():
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        async def fetch_one(session, url):
+            async with semaphore:
+                if crawler.is_image_url(url):
+                    await crawler.download_image(session, url, 'bench')
+                    return
+                try:
+                    await crawler.fetch_page(session, url, 'bench', BENCH_HEADERS)
+                except Exception as e:
+                    print(f"请求失败 {url}: {str(e)}")
+
+        async with crawler.create_session() as session:
+            await asyncio.gather(*(fetch_one(session, url) for url in urls))
+
+    start = time.time()
+    asyncio.run(fetch_all())
+    return time.time() - start
+
+
+def bench_fetch(args):
+    """对比进程模型和异步模型的页面、图片吞吐量"""
+    server_process = start_stand_in_server(args.port, args.latency, args.image_size)
+    base = f'http://127.0.0.1:{args.port}'
+    page_urls = [f'{base}/page_{i}.html' for i in range(args.pages)]
+    image_urls = [f'{base}/img_{i}.jpg' for i in range(args.images)]
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as download_dir:
+            for name, urls in (('页面', page_urls), ('图片', image_urls)):
+                elapsed = run_process_model(urls, args.processes, download_dir)
+                results.append((f'进程模型({args.processes}进程)', name, len(urls), elapsed))
+                elapsed = run_async_model(urls, args.max_in_flight, download_dir)
+                results.append((f'异步模型(1进程, 在途{args.max_in_flight})', name, len(urls), elapsed))
+    finally:
+        server_process.terminate()
+
+    print(f"\n模拟服务延迟: {args.latency * 1000:.0f}ms, 图片大小: {args.image_size // 1024}KB")
+    for model, name, count, elapsed in results:
+        print(f"{model:<28} {name}: {count} 个, 耗时 {elapsed:.2f}s, {count / elapsed:.1f} 个/秒")
+
+
+def bench_seen(args):
+    """对比精确集合和布隆过滤器保存已处理URL的内存占用和批量读写吞吐量（需要本地 Redis）"""
+    import redis
+    from bloom import ScalableBloomFilter
+    redis_client = redis.Redis(**REDIS_CONFIG)
+    set_key = 'bench:seen:set'
+    bloom = ScalableBloomFilter(redis_client, 'bench:seen:bloom', args.capacity, args.error_rate)
+    bloom_keys = [bloom.meta_key] + [f'{bloom.key}:{i}' for i in range(64)]
+    redis_client.delete(set_key, *bloom_keys)
+
+    # 与站长之家图片URL长度相近的模拟URL
+    urls = [f'https://scpic.chinaz.net/files/default/imgs/2023-05-10/{i:016x}_s.jpg' for i in range(args.urls)]
+    unseen = [f'https://scpic.chinaz.net/files/default/imgs/2024-01-01/{i:016x}_s.jpg' for i in range(args.checks)]
+    batches = lambda items: (items[i:i + args.batch] for i in range(0, len(items), args.batch))
+
+    def check_set(batch):
+        pipe = redis_client.pipeline(transaction=False)
+        for url in batch:
+            pipe.sismember(set_key, url)
+        return pipe.execute()
+
+    try:
+        start = time.time()
+        for batch in batches(urls):
+            redis_client.sadd(set_key, *batch)
+        set_add = time.time() - start
+        start = time.time()
+        for batch in batches(urls):
+            bloom.add(batch)
+        bloom_add = time.time() - start
+
+        start = time.time()
+        for batch in batches(unseen):
+            check_set(batch)
+        set_check = time.time() - start
+        start = time.time()
+        false_positives = 0
+        for batch in batches(unseen):
+            false_positives += sum(bloom.contains_many(batch))
+        bloom_check = time.time() - start
+
+        set_memory = redis_client.memory_usage(set_key) or 0
+        bloom_memory = bloom.memory_usage()
+    finally:
+        redis_client.delete(set_key, *bloom_keys)
+
+    print(f"\nURL数: {args.urls}, 查询数: {args.checks}, 批大小: {args.batch}, "
+          f"布隆过滤器第一层容量: {args.capacity}, 目标误判率: {args.error_rate}")
+    print(f"{'精确集合':<10} 内存 {set_memory / 1024 / 1024:8.2f} MB ({set_memory / args.urls:6.1f} 字节/URL), "
+          f"添加 {args.urls / set_add:9.0f} 个/秒, 查询 {args.checks / set_check:9.0f} 个/秒")
+    print(f"{'布隆过滤器':<9} 内存 {bloom_memory / 1024 / 1024:8.2f} MB ({bloom_memory / args.urls:6.1f} 字节/URL), "
+          f"添加 {args.urls / bloom_add:9.0f} 个/秒, 查询 {args.checks / bloom_check:9.0f} 个/秒, "
+          f"实测误判率 {false_positives / args.checks:.5f}")
+
+
+def bench_dispatch(args):
+    """对比分发器每个URL新建连接写入和连接池批量写入的吞吐量（需要本地 Redis）。
+    直接调用分发策略，不启动分发器后端，测量的是写入爬虫任务列表本身的速度"""
+    import redis
+    from dispatcher import RoundRobinDispatcher
+    host, port = REDIS_CONFIG['host'], REDIS_CONFIG['port']
+    redis_client = redis.Redis(host=host, port=port, db=args.db)
+    task_keys = [f'crawler:{i}:tasks' for i in range(args.crawlers)]
+    urls = [f'https://sc.chinaz.com/tupian/bench_{i}.html' for i in range(args.urls)]
+    redis_client.delete(*task_keys)
+
+    try:
+        # 原来的实现：每个URL新建连接、写入一个URL后关闭
+        start = time.time()
+        for i, url in enumerate(urls):
+            client = redis.Redis(host=host, port=port, db=args.db)
+            client.rpush(task_keys[i % args.crawlers], url)
+            client.close()
+        per_element = time.time() - start
+        redis_client.delete(*task_keys)
+
+        # 连接池 + 按爬虫缓存后批量写入
+        strategy = RoundRobinDispatcher(args.crawlers, 'crawler_tasks', host, port, args.db)
+        strategy.open()
+        start = time.time()
+        for url in urls:
+            strategy.dispatch((url, 0))
+        strategy.close()
+        batched = time.time() - start
+        dispatched = sum(redis_client.llen(key) for key in task_keys)
+    finally:
+        redis_client.delete(*task_keys)
+
+    print(f"\nURL数: {args.urls}, 爬虫数: {args.crawlers}")
+    print(f"{'每个URL新建连接':<12} 耗时 {per_element:.2f}s, {args.urls / per_element:9.0f} 个URL/秒")
+    print(f"{'连接池批量写入':<12} 耗时 {batched:.2f}s, {args.urls / batched:9.0f} 个URL/秒（写入 {dispatched} 个）")
+
+
+def run_dispatcher_backend(backend, db):
+    """在子进程中创建并启动分发器，导入 pyflink 等开销都计入启动时间"""
+    from dispatcher import create_dispatcher
+    config = dict(REDIS_CONFIG, db=db)
+    create_dispatcher(config, backend).start_dispatch(crawler_count=1)
+
+
+def bench_startup(args):
+    """对比分发器各后端的冷启动时间：从启动分发进程到第一个URL进入爬虫任务列表（之后爬虫即可开始抓取）。
+    需要本地 Redis，flink 后端还需要 pyflink"""
+    import json
+    import redis
+    from frontier import Frontier
+    redis_client = redis.Redis(host=REDIS_CONFIG['host'], port=REDIS_CONFIG['port'], db=args.db,
+                               decode_responses=True)
+    frontier = Frontier(redis_client)
+    task_key = frontier.task_key(0)
+    keys = frontier.keys() + frontier.lease_keys() + [task_key, REDIS_KEYS['crawler_status']]
+
+    results = []
+    for backend in args.backends:
+        redis_client.delete(*keys)
+        frontier.push(['https://sc.chinaz.com/tupian/index.html'])
+        # 模拟正在运行的爬虫 0 的心跳，否则分发器会暂停分发
+        redis_client.hset(REDIS_KEYS['crawler_status'], 'crawler_0', json.dumps({'last_update': time.time() + args.timeout}))
+        start = time.time()
+        process = Process(target=run_dispatcher_backend, args=(backend, args.db), daemon=True)
+        process.start()
+        elapsed = None
+        while time.time() - start < args.timeout and process.is_alive():
+            if redis_client.llen(task_key):
+                elapsed = time.time() - start
+                break
+            time.sleep(0.01)
+        process.terminate()
+        process.join()
+        results.append((backend, elapsed))
+    redis_client.delete(*keys)
+
+    print()
+    for backend, elapsed in results:
+        if elapsed is None:
+            print(f"{backend:<8} 未能在 {args.timeout}s 内分发第一个URL（后端启动失败或超时）")
+        else:
+            print(f"{backend:<8} 从启动到分发第一个URL: {elapsed:.2f}s")
+
+
+def bench_affinity(args):
+    """模拟轮询分发和主机亲和分发，对比连接复用率和同一主机相邻请求的间隔。
+    假设每个爬虫按顺序处理自己的任务列表，每个请求耗时 --service 秒，不考虑限速器的等待"""
+    import random
+    from urllib.parse import urlparse
+    from hash_ring import HashRing
+    random.seed(0)
+    hosts = [f'img{i}.chinaz.net' for i in range(args.hosts)]
+    weights = [1 / (i + 1) for i in range(args.hosts)]  # 少数主机占大部分URL
+    urls = [f'https://{host}/files/{i}.jpg' for i, host in enumerate(random.choices(hosts, weights, k=args.urls))]
+
+    nodes = [f'crawler_{i}' for i in range(args.crawlers)]
+    ring = HashRing(nodes, DISPATCHER_CONFIG['affinity_replicas'])
+    strategies = {
+        '轮询分发': lambda i, host: i % args.crawlers,
+        '主机亲和分发': lambda i, host: int(ring.get_node(host).rsplit('_', 1)[1]),
+    }
+    min_gap = 1 / RATE_LIMIT_CONFIG['default']['rate']
+
+    print(f"\nURL数: {args.urls}, 主机数: {args.hosts}, 爬虫数: {args.crawlers}, 每个请求耗时 {args.service}s")
+    for name, select in strategies.items():
+        positions = [0] * args.crawlers
+        pools = set()  # (爬虫, 主机)，每一对至少新建一个连接
+        times = {}  # 主机 -> 请求时间
+        for i, url in enumerate(urls):
+            host = urlparse(url).netloc
+            crawler_id = select(i, host)
+            pools.add((crawler_id, host))
+            times.setdefault(host, []).append(positions[crawler_id] * args.service)
+            positions[crawler_id] += 1
+        gaps = [b - a for requests in times.values() for a, b in zip(sorted(requests), sorted(requests)[1:])]
+        reuse = 1 - len(pools) / len(urls)
+        close = sum(1 for gap in gaps if gap < min_gap - 1e-9) / len(gaps) if gaps else 0  # 忽略浮点误差
+        average = sum(gaps) / len(gaps) if gaps else 0
+        print(f"{name:<8} 连接复用率 {reuse * 100:5.1f}%, 同一主机相邻请求平均间隔 {average:.3f}s, "
+              f"间隔小于 {min_gap:.2f}s 的比例 {close * 100:5.1f}%")
+
+    before = {host: ring.get_node(host) for host in hosts}
+    ring.remove_node(nodes[-1])
+    moved = sum(1 for host in hosts if ring.get_node(host) != before[host])
+    print(f"减少一个爬虫时 {moved / len(hosts) * 100:.1f}% 的主机换到其他爬虫（理想值 {100 / args.crawlers:.1f}%）")
+
+
+def sample_listing_page(items=40):
+    """与站长之家图片列表页结构相近的页面：懒加载图片、占位图、导航和页脚中的小图标"""
+    icons = ''.join(f'<li><a href="/tupian/c{i}.html"><img src="//static.chinaz.com/icons/{i}.png" alt="分类{i}"></a></li>'
+                    for i in range(30))
+    cards = ''.join(
+        f'<div class="item"><a href="/tupian/{i}.htm" target="_blank">'
+        f'<img class="lazy" src="//static.chinaz.com/common/img-loding.png" '
+        f'data-original="//scpic.chinaz.net/files/default/imgs/2023-05-10/{i:08x}_s.jpg" alt="老虎图片{i}"></a>'
+        f'<p><a href="/tupian/{i}.htm">老虎图片{i}</a></p><div class="info"><span>4000x3000</span></div></div>'
+        for i in range(items)
+    )
+    return (f'<html><head><title>老虎图片</title></head><body><div class="nav"><ul>{icons}</ul></div>'
+            f'<div class="tupian-list">{cards}</div><div class="footer">{"<p>站长素材</p>" * 50}</div></body></html>')
+
+
+def legacy_parse_html(html_content, base_url):
+    """原来的解析实现：依次执行 6 个 XPath 表达式并打印每个图片元素的属性，作为对比的基准"""
+    from lxml import etree
+    from url_canonicalizer import canonicalize
+    tree = etree.HTML(html_content)
+    image_patterns = [
+        '//img[@class="lazy"]',
+        '//div[contains(@class, "tupian-list")]//img',
+        '//div[contains(@class, "item")]//img',
+        '//img[contains(@data-original, ".jpg") or contains(@data-original, ".png")]',
+        '//img[contains(@src, ".jpg") or contains(@src, ".png")]',
+        '//img'
+    ]
+    image_data = []
+    seen_urls = set()
+    for pattern in image_patterns:
+        images = tree.xpath(pattern)
+        print(f"找到 {len(images)} 个图片元素")
+        for img in images:
+            for attr in img.attrib:
+                print(f"{attr}: {img.get(attr)}")
+            image_url = img.get('data-original', '') or img.get('src', '')
+            if image_url and image_url not in seen_urls:
+                seen_urls.add(image_url)
+                if 'img-loding.png' in image_url:
+                    continue
+                image_url = canonicalize(image_url, base_url)
+                if image_url:
+                    print(f"找到图片: {image_url}")
+                    image_data.append({'title': img.get('alt', ''), 'image_url': image_url, 'description': ''})
+    return image_data
+
+
+def bench_parse(args):
+    """对比原来的解析实现和单次遍历的解析实现，单进程每秒解析的页面数。打印输出重定向到空设备"""
+    from data_parser import DataParser
+    if args.pages_dir:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages_dir, '*.html'))):
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                pages.append(f.read())
+        if not pages:
+            print(f"{args.pages_dir} 中没有 .html 文件")
+            return
+    else:
+        pages = [sample_listing_page()]
+    base_url = 'https://sc.chinaz.com/tupian/laohutupian.html'
+    parser = DataParser(None)
+    parsers = (('原实现(6个XPath)', legacy_parse_html), ('单次遍历', parser.parse_html))
+
+    results = []
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        for name, parse in parsers:
+            with contextlib.redirect_stdout(devnull):
+                found = len(parse(pages[0], base_url))
+                start = time.time()
+                for _ in range(args.rounds):
+                    for page in pages:
+                        parse(page, base_url)
+                elapsed = time.time() - start
+            results.append((name, found, elapsed))
+
+    count = args.rounds * len(pages)
+    print(f"\n页面数: {len(pages)}, 平均大小: {sum(map(len, pages)) // len(pages) // 1024}KB, 轮数: {args.rounds}")
+    for name, found, elapsed in results:
+        print(f"{name:<12} 第一页图片数 {found:3d}, {count / elapsed:8.1f} 页/秒（单核）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='爬虫系统性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fetch_parser = subparsers.add_parser('fetch', help='对比进程模型和异步模型的抓取吞吐量')
+    fetch_parser.add_argument('--pages', type=int, default=300)
+    fetch_parser.add_argument('--images', type=int, default=300)
+    fetch_parser.add_argument('--latency', type=float, default=0.05, help='模拟服务每个响应的延迟（秒）')
+    fetch_parser.add_argument('--image-size', type=int, default=200 * 1024)
+    fetch_parser.add_argument('--processes', type=int, default=CRAWLER_CONFIG['max_workers'])
+    fetch_parser.add_argument('--max-in-flight', type=int, default=CRAWLER_CONFIG['max_in_flight'])
+    fetch_parser.add_argument('--port', type=int, default=18080)
+    fetch_parser.set_defaults(func=bench_fetch)
+
+    seen_parser = subparsers.add_parser('seen', help='对比精确集合和布隆过滤器的内存占用和吞吐量')
+    seen_parser.add_argument('--urls', type=int, default=1000000, help='写入的URL数量')
+    seen_parser.add_argument('--checks', type=int, default=100000, help='查询的新URL数量，用于测量误判率')
+    seen_parser.add_argument('--batch', type=int, default=1000)
+    seen_parser.add_argument('--capacity', type=int, default=SEEN_CONFIG['capacity'])
+    seen_parser.add_argument('--error-rate', type=float, default=SEEN_CONFIG['error_rate'])
+    seen_parser.set_defaults(func=bench_seen)
+
+    dispatch_parser = subparsers.add_parser('dispatch', help='对比分发器逐个写入和批量写入的吞吐量')
+    dispatch_parser.add_argument('--urls', type=int, default=20000)
+    dispatch_parser.add_argument('--crawlers', type=int, default=3)
+    dispatch_parser.add_argument('--db', type=int, default=15, help='测试使用的 Redis 数据库，避免影响爬虫的任务列表')
+    dispatch_parser.set_defaults(func=bench_dispatch)
+
+    startup_parser = subparsers.add_parser('startup', help='对比分发器各后端从启动到分发第一个URL的时间')
+    startup_parser.add_argument('--backends', nargs='+', default=['asyncio', 'flink'])
+    startup_parser.add_argument('--timeout', type=float, default=120)
+    startup_parser.add_argument('--db', type=int, default=15, help='测试使用的 Redis 数据库')
+    startup_parser.set_defaults(func=bench_startup)
+
+    parse_parser = subparsers.add_parser('parse', help='对比原来的解析实现和单次遍历的解析实现每秒解析的页面数')
+    parse_parser.add_argument('--pages-dir', help='保存的列表页目录（*.html），不指定时使用模拟的列表页')
+    parse_parser.add_argument('--rounds', type=int, default=200)
+    parse_parser.set_defaults(func=bench_parse)
+
+    affinity_parser = subparsers.add_parser('affinity', help='模拟对比轮询分发和主机亲和分发的连接复用和请求间隔')
+    affinity_parser.add_argument('--urls', type=int, default=20000)
+    affinity_parser.add_argument('--hosts', type=int, default=200)
+    affinity_parser.add_argument('--crawlers', type=int, default=3)
+    affinity_parser.add_argument('--service', type=float, default=0.2, help='每个请求的耗时（秒）')
+    affinity_parser.set_defaults(func=bench_affinity)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
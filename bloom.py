@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# 已处理URL集合：Redis 位图上的可扩展布隆过滤器，以及迁移期间与精确集合并存的 SeenSet
+
+import hashlib
+from config import REDIS_KEYS, SEEN_CONFIG
+from url_canonicalizer import canonicalize
+
+# 布隆过滤器的查询和添加脚本。过滤器由多层位图组成，每层的位数 m、哈希函数个数 k、容量 cap 和已添加数量 count
+# 保存在 meta 哈希表中。一层写满后新建一层，容量按 growth 倍增长，误判率按 tightening 倍收紧，
+# 总误判率不超过 error_rate。每个元素由 Python 端算出两个 32 位哈希值，第 j 个位置为 (h1 + j * h2) % m。
+# ARGV[6] 为 1 时只查询不添加。返回每个元素是否可能已存在（1 存在，0 不存在）
+BLOOM_SCRIPT = """
+local meta = KEYS[1]
+local prefix = ARGV[1]
+local capacity = tonumber(ARGV[2])
+local error_rate = tonumber(ARGV[3])
+local growth = tonumber(ARGV[4])
+local tightening = tonumber(ARGV[5])
+local check_only = ARGV[6] == '1'
+local layers = tonumber(redis.call('HGET', meta, 'layers') or '0')
+local info = {}
+for i = 0, layers - 1 do
+    local v = redis.call('HMGET', meta, 'm:' .. i, 'k:' .. i, 'cap:' .. i, 'count:' .. i)
+    info[i] = {m = tonumber(v[1]), k = tonumber(v[2]), cap = tonumber(v[3]), count = tonumber(v[4])}
+end
+
+local function add_layer()
+    local i = layers
+    local cap = capacity * growth ^ i
+    local p = error_rate * (1 - tightening) * tightening ^ i
+    local m = math.ceil(-cap * math.log(p) / (math.log(2) ^ 2))
+    local k = math.ceil(m / cap * math.log(2))
+    redis.call('HSET', meta, 'm:' .. i, m, 'k:' .. i, k, 'cap:' .. i, cap, 'count:' .. i, 0, 'layers', i + 1)
+    info[i] = {m = m, k = k, cap = cap, count = 0}
+    layers = i + 1
+end
+
+local function contains(i, h1, h2)
+    local layer = info[i]
+    for j = 0, layer.k - 1 do
+        if redis.call('GETBIT', prefix .. ':' .. i, (h1 + j * h2) % layer.m) == 0 then
+            return false
+        end
+    end
+    return true
+end
+
+local result = {}
+for n = 7, #ARGV, 2 do
+    local h1 = tonumber(ARGV[n])
+    local h2 = tonumber(ARGV[n + 1])
+    local found = 0
+    for i = layers - 1, 0, -1 do
+        if contains(i, h1, h2) then
+            found = 1
+            break
+        end
+    end
+    if found == 0 and not check_only then
+        if layers == 0 or info[layers - 1].count >= info[layers - 1].cap then
+            add_layer()
+        end
+        local i = layers - 1
+        local layer = info[i]
+        for j = 0, layer.k - 1 do
+            redis.call('SETBIT', prefix .. ':' .. i, (h1 + j * h2) % layer.m, 1)
+        end
+        layer.count = layer.count + 1
+        redis.call('HINCRBY', meta, 'count:' .. i, 1)
+    end
+    result[#result + 1] = found
+end
+return result
+"""
+
+
+class ScalableBloomFilter:
+    """保存在 Redis 位图中的可扩展布隆过滤器。只会误判为已存在，不会漏判"""
+
+    batch_size = 1000  # 每次执行脚本时的最大元素数量
+
+    def __init__(self, redis_client, key, capacity=None, error_rate=None):
+        """初始化布隆过滤器。key 为位图的前缀，第 i 层保存在 {key}:{i}，各层参数保存在 {key}:meta"""
+        self.redis_client = redis_client
+        self.key = key
+        self.meta_key = f'{key}:meta'
+        self.capacity = capacity or SEEN_CONFIG['capacity']
+        self.error_rate = error_rate or SEEN_CONFIG['error_rate']
+        self.script = redis_client.register_script(BLOOM_SCRIPT)
+
+    def hashes(self, item):
+        """元素的两个 32 位哈希值，h2 为奇数，保证各个位置不重合"""
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest[:4], 'big'), int.from_bytes(digest[4:], 'big') | 1
+
+    def run(self, items, check_only, client=None):
+        """分批执行脚本，返回每个元素是否可能已存在。client 为管道时返回 None，结果由管道返回"""
+        results = []
+        for i in range(0, len(items), self.batch_size):
+            args = [self.key, self.capacity, self.error_rate, SEEN_CONFIG['growth'],
+                    SEEN_CONFIG['tightening'], 1 if check_only else 0]
+            for item in items[i:i + self.batch_size]:
+                args.extend(self.hashes(item))
+            found = self.script(keys=[self.meta_key], args=args, client=client or self.redis_client)
+            if client is None:
+                results.extend(bool(flag) for flag in found)
+        return results if client is None else None
+
+    def add(self, items, client=None):
+        """批量添加，返回每个元素在添加前是否可能已存在"""
+        return self.run(list(items), False, client)
+
+    def contains_many(self, items):
+        """批量查询，返回每个元素是否可能已存在"""
+        return self.run(list(items), True)
+
+    def count(self):
+        """已添加的元素数量"""
+        meta = self.redis_client.hgetall(self.meta_key)
+        return sum(int(value) for field, value in meta.items() if field.startswith('count:'))
+
+    def memory_usage(self):
+        """所有位图和参数占用的内存（字节）"""
+        layers = int(self.redis_client.hget(self.meta_key, 'layers') or 0)
+        keys = [self.meta_key] + [f'{self.key}:{i}' for i in range(layers)]
+        return sum(self.redis_client.memory_usage(key) or 0 for key in keys)
+
+
+class SeenSet:
+    """已处理URL集合，按 SEEN_CONFIG['mode'] 选择存储方式：
+    set 只使用原来的精确集合；dual 同时写入精确集合和布隆过滤器，查询仍以精确集合为准，用于迁移；
+    bloom 只使用布隆过滤器，内存占用与URL长度无关，但有 error_rate 的概率把新URL误判为已处理。
+    """
+
+    def __init__(self, redis_client, key, mode=None):
+        """初始化URL集合。key 为 REDIS_KEYS 中精确集合的名称，如 success_urls"""
+        self.redis_client = redis_client
+        self.set_key = REDIS_KEYS[key]
+        self.mode = mode or SEEN_CONFIG['mode']
+        self.bloom = ScalableBloomFilter(redis_client, f"{REDIS_KEYS['seen_prefix']}:{key}")
+
+    def add(self, urls, client=None):
+        """添加URL。client 可以是管道，与调用方的其他命令一起发送"""
+        urls = [canonicalize(url) or url for url in urls]
+        if not urls:
+            return
+        client = client or self.redis_client
+        if self.mode != 'bloom':
+            client.sadd(self.set_key, *urls)
+        if self.mode != 'set':
+            self.bloom.add(urls, client)
+
+    def contains_many(self, urls):
+        """批量查询URL是否已处理"""
+        urls = [canonicalize(url) or url for url in urls]
+        if not urls:
+            return []
+        if self.mode == 'bloom':
+            return self.bloom.contains_many(urls)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for url in urls:
+            pipe.sismember(self.set_key, url)
+        return [bool(found) for found in pipe.execute()]
+
+    def contains(self, url):
+        """查询单个URL是否已处理"""
+        return self.contains_many([url])[0]
+
+    def count(self):
+        """已处理URL数量。bloom 模式下为布隆过滤器记录的添加次数"""
+        if self.mode == 'bloom':
+            return self.bloom.count()
+        return self.redis_client.scard(self.set_key)
+
+    def backfill(self, batch_size=1000):
+        """把精确集合中已有的URL写入布隆过滤器，切换到 bloom 模式之前执行一次，返回URL数量"""
+        total = 0
+        batch = []
+        for url in self.redis_client.sscan_iter(self.set_key, count=batch_size):
+            batch.append(canonicalize(url) or url)  # 旧数据中的URL可能没有规范化
+            if len(batch) >= batch_size:
+                self.bloom.add(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.bloom.add(batch)
+            total += len(batch)
+        return total
+
+
+if __name__ == '__main__':
+    import redis
+    from config import REDIS_CONFIG
+    redis_client = redis.Redis(**REDIS_CONFIG)
+    for name in ('success_urls', 'failed_urls'):
+        count = SeenSet(redis_client, name).backfill()
+        print(f"{name}: 已写入布隆过滤器 {count} 个URL")
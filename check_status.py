@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 import os
 from storage import Storage
-from config import CRAWLER_CONFIG
 
 def main():
     storage = Storage()
@@ -14,18 +13,18 @@ def main():
     for key, value in stats.items():
         print(f"- {key}: {value}")
     
-    # 2. 查看下载目录中的文件
-    print("\n下载目录中的文件:")
-    download_path = CRAWLER_CONFIG['download_path']
+    # 2. 查看图片清单中的图片（图片按内容摘要保存，名称记录在清单中）
+    print("\n已下载的图片:")
+    images = storage.get_downloaded_images()
     total_files = 0
     animal_names = ['老虎', '马', '狗', '猫']
     
     for animal in animal_names:
         count = 0
         print(f"\n{animal}类图片:")
-        for filename in os.listdir(download_path):
-            if animal in filename:
-                print(f"- {filename}")
+        for name, path in images:
+            if animal in name:
+                print(f"- {name} ({os.path.basename(path)})")
                 count += 1
                 total_files += 1
         if count == 0:
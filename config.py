@@ -19,16 +19,39 @@ REDIS_CONFIG = {
     'decode_responses': True  # 自动解码响应为字符串
 }
 
+# 待抓取队列的分片。为空时所有数据都保存在 REDIS_CONFIG 中；配置多个 Redis 后，待抓取队列按主机名一致性哈希分布到各个分片，
+# 其余数据（已处理集合、重试队列、爬虫任务列表等）仍保存在 REDIS_CONFIG 中。调整分片后执行 python frontier.py rebalance
+REDIS_SHARDS = [
+    # {'host': 'localhost', 'port': 6380, 'db': 0},
+    # {'host': 'localhost', 'port': 6381, 'db': 0},
+]
+
 # Redis 键名配置
 REDIS_KEYS = {
     'seed_urls': 'seed_urls',  # 种子 URL
     'pending_urls': 'pending_urls',  # 待抓取 URL
+    'pending_depth': 'pending_urls:depth',  # 待抓取 URL 的深度
+    'pending_hosts': 'pending_urls:hosts',  # 每个主机排队的待抓取 URL 数量，用于主机间的公平性
+    'inflight_urls': 'inflight_urls',  # 已取出、尚未处理完的 URL（有序集合，分数为租约到期时间）
+    'inflight_depth': 'inflight_urls:depth',  # 在途 URL 的深度，租约到期放回队列时使用
+    'task_depth': 'crawler_tasks:depth',  # 已分发到爬虫任务列表、尚未被取走的 URL 的深度
+    'pending_notify': 'pending_urls:notify',  # 有新的待抓取 URL 时的通知列表，用于唤醒阻塞等待的分发器
     'failed_urls': 'failed_urls',  # 爬取失败的 URL
     'success_urls': 'success_urls',  # 爬取成功的 URL
     'crawler_status': 'crawler_status',  # 爬虫的运行状态
+    'crawler_stats': 'crawler_stats',  # 所有爬虫的累计计数
     'parsed_data': 'parsed_data',  # 解析后的数据
     'image_titles': 'image_titles',  # 图片标题等信息
-    'crawler_tasks_prefix': 'crawler_tasks'  # 爬虫任务的 Redis key 前缀
+    'image_manifest': 'image_manifest',  # 图片清单：URL -> 内容摘要、标题、ETag
+    'image_etags': 'image_etags',  # (URL, ETag) -> 内容摘要，用于跳过已保存的图片
+    'page_validators': 'page_validators',  # 页面校验信息：URL -> ETag、Last-Modified、内容摘要
+    'crawler_tasks_prefix': 'crawler_tasks',  # 爬虫任务的 Redis key 前缀
+    'rate_limit_prefix': 'rate_limit',  # 每个主机令牌桶的 Redis key 前缀
+    'proxy_pool': 'proxy_pool',  # 运行时的代理列表（集合），非空时替换 PROXY_POOL
+    'retry_schedule': 'retry_schedule',  # 等待重试的 URL（有序集合，分数为下次尝试的时间）
+    'retry_meta': 'retry_meta',  # URL 的重试次数和最后的错误
+    'dns_cache': 'dns_cache',  # 共享的 DNS 解析结果：主机 -> IP 列表和过期时间
+    'seen_prefix': 'seen',  # 已处理 URL 布隆过滤器的 Redis key 前缀
 }
 
 # 爬虫配置
@@ -36,7 +59,68 @@ CRAWLER_CONFIG = {
     'max_workers': 3,  # 最大并发进程数
     'timeout': 10,  # 请求超时设置
     'max_retries': 3,  # 最大重试次数
-    'download_path': DOWNLOAD_DIR  # 爬取数据保存路径
+    'download_path': DOWNLOAD_DIR,  # 爬取数据保存路径
+    'worker_mode': 'process',  # 爬虫工作模式：process 每个进程同时只处理一个请求，async 每个进程用 asyncio 并发处理多个请求
+    'max_in_flight': 200,  # async 模式下每个爬虫进程同时在途的最大请求数（页面和图片共用）
+    'fetch_mode': 'blocking',  # 获取任务的方式：blocking 无任务时阻塞等待，polling 每秒轮询一次
+    'block_timeout': 5,  # blocking 模式下每次阻塞等待的最长秒数
+}
+
+# 待抓取队列的优先级配置。分数以秒为单位，分数越小越先出队：
+# 分数 = 发现时间 + 类型偏移 + 深度 * depth_weight + 该主机已排队的 URL 数量 * host_weight
+FRONTIER_CONFIG = {
+    'type_offset': {'page': 0, 'image': 30},  # 页面先于同时发现的图片出队，图片最多让出 30 秒
+    'depth_weight': 10,  # 每深一层推迟 10 秒，优先展开浅层的列表页
+    'host_weight': 0.5,  # 同一主机每多排队一个 URL 推迟 0.5 秒，避免单个主机占满队列
+    'ring_replicas': 160,  # 一致性哈希环上每个分片的虚拟节点数量
+    'reliable': True,  # 取出的 URL 记录租约，爬虫处理完后确认；爬虫被终止时，租约到期后 URL 放回队列
+    'lease_timeout': 300,  # 租约时长（秒），应大于处理一个 URL 的最长时间
+    'reap_interval': 10,  # 租约回收进程的检查间隔（秒）
+    'reap_batch': 500,  # 每次回收的最大 URL 数量
+    # 自己的任务列表和共享队列都为空时，从其他爬虫的任务列表取走一批 URL。
+    # DISPATCHER_CONFIG['strategy'] 为 affinity 时只从心跳已过期的爬虫取走，保持同一主机由同一个爬虫处理
+    'work_stealing': True,
+    'steal_batch': 20,  # 每次最多取走的 URL 数量（不超过对方任务列表的一半）
+    'steal_min': 2,  # 对方任务列表至少有这么多 URL 时才取
+}
+
+# 爬虫心跳配置。状态变化和计数先在内存中合并，每隔 interval 秒批量写入 Redis 一次
+HEARTBEAT_CONFIG = {
+    'interval': 2,  # 心跳写入间隔（秒）
+}
+
+# HTTP 连接池配置，页面请求和图片下载共用
+HTTP_POOL_CONFIG = {
+    'pool_maxsize': 10,  # 每个主机（及代理）的连接池最多保留的连接数
+    'keep_alive': True,  # 是否使用长连接
+    'idle_timeout': 60,  # 连接池空闲超过该秒数后关闭
+    'max_pools': 100,  # 每个爬虫进程最多同时保留的连接池数量
+}
+
+# DNS 缓存配置。解析结果按记录的 TTL 缓存在进程内和 Redis 中，预解析进程提前解析待爬取队列中的主机
+DNS_CACHE_CONFIG = {
+    'enabled': True,
+    'timeout': 2,  # 单次解析的超时时间（秒），超时后回退到系统解析
+    'min_ttl': 30,  # 缓存时间下限（秒），避免 TTL 很短的记录频繁解析
+    'max_ttl': 3600,  # 缓存时间上限（秒）
+    'negative_ttl': 60,  # 解析失败的主机缓存时间（秒），期间不再解析，请求直接失败
+    'prefetch_interval': 5,  # 预解析进程检查待爬取队列的间隔（秒）
+    'prefetch_margin': 30,  # 缓存剩余时间少于该值时提前重新解析（秒）
+}
+
+# 图片存储配置
+IMAGE_STORE_CONFIG = {
+    'chunk_size': 64 * 1024,  # 流式下载的块大小（字节），每个下载占用的内存不超过该值
+}
+
+# 按主机限速配置。所有爬虫进程共享同一个令牌桶，rate 为每秒请求数，burst 为允许的突发请求数
+RATE_LIMIT_CONFIG = {
+    'enabled': True,
+    'default': {'rate': 5, 'burst': 5},  # 未单独配置的主机
+    'domains': {  # 按域名配置，子域名未单独配置时使用上级域名的配置
+        'sc.chinaz.com': {'rate': 5, 'burst': 5},
+        'chinaz.net': {'rate': 20, 'burst': 20},  # 图片服务器
+    },
 }
 
 # 可供爬虫使用的代理 IP 池配置
@@ -46,6 +130,113 @@ PROXY_POOL = [
     'http://120.220.220.95:8085',
 ]
 
+# 失败重试配置。失败的 URL 按指数退避放入重试队列，爬虫不在原地等待重试，最多尝试 CRAWLER_CONFIG['max_retries'] 次
+RETRY_CONFIG = {
+    'base_delay': 5,  # 第一次重试前的等待时间（秒），之后每次翻倍
+    'max_delay': 600,  # 最长等待时间（秒）
+    'jitter': 0.5,  # 随机抖动比例，实际等待时间在 [1 - jitter, 1] 倍之间
+    'max_uncharged': 20,  # 不计入重试次数的失败（如代理都不可用）最多重试多少次，之后标记为失败
+    'retry_statuses': [429, 500, 502, 503, 504],  # 需要重试的响应状态码，其余错误状态码直接标记为失败
+    'promote_interval': 1,  # 重试调度进程检查到期 URL 的间隔（秒）
+    'promote_batch': 500,  # 每次最多放回待爬取队列的 URL 数量
+}
+
+# URL 规范化配置。所有 URL 在放入待爬取队列和去重检查之前统一格式：
+# 协议和主机名小写，去掉默认端口、. 和 .. 路径段、#片段和跟踪参数，查询参数按名称排序。
+# 只做不改变 URL 含义的变换：路径中重复的斜杠和没有值的查询参数（?flag）保持原样
+CANONICAL_CONFIG = {
+    'drop_params': ['utm_*', 'spm', 'fbclid', 'gclid', 'bd_vid'],  # 去掉的查询参数，* 表示前缀匹配
+    'sort_query': True,
+    'sites': {  # 按域名配置，子域名未单独配置时使用上级域名的规则
+        # scheme: 统一使用的协议；drop_query: 去掉全部查询参数；keep_params: 只保留的参数；drop_params: 额外去掉的参数；
+        # merge_slashes: 合并路径中重复的斜杠（只用于确认 // 与 / 等价的站点）
+        'sc.chinaz.com': {'scheme': 'https', 'drop_params': ['from']},  # 站内的 from 是来源标记，翻页不使用该参数
+        'chinaz.net': {'scheme': 'https', 'drop_query': True},  # 图片服务器，查询参数不影响图片内容
+    },
+}
+
+# 图片提取规则。解析页面时一次遍历所有 img 元素，按 attributes 的顺序取第一个可用的地址，srcset 取其中最大的图片；
+# 地址包含 skip 中任一字符串的（如加载中的占位图）不使用，继续尝试下一个属性
+PARSER_RULES = {
+    'default': {
+        'attributes': ['data-original', 'data-src', 'src', 'srcset'],
+        'title_attributes': ['alt', 'title'],
+        'skip': ['img-loding.png', 'data:'],
+    },
+    'sites': {  # 按域名配置，子域名未单独配置时使用上级域名的规则，未配置的项使用 default
+        'sc.chinaz.com': {'attributes': ['data-original', 'src', 'srcset']},  # 懒加载图片的真实地址在 data-original
+    },
+}
+
+# 已处理 URL 集合（success_urls、failed_urls）的存储方式
+# set: 只使用精确集合；dual: 同时写入精确集合和布隆过滤器，查询以精确集合为准；bloom: 只使用布隆过滤器
+# 迁移步骤：设为 dual 运行，执行 python bloom.py 把已有 URL 写入布隆过滤器，再切换为 bloom，确认无误后删除精确集合
+SEEN_CONFIG = {
+    'mode': 'dual',
+    'capacity': 1000000,  # 第一层的容量，写满后新建一层
+    'error_rate': 0.001,  # 总误判率（把新 URL 误判为已处理的概率）
+    'growth': 2,  # 每一层的容量是上一层的倍数
+    'tightening': 0.5,  # 每一层的误判率是上一层的倍数，保证总误判率不超过 error_rate
+}
+
+# 代理管理配置
+PROXY_CONFIG = {
+    'connect_timeout': 3,  # 通过代理连接的超时时间（秒），死代理很快就会失败
+    'failure_threshold': 3,  # 连续失败多少次后熔断
+    'open_timeout': 60,  # 熔断后多少秒放行一个试探请求
+    'latency_alpha': 0.3,  # 延迟移动平均的权重
+    'initial_latency': 1.0,  # 新代理的初始延迟估计（秒）
+    # 视为代理故障的响应状态码。502/503/504 多数来自目标网站，按 RETRY_CONFIG 退避重试，不计为代理故障
+    'failure_statuses': [407],
+    'refresh_interval': 30,  # 从 Redis 更新代理列表的间隔（秒）
+    'allow_direct': True,  # 没有可用代理或代理都失败时是否直接连接
+    'proxy_attempts': 3,  # 代理出错时在同一次请求中最多换几个代理，代理的失败不计入 URL 的重试次数
+}
+
+# 列表页 URL 生成配置。每个模板按关键词和页码生成 URL，{keyword} 和 {page} 为占位符
+URL_GENERATOR_CONFIG = {
+    'templates': [
+        {
+            'first_page': 'https://sc.chinaz.com/tupian/{keyword}.html',  # 第一页的 URL 格式与其他页不同
+            'page': 'https://sc.chinaz.com/tupian/{keyword}_{page}.html',
+            'pages': [1, 2],  # 页码范围（包含两端）
+            'keywords': [  # 动物关键词列表（使用拼音，站长之家的 URL 格式）
+                'xiaogouxiaomaotupian',  # 小狗小猫图片
+                'laohutupian',  # 老虎图片
+                'madetupian',  # 马的图片
+            ],
+            'keywords_file': None,  # 关键词文件，每行一个，与 keywords 合并
+        },
+    ],
+    'discover_last_page': False,  # 是否请求第一页，从分页链接中找出实际的最后一页，代替 pages 的结束页码
+    'max_pages': 500,  # 自动发现最后一页时每个关键词最多生成的页数
+    'timeout': 10,  # 请求第一页的超时时间（秒）
+    'batch_size': 5000,  # 每批检查和写入的 URL 数量
+}
+
+# URL 分发器配置
+DISPATCHER_CONFIG = {
+    'backend': 'flink',  # 运行分发的后端：flink 使用 PyFlink（需要启动 JVM），asyncio 为纯 Python 实现，启动快、占用内存少
+    'strategy': 'roundrobin',  # 分发策略：roundrobin 轮询、random 随机、shortest 预计等待时间最短的爬虫、affinity 按主机固定爬虫
+    'batch_size': 100,  # 每个节拍从待爬取队列取出的最大 URL 数量
+    'max_backlog': 200,  # 每个爬虫任务列表的积压上限，超过时暂停分发，剩余 URL 留在优先级队列中
+    'idle_sleep': 0.5,  # 待爬取队列为空或积压过多时等待的秒数
+    'flush_size': 100,  # 缓存的 URL 达到此数量时批量写入爬虫任务列表
+    'flush_interval': 0.2,  # 距上次写入超过此秒数时写入，URL 较少时也不会积压在缓存中
+    'pool_size': 4,  # 每个分发算子的 Redis 连接池大小
+    'report_interval': 10,  # 打印分发速度的间隔（秒）
+    'load_refresh': 1,  # shortest 策略重新读取任务列表长度和心跳的间隔（秒）
+    'stale_after': 10,  # 心跳超过此秒数未更新的爬虫视为停止，不再分发
+    'min_rate': 0.5,  # 估计等待时间时爬虫处理速度的下限（个/秒），避免刚启动的爬虫速度为 0
+    'affinity_replicas': 160,  # affinity 策略中每个爬虫在哈希环上的虚拟节点数
+}
+
+# 种子 URL 导入配置
+SEED_IMPORT_CONFIG = {
+    'batch_size': 5000,  # 每次用管道写入 Redis 的 URL 数量
+    'progress_interval': 100000,  # 每读取多少个 URL 打印一次进度
+}
+
 # 种子 URL
 SEED_URLS = [
     'https://sc.chinaz.com/tupian/dongwutupian.html',
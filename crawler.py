@@ -6,164 +6,364 @@ import time
 import os
 from fake_useragent import UserAgent
 from multiprocessing import Process
-from config import REDIS_CONFIG, REDIS_KEYS, CRAWLER_CONFIG, PROXY_POOL
-import random
-import json
+from config import REDIS_CONFIG, REDIS_KEYS, CRAWLER_CONFIG, PROXY_CONFIG, RETRY_CONFIG, DNS_CACHE_CONFIG
 from data_parser import DataParser
+from dns_cache import DNSCache
+from http_pool import HTTPSessionPool
+from image_store import ImageStore
+from rate_limiter import HostRateLimiter
+from frontier import Frontier, is_image_url
+from heartbeat import Heartbeat
+from page_cache import PageCache
+from proxy_manager import ProxyManager, ProxyUnavailable
+from retry_queue import RetryQueue
 from urllib.parse import urljoin
 import re
 
 
+# 代理本身的故障：连不上代理或通过代理建立连接超时。这类失败换一个代理重试，不计入URL的重试次数
+PROXY_ERRORS = (requests.exceptions.ProxyError, requests.exceptions.ConnectTimeout)
+
+
 class Crawler:
     def __init__(self, parse_queue):
         """初始化爬虫"""
         self.running = True
         self.base_url = 'https://sc.chinaz.com/'
         self.parse_queue = parse_queue  # 使用传入的共享队列
+        self.http_pool = HTTPSessionPool()  # 页面请求和图片下载共用的连接池
+        self.rate_limiter = None  # 按主机限速，在工作进程中连接 Redis 后创建
+        self.heartbeat = None  # 爬虫心跳，在工作进程中连接 Redis 后创建
+        self.proxy_manager = ProxyManager()  # 按成功率和延迟选择代理，在工作进程中连接 Redis 后可运行时更新代理列表
+        self.page_cache = None  # 页面校验信息缓存，在工作进程中连接 Redis 后创建
+        self.retry_queue = None  # 延迟重试队列，在工作进程中连接 Redis 后创建
+        self.dns_cache = None  # 共享的DNS缓存，在工作进程中连接 Redis 后创建
+        self.frontier = None  # 待爬取队列，在工作进程中连接 Redis 后创建
 
         # 确保下载目录存在
         print(f"下载目录: {CRAWLER_CONFIG['download_path']}")
         if not os.path.exists(CRAWLER_CONFIG['download_path']):
             os.makedirs(CRAWLER_CONFIG['download_path'])
             print(f"创建下载目录: {CRAWLER_CONFIG['download_path']}")
+        self.image_store = ImageStore()  # 按内容摘要去重保存图片，在工作进程中连接 Redis 后记录清单
+
+    def is_image_url(self, url):
+        """判断URL是否为图片链接"""
+        return is_image_url(url)
 
-    def download_image(self, url, crawler_id):
-        """下载图片。先保存到redis，再保存到本地"""
+    def is_image_task(self, url, redis_client):
+        """判断任务是否为图片。解析器从 img 元素中提取的URL都记录了标题，与扩展名无关（如 .webp）；
+        没有记录的URL（如种子URL）按扩展名判断"""
+        if self.is_image_url(url):
+            return True
         try:
-            response = requests.get(url, timeout=CRAWLER_CONFIG['timeout'])
-            if response.status_code == 200:  # 200代表请求成功
-                # 从URL中提取文件名
-                filename = url.split('/')[-1]
-
-                # 获取图片的标题作为文件名
-                redis_client = redis.Redis(**REDIS_CONFIG)  # 创建一个redis客户端实例并连接redis
-                title = redis_client.hget(REDIS_KEYS['image_titles'], url)  # 从redis哈希表中获取url对应的图片标题。redis里的URL是之前分发来的
-                if title:  # 去除非法字符，增加扩展名
-                    # 清理文件名中的非法字符
-                    title = re.sub(r'[\\/:*?"<>|]', '', title)
-                    extension = filename.split('.')[-1] if '.' in filename else 'jpg'
-                    filename = f"{title}.{extension}"
-
-                if not filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                    filename += '.jpg'
-
-                # 构建保存路径
-                save_path = os.path.join(CRAWLER_CONFIG['download_path'], filename)
-
-                # 保存图片
-                with open(save_path, 'wb') as f:
-                    f.write(response.content)
-                print(f"爬虫 {crawler_id} 成功下载图片: {filename}")
-                return True
+            return bool(redis_client.hexists(REDIS_KEYS['image_titles'], url))
+        except Exception as e:
+            print(f"查询图片记录失败 {url}: {str(e)}")
+            return False
+
+    def build_headers(self, ua):
+        """构造请求页面时使用的请求头"""
+        return {
+            'User-Agent': ua.random,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            # 告诉服务器客户端可以接受的响应类型
+            'Accept-Language': 'zh-CN,zh;q=0.8,en-US;q=0.5,en;q=0.3',
+            'Referer': self.base_url
+        }
+
+    def get_image_title(self, url, redis_client):
+        """从redis哈希表中获取url对应的图片标题。redis里的URL是之前分发来的"""
+        try:
+            return redis_client.hget(REDIS_KEYS['image_titles'], url)
+        except Exception as e:
+            print(f"获取图片标题失败 {url}: {str(e)}")
+            return None
+
+    def build_image_filename(self, url, title=None):
+        """根据图片标题生成文件名，没有标题时使用URL中的文件名"""
+        # 从URL中提取文件名
+        filename = url.split('/')[-1]
+
+        if title:  # 去除非法字符，增加扩展名
+            # 清理文件名中的非法字符
+            title = re.sub(r'[\\/:*?"<>|]', '', title)
+            extension = filename.split('.')[-1] if '.' in filename else 'jpg'
+            filename = f"{title}.{extension}"
+
+        if not filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')):
+            filename += '.jpg'
+        return filename
+
+    def download_image(self, url, crawler_id, title=None):
+        """流式下载图片，按内容摘要去重保存。已保存过的图片直接跳过，中断的下载会在下次用 Range 请求续传。
+        返回 (是否成功, 响应状态码)，没有收到响应（网络错误）时状态码为 None"""
+        status = None
+        try:
+            known = self.image_store.lookup(url)
+            if known:
+                self.image_store.skip_known(known)
+                print(f"爬虫 {crawler_id} 图片已保存过，跳过下载: {url}")
+                return True, status
+
+            name = self.build_image_filename(url, title)
+            self.wait_for_rate_limit(url)
+            with self.http_pool.get(
+                url,
+                headers=self.image_store.range_headers(url),
+                stream=True,  # 分块读取响应体，避免整张图片读入内存
+                timeout=CRAWLER_CONFIG['timeout']
+            ) as response:
+                status = response.status_code
+                etag = response.headers.get('ETag')
+                if self.image_store.reuse_by_etag(url, status, response.headers, title, name):
+                    print(f"爬虫 {crawler_id} ETag 对应的图片已保存过，跳过下载: {url}")
+                    return True, status
+                download = self.image_store.open_for_response(url, status, response.headers)
+                if download is None:
+                    print(f"下载图片失败 {url}: 状态码 {status}")
+                    return False, status
+                with download:
+                    for chunk in response.iter_content(chunk_size=self.image_store.chunk_size):
+                        download.write(chunk)
+
+            if not self.image_store.is_complete(url, download):
+                print(f"图片下载不完整，等待续传: {url}")
+                return False, None
+            path = self.image_store.commit(url, download, title, name, etag)
+            print(f"爬虫 {crawler_id} 成功下载图片: {name} -> {path}")
+            return True, status
         except Exception as e:
             print(f"下载图片失败 {url}: {str(e)}")
-        return False
+        return False, None
+
+    def wait_for_rate_limit(self, url):
+        """等待URL所在主机的令牌"""
+        if self.rate_limiter:
+            self.rate_limiter.acquire(url)
+
+    def request_page(self, url, headers, proxy):
+        """请求页面，返回响应对象。代理连接失败或返回 failure_statuses（如407）时立即换一个代理重试，
+        换了 proxy_attempts 个代理仍失败时按 allow_direct 直接连接，否则抛出 ProxyUnavailable。
+        直接连接时的错误是URL本身的问题，由调用方计入重试次数"""
+        attempts = 0
+        while proxy:
+            attempts += 1
+            try:
+                response = self.send_request(url, headers, proxy)
+                if response.status_code not in PROXY_CONFIG['failure_statuses']:
+                    return response
+                response.close()
+                print(f"代理 {proxy.get('https')} 返回状态码 {response.status_code}，换一个代理")
+            except PROXY_ERRORS as e:
+                print(f"代理 {proxy.get('https')} 连接失败，换一个代理: {str(e)}")
+            if attempts >= PROXY_CONFIG['proxy_attempts']:
+                if not PROXY_CONFIG['allow_direct']:
+                    raise ProxyUnavailable(f"{attempts} 个代理都请求失败")
+                print(f"{attempts} 个代理都请求失败，直接连接: {url}")
+                break
+            proxy = self.get_proxy()
+        return self.send_request(url, headers, None)
+
+    def send_request(self, url, headers, proxy):
+        """通过指定代理（None 表示直接连接）请求一次页面，并向代理池报告代理的可用性和延迟"""
+        self.wait_for_rate_limit(url)
+        proxy_url = proxy.get('https') if proxy else None
+        # 使用代理时连接超时单独设置，死代理不会占用完整的请求超时
+        timeout = (PROXY_CONFIG['connect_timeout'], CRAWLER_CONFIG['timeout']) if proxy else CRAWLER_CONFIG['timeout']
+        start = time.time()
+        try:
+            response = self.http_pool.get(
+                url,
+                headers=headers,
+                proxies=proxy,
+                timeout=timeout
+            )
+        except Exception:
+            self.proxy_manager.report(proxy_url, False)
+            raise
+        self.proxy_manager.report(
+            proxy_url, response.status_code not in PROXY_CONFIG['failure_statuses'], time.time() - start)
+        return response
 
     def get_proxy(self):
-        """获取随机代理"""
-        return {'http': random.choice(PROXY_POOL)} if PROXY_POOL else None
+        """按得分从代理池中选择代理，http 和 https 都使用代理"""
+        return self.proxy_manager.get_proxies()
+
+    def get_pool_stats(self):
+        """获取连接池命中统计"""
+        return self.http_pool.get_stats()
 
-    def update_status(self, crawler_id, status, redis_client):
+    def get_heartbeat_stats(self):
+        """随心跳一起上报的附加信息"""
+        return {
+            'http_pool': self.get_pool_stats(),
+            'proxies': self.proxy_manager.get_scores(),
+            'dns': self.dns_cache.get_stats() if self.dns_cache else {}
+        }
+
+    def start_dns_cache(self, redis_client):
+        """创建共享的DNS缓存，之后新建的连接使用缓存的解析结果"""
+        if DNS_CACHE_CONFIG['enabled']:
+            self.dns_cache = DNSCache(redis_client, on_stat=self.heartbeat.incr)
+            self.http_pool.dns_cache = self.dns_cache
+
+    def start_heartbeat(self, crawler_id, redis_client):
+        """启动心跳，状态和计数在内存中合并后定时写入 Redis"""
+        self.heartbeat = Heartbeat(redis_client, crawler_id, stats_provider=self.get_heartbeat_stats)
+        self.heartbeat.start()
+
+    def update_status(self, status):
         """更新爬虫状态"""
+        self.heartbeat.set_status(status)
+
+    def next_task(self, frontier, crawler_id):
+        """获取下一个任务 (URL, 深度)。blocking 模式下没有任务时阻塞等待，新任务到达后立即返回"""
+        if CRAWLER_CONFIG['fetch_mode'] == 'blocking':
+            return frontier.wait_task(crawler_id, CRAWLER_CONFIG['block_timeout'])
+        return frontier.pop_task(crawler_id)
+
+    def fail_url(self, url, error, kind, retriable=True, charge=True, depth=0):
+        """处理失败的URL：可以重试的放入延迟重试队列，到期后按原深度放回，否则标记为失败。charge 为 False 时不计入重试次数"""
+        if retriable and self.retry_queue.schedule(url, error, charge, depth):
+            self.heartbeat.incr(f'{kind}_retried')
+        else:
+            self.retry_queue.give_up(url, error)
+            self.heartbeat.incr(f'{kind}_failed')
+
+    def is_retriable_image_failure(self, status):
+        """图片下载失败后是否重试。网络错误、下载不完整和续传失败（206、416，临时文件已丢弃）稍后重试，
+        其余状态码与页面一样按 retry_statuses 判断，如404直接标记为失败"""
+        return status is None or status in (206, 416) or status in RETRY_CONFIG['retry_statuses']
+
+    def image_error(self, status):
+        """图片下载失败时记录的错误信息"""
+        return f"图片下载失败: HTTP {status}" if status else "图片下载失败"
+
+    def crawl_image(self, url, crawler_id, redis_client, depth=0):
+        """下载图片"""
+        print(f"爬虫 {crawler_id} 检测到图片URL，开始下载...")
+        self.update_status("downloading")
+        title = self.get_image_title(url, redis_client)
+        success, status = self.download_image(url, crawler_id, title)
+        if success:
+            self.retry_queue.mark_success(url)
+            self.heartbeat.incr('images_downloaded')
+        else:
+            self.fail_url(url, self.image_error(status), 'images', self.is_retriable_image_failure(status), depth=depth)
+
+    def crawl_page(self, url, crawler_id, ua, depth=0):
+        """请求页面并交给解析器。失败时放入延迟重试队列，不在当前进程中等待重试"""
+        # 带上条件请求头，页面没有变化时服务器返回 304
+        headers = self.build_headers(ua)
+        cached = self.page_cache.get(url)
+        headers.update(self.page_cache.conditional_headers(cached))
+
+        print(f"爬虫 {crawler_id} 使用headers: {headers}")
+
         try:
-            redis_client.hset(
-                REDIS_KEYS['crawler_status'],
-                f'crawler_{crawler_id}',
-                json.dumps({  # 将要存储的信息转化为JSON字符串
-                    'status': status,
-                    'last_update': time.time()
-                })
-            )
+            proxy = self.get_proxy()
+            if proxy:
+                print(f"爬虫 {crawler_id} 使用代理: {proxy}")
+            print(f"爬虫 {crawler_id} 请求 {url}")
+            self.update_status("requesting")
+            response = self.request_page(url, headers, proxy)
+        except ProxyUnavailable as e:  # 代理的问题，稍后重试，不计入URL的重试次数
+            self.update_status("request fail")
+            print(f"爬虫 {crawler_id} 请求失败: {str(e)}")
+            self.fail_url(url, str(e), 'pages', charge=False, depth=depth)
+            return
+        except Exception as e:
+            self.update_status("request fail")
+            print(f"爬虫 {crawler_id} 请求失败: {str(e)}")
+            self.fail_url(url, str(e), 'pages', depth=depth)
+            return
+
+        print(f"爬虫 {crawler_id} 获得响应状态码: {response.status_code}")
+
+        if response.status_code == 304:  # 页面没有变化，不需要再次解析
+            self.update_status("request success")
+            print(f"爬虫 {crawler_id} 页面未修改，跳过解析: {url}")
+            self.retry_queue.mark_success(url)
+            self.heartbeat.incr('pages_not_modified')
+            return
+
+        if response.status_code != 200:
+            self.update_status("request fail")
+            # 限流和服务器错误稍后重试，其余状态码（如404）直接标记为失败
+            self.fail_url(url, f"HTTP {response.status_code}", 'pages',
+                          retriable=response.status_code in RETRY_CONFIG['retry_statuses'], depth=depth)
+            return
+
+        self.update_status("request success")
+        # 设置正确的编码
+        response.encoding = 'utf-8'
+        print(f"爬虫 {crawler_id} 成功获取页面内容，长度: {len(response.text)}")
+        body_hash = self.page_cache.body_hash(response.text)
+        if self.page_cache.is_unchanged(cached, body_hash):  # 服务器不支持条件请求时按内容判断
+            print(f"爬虫 {crawler_id} 页面内容未变化，跳过解析: {url}")
+            self.retry_queue.mark_success(url)
+            self.heartbeat.incr('pages_unchanged')
+            return
+        print("正在发送数据到解析器...")
+        try:
+            data_to_parse = {
+                'url': url,
+                'content': response.text,
+                'crawler_id': crawler_id,
+                'depth': depth,  # 解析出的URL深度加一
+                'validators': self.page_cache.validators(response.headers, body_hash)  # 解析完成后由解析器保存
+            }
+            self.parse_queue.put(data_to_parse)  # 爬取到的非图片内容传入共享队列
+            print(f"数据已发送到解析器队列，队列大小: {self.parse_queue.qsize()}")
+            self.retry_queue.mark_success(url)
+            self.heartbeat.incr('pages_fetched')
         except Exception as e:
-            print(f"更新爬虫状态失败: {str(e)}")
+            print(f"发送数据到解析器失败: {str(e)}")
+            import traceback
+            print(traceback.format_exc())
 
     def crawler_worker(self, crawler_id):
         """爬虫工作进程"""
         try:
             redis_client = redis.Redis(**REDIS_CONFIG)  # 创建一个redis client并连接
+            self.rate_limiter = HostRateLimiter(redis_client)
+            self.proxy_manager = ProxyManager(redis_client=redis_client)
+            self.page_cache = PageCache(redis_client)
+            self.retry_queue = RetryQueue(redis_client)
+            self.frontier = Frontier(redis_client, crawler_id)
+            self.start_heartbeat(crawler_id, redis_client)
+            self.start_dns_cache(redis_client)
+            self.image_store = ImageStore(redis_client=redis_client, on_stat=self.heartbeat.incr)
             ua = UserAgent()  # 生成一个随机的用户代理，模拟不同的浏览器或设备
 
             print(f"爬虫 {crawler_id} 开始工作")
 
             while self.running:
                 try:
-                    # 先从爬虫自己的任务队列中获取URL
-                    url = redis_client.lpop(f'crawler:{crawler_id}:tasks')
-                    if not url:  # 自己的队列中没有URL，则从pending_urls中获取URL
-                        url = redis_client.spop(REDIS_KEYS['pending_urls'])  # spop从集合中随机删除一个元素并返回
+                    # 先从爬虫自己的任务队列中获取URL，再从pending_urls中获取URL
+                    task = self.next_task(self.frontier, crawler_id)
 
-                    if not url:
+                    if not task:
                         print(f"爬虫 {crawler_id} 等待任务...")
-                        self.update_status(crawler_id, "waiting", redis_client)
-                        time.sleep(1)
+                        self.update_status("waiting")
+                        if CRAWLER_CONFIG['fetch_mode'] != 'blocking':
+                            time.sleep(1)
                         continue
 
+                    url, depth = task
                     print(f"爬虫 {crawler_id} 获取到URL: {url}")
 
-                    # 检查是否是图片URL
-                    if any(url.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.gif']):
-                        print(f"爬虫 {crawler_id} 检测到图片URL，开始下载...")
-                        self.update_status(crawler_id, "downloading", redis_client)
-                        if self.download_image(url, crawler_id):
-                            redis_client.sadd(REDIS_KEYS['success_urls'], url)
-                        continue
-
-                    # 如果不是图片URL，则爬取页面内容
-                    headers = {
-                        'User-Agent': ua.random,
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                        # 告诉服务器客户端可以接受的响应类型
-                        'Accept-Language': 'zh-CN,zh;q=0.8,en-US;q=0.5,en;q=0.3',
-                        'Referer': self.base_url
-                    }
-
-                    print(f"爬虫 {crawler_id} 使用headers: {headers}")
-
-                    proxy = self.get_proxy()
-                    if proxy:
-                        print(f"爬虫 {crawler_id} 使用代理: {proxy}")
-
-                    # 尝试请求
-                    for retry in range(CRAWLER_CONFIG['max_retries']):
-                        try:
-                            print(f"爬虫 {crawler_id} 第 {retry + 1} 次尝试请求 {url}")
-                            self.update_status(crawler_id, "requesting", redis_client)
-                            response = requests.get(
-                                url,
-                                headers=headers,
-                                proxies=proxy,
-                                timeout=CRAWLER_CONFIG['timeout']
-                            )
-
-                            print(f"爬虫 {crawler_id} 获得响应状态码: {response.status_code}")
-
-                            if response.status_code == 200:
-                                self.update_status(crawler_id, "request success", redis_client)
-                                # 设置正确的编码
-                                response.encoding = 'utf-8'
-                                print(f"爬虫 {crawler_id} 成功获取页面内容，长度: {len(response.text)}")
-                                print("正在发送数据到解析器...")
-                                try:
-                                    data_to_parse = {
-                                        'url': url,
-                                        'content': response.text,
-                                        'crawler_id': crawler_id
-                                    }
-                                    self.parse_queue.put(data_to_parse)  # 爬取到的非图片内容传入共享队列
-                                    print(f"数据已发送到解析器队列，队列大小: {self.parse_queue.qsize()}")
-                                    redis_client.sadd(REDIS_KEYS['success_urls'], url)
-                                except Exception as e:
-                                    print(f"发送数据到解析器失败: {str(e)}")
-                                    import traceback
-                                    print(traceback.format_exc())
-                                break
-
-                        except Exception as e:
-                            self.update_status(crawler_id, "request fail", redis_client)
-                            print(f"爬虫 {crawler_id} 请求失败: {str(e)}")
-                            if retry == CRAWLER_CONFIG['max_retries'] - 1:
-                                redis_client.sadd(REDIS_KEYS['failed_urls'], url)
-
+                    try:
+                        # 检查是否是图片URL，如果不是图片URL，则爬取页面内容
+                        if self.is_image_task(url, redis_client):
+                            self.crawl_image(url, crawler_id, redis_client, depth or 0)
+                        else:
+                            self.crawl_page(url, crawler_id, ua, depth or 0)
+                    finally:
+                        # 成功或失败都已记录（失败的URL在重试队列中），释放租约
+                        self.frontier.ack(url)
+                        self.heartbeat.incr('tasks_done')  # 分发器按处理速度估计任务列表的等待时间
 
                 except Exception as e:
                     print(f"爬虫 {crawler_id} 处理URL时发生错误: {str(e)}")
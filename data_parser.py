@@ -4,11 +4,50 @@ from lxml import etree
 import jieba
 import json
 import redis
-from config import REDIS_CONFIG, REDIS_KEYS
+from config import REDIS_CONFIG, REDIS_KEYS, PARSER_RULES
+from frontier import Frontier
+from page_cache import PageCache
+from url_canonicalizer import canonicalize, match_domain
+from urllib.parse import urlparse
 from multiprocessing import Process, Queue
 from queue import Empty
-from urllib.parse import urljoin
-import re
+
+
+def get_parser_rules(host):
+    """获取主机的图片提取规则，子域名未单独配置时使用上级域名的规则，未配置的项使用默认规则"""
+    rules = match_domain(host, PARSER_RULES['sites'])
+    if rules:
+        return {**PARSER_RULES['default'], **rules}
+    return PARSER_RULES['default']
+
+
+def pick_srcset(value):
+    """从 srcset 中选出宽度或像素密度最大的图片地址"""
+    best, best_size = None, -1
+    for candidate in value.split(','):
+        parts = candidate.split()
+        if not parts:
+            continue
+        size = 1.0  # 没有描述符时相当于 1x
+        if len(parts) > 1:
+            try:
+                size = float(parts[1][:-1])  # 去掉 w 或 x
+            except ValueError:
+                pass
+        if size > best_size:
+            best, best_size = parts[0], size
+    return best
+
+
+def pick_image_url(img, rules):
+    """按规则中属性的顺序取 img 元素的第一个可用地址，没有时返回 None"""
+    for attr in rules['attributes']:
+        value = img.get(attr, '').strip()
+        if value and attr == 'srcset':
+            value = pick_srcset(value)
+        if value and not any(skip in value for skip in rules['skip']):
+            return value
+    return None
 
 
 class DataParser:
@@ -17,67 +56,38 @@ class DataParser:
         self.parse_queue = parse_queue  # 使用传入的共享队列
 
     def parse_html(self, html_content, base_url):
-        """解析HTML内容"""
+        """解析HTML内容。一次遍历页面中所有的 img 元素，按站点的 PARSER_RULES 选出图片地址"""
         try:
-            print("开始解析HTML内容...")
-
             # 确保内容是字符串类型
             if isinstance(html_content, bytes):  # 字节类型则需要解码
                 html_content = html_content.decode('utf-8')
 
             tree = etree.HTML(html_content)  # 将HTML内容解析为一个HTML树
+            if tree is None:
+                print("页面内容为空")
+                return []
 
-            # 打印页面内容预览
-            print("HTML内容预览:")
-            preview = html_content[:200].replace('\n', ' ').replace('\r', '')
-            print(preview)
-
-            # 尝试不同的xpath模式来查找图片
-            image_patterns = [
-                '//img[@class="lazy"]',  # 站长之家常用的懒加载图片类
-                '//div[contains(@class, "tupian-list")]//img',
-                '//div[contains(@class, "item")]//img',
-                '//img[contains(@data-original, ".jpg") or contains(@data-original, ".png")]',
-                '//img[contains(@src, ".jpg") or contains(@src, ".png")]',
-                '//img'
-            ]
-
+            rules = get_parser_rules(urlparse(base_url).hostname or '')
             image_data = []
             seen_urls = set()  # 用于去重
 
-            for pattern in image_patterns:
-                print(f"\n尝试图片模式: {pattern}")
-                images = tree.xpath(pattern)
-                print(f"找到 {len(images)} 个图片元素")
-
-                for img in images:  # img是一组tag
-                    # 打印图片元素的所有属性
-                    print("\n图片元素属性:")
-                    for attr in img.attrib:
-                        print(f"{attr}: {img.get(attr)}")
-
-                    # 优先使用 data-original 属性
-                    image_url = img.get('data-original', '') or img.get('src', '')
-
-                    if image_url and image_url not in seen_urls:
-                        seen_urls.add(image_url)
-                        # 跳过加载中的图片
-                        if 'img-loding.png' in image_url:
-                            continue
-
-                        image_info = {
-                            'title': img.get('alt', '').strip() or img.get('title', '').strip() or '未命名图片',
-                            'image_url': image_url,
-                            'description': ''
-                        }
-
-                        # 确保图片URL是完整的
-                        if not image_info['image_url'].startswith(('http:', 'https:')):
-                            image_info['image_url'] = urljoin(base_url, image_info['image_url'])
-                        print(f"找到图片: {image_info['image_url']}")
-                        image_data.append(image_info)
-
-            print(f"\n成功解析 {len(image_data)} 个图片信息")
+            for img in tree.iter('img'):
+                image_url = pick_image_url(img, rules)
+                if not image_url:
+                    continue
+                # 补全相对地址和省略协议的地址，并统一URL格式
+                image_url = canonicalize(image_url, base_url)
+                if not image_url or image_url in seen_urls:
+                    continue
+                seen_urls.add(image_url)
+                titles = (img.get(attr, '').strip() for attr in rules['title_attributes'])
+                image_data.append({
+                    'title': next(filter(None, titles), '未命名图片'),
+                    'image_url': image_url,
+                    'description': ''
+                })
+
+            print(f"成功解析 {len(image_data)} 个图片信息")
             return image_data  # 返回得到的图片信息，每个元素都是一个image_info的字典
 
         except Exception as e:
@@ -95,13 +105,13 @@ class DataParser:
         cleaned_data = []
         for item in data:
             if item['image_url']:  # 确保有图片URL
-                # 清理URL
-                url = item['image_url'].strip()
-                # 确保是图片URL
-                if not re.search(r'\.(jpg|jpeg|png|gif)$', url, re.I):
-                    url += '.jpg'
+                # 清理URL。URL由 PARSER_RULES 从 img 元素中提取，都是图片，不按扩展名过滤（.webp 等也保留）
+                url = canonicalize(item['image_url'])
+                if not url:
+                    print(f"跳过无效URL: {item['image_url']}")
+                    continue
 
-                # 保存图片标题到Redis
+                # 保存图片标题到Redis，爬虫按是否有标题记录判断URL是否为图片
                 redis_client.hset(REDIS_KEYS['image_titles'], url, item['title'])
 
                 cleaned_item = {
@@ -118,6 +128,8 @@ class DataParser:
     def parse_worker(self):
         """解析工作进程"""
         redis_client = redis.Redis(**REDIS_CONFIG)
+        frontier = Frontier(redis_client)
+        page_cache = PageCache(redis_client)
         print("解析工作进程已启动，等待数据...")
 
         while True:
@@ -134,6 +146,8 @@ class DataParser:
                     url = data.get('url')
                     content = data.get('content')
                     crawler_id = data.get('crawler_id')
+                    depth = data.get('depth') or 0
+                    validators = data.get('validators')
 
                     if url == None or content == None or crawler_id==None or url == "" or content == "":
                         print(f"数据不完整: {data}")
@@ -152,11 +166,9 @@ class DataParser:
                         # 清洗数据
                         cleaned_data = self.clean_data(parsed_data)
                         if cleaned_data:
-                            # 将图片URL添加到待爬取队列
-                            for item in cleaned_data:
-                                print(f"处理图片: {item['image_url']}")
-                                redis_client.sadd(REDIS_KEYS['pending_urls'], item['image_url'])  # 向集合中添加元素
-                                print(f"添加图片URL到待爬取队列: {item['image_url']}")
+                            # 将图片URL批量添加到待爬取队列
+                            added = frontier.push([item['image_url'] for item in cleaned_data], depth + 1, image=True)
+                            print(f"添加 {added} 个图片URL到待爬取队列")
 
                             # 保存完整数据
                             redis_client.lpush(  # 向列表最左侧推送元素
@@ -167,6 +179,10 @@ class DataParser:
                     else:
                         print("没有解析到任何图片数据")
 
+                    # 解析出的URL已放入待爬取队列后才保存校验信息，解析失败的页面下次仍会重新解析
+                    if validators and parsed_data is not None:
+                        page_cache.update(url, validators)
+
                 except Empty:
                     continue  # 如果队列为空，继续等待
 
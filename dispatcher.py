@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+# URL 分发器：把待爬取队列中的URL持续分发到各爬虫的任务列表。分发策略与运行分发的后端分开，
+# asyncio 后端是纯 Python 实现；flink 后端在 url_dispatcher_flink.py 中，只有选择该后端时才导入 pyflink
+
+import asyncio
+import random
+import time
+from urllib.parse import urlparse
+import redis
+from config import DISPATCHER_CONFIG, REDIS_KEYS
+from frontier import Frontier
+from hash_ring import HashRing
+from heartbeat import read_heartbeats
+
+
+IDLE = ('', 0)  # 读取端没有取到URL时发出的信号，通知分发策略把缓存的URL写入任务列表
+
+
+class FrontierReader:
+    """从待爬取队列分批读取URL。取出的URL带有租约，写入爬虫任务列表时释放；分发器在URL写入任务列表之前被终止时，
+    租约到期后URL会被放回待爬取队列，读取端不需要记录读取位置"""
+
+    def __init__(self, redis_host, redis_port, redis_db, crawler_count):
+        self.redis_host = redis_host
+        self.redis_port = redis_port
+        self.redis_db = redis_db
+        self.crawler_count = crawler_count
+        self.redis_client = None
+        self.frontier = None
+
+    def open(self):
+        """连接 Redis"""
+        self.redis_client = redis.Redis(host=self.redis_host, port=self.redis_port, db=self.redis_db,
+                                        decode_responses=True)
+        self.frontier = Frontier(self.redis_client)
+
+    def close(self):
+        """关闭连接"""
+        if self.redis_client:
+            self.redis_client.close()
+
+    def backlog(self):
+        """所有爬虫任务列表中尚未取走的URL数量"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for crawler_id in range(self.crawler_count):
+            pipe.llen(self.frontier.task_key(crawler_id))
+        return sum(pipe.execute())
+
+    def read_batch(self):
+        """取出一批 (URL, 深度)，没有取到时等待后返回空列表。深度随URL一起交给分发策略，不依赖租约记录。
+        爬虫的任务列表积压过多或没有正在运行的爬虫时等待 idle_sleep 秒；
+        待爬取队列为空时阻塞等待通知令牌，最多 idle_sleep 秒，新URL入队后立即返回"""
+        if (self.backlog() >= self.crawler_count * DISPATCHER_CONFIG['max_backlog']
+                or not read_heartbeats(self.redis_client, self.crawler_count)):
+            time.sleep(DISPATCHER_CONFIG['idle_sleep'])
+            return []
+        entries = []
+        for _ in range(DISPATCHER_CONFIG['batch_size']):
+            entry = self.frontier.pop_entry()
+            if not entry:
+                break
+            entries.append(entry)
+        if not entries:
+            self.frontier.wait_pending(DISPATCHER_CONFIG['idle_sleep'])
+        return entries
+
+
+class BufferedDispatcher:
+    """分发策略的基类。启动时创建 Redis 连接池，URL按目标爬虫缓存，
+    缓存的数量或距上次写入的时间达到阈值时，用管道批量 RPUSH 到各爬虫的任务列表。子类实现 select_crawler"""
+
+    def __init__(self, crawler_count, crawler_tasks_key_prefix, redis_host, redis_port, redis_db):
+        self.crawler_count = crawler_count
+        self.crawler_tasks_key_prefix = crawler_tasks_key_prefix
+        self.redis_host = redis_host
+        self.redis_port = redis_port
+        self.redis_db = redis_db
+        self.redis_client = None
+        self.buffers = {}  # 爬虫索引 -> 待写入的 (URL, 深度) 列表
+        self.unassigned = []  # 没有可用爬虫、待放回待爬取队列的 (URL, 深度)
+
+    def open(self):
+        """启动时创建连接池"""
+        pool = redis.ConnectionPool(host=self.redis_host, port=self.redis_port, db=self.redis_db,
+                                    max_connections=DISPATCHER_CONFIG['pool_size'], decode_responses=True)
+        self.redis_client = redis.Redis(connection_pool=pool)
+        self.frontier = Frontier(self.redis_client)
+        self.buffers = {i: [] for i in range(self.crawler_count)}
+        self.unassigned = []
+        self.buffered = 0
+        self.dispatched = 0  # 上次报告之后分发的URL数量
+        self.last_flush = self.last_report = time.time()
+
+    def close(self):
+        """停止时写入剩余的URL并关闭连接池"""
+        if self.redis_client:
+            self.flush()
+            self.redis_client.connection_pool.disconnect()
+
+    def select_crawler(self, url):
+        """选择接收URL的爬虫索引，没有可用的爬虫时返回 None"""
+        raise NotImplementedError
+
+    def dispatch(self, entry):
+        """分发一个 (URL, 深度)。IDLE 是读取端空闲时发出的信号，只检查是否需要写入"""
+        url, depth = entry
+        if url:
+            crawler_id = self.select_crawler(url)
+            if crawler_id is None:
+                # 不分发，写入时连同深度放回待爬取队列，等有爬虫运行时再分发
+                print(f"分发器: 没有正在运行的爬虫，放回待爬取队列 {url}")
+                self.unassigned.append((url, depth))
+            else:
+                self.buffers[crawler_id].append((url, depth))
+            self.buffered += 1
+        if (self.buffered >= DISPATCHER_CONFIG['flush_size']
+                or time.time() - self.last_flush >= DISPATCHER_CONFIG['flush_interval']):
+            self.flush()
+
+    def flush(self):
+        """把缓存的URL批量写入各爬虫的任务列表，同时释放取出时记录的租约，并定时打印分发速度。
+        没有可用爬虫的URL放回待爬取队列。写入失败的URL仍持有租约，租约到期后回到待爬取队列"""
+        now = time.time()
+        if self.buffered:
+            try:
+                self.dispatched += self.frontier.hand_off(self.buffers)
+            except Exception as e:
+                print(f"分发URL失败: {str(e)}")
+            try:
+                if self.unassigned:
+                    self.frontier.requeue(self.unassigned)
+            except Exception as e:
+                print(f"放回待爬取队列失败: {str(e)}")
+            for entries in self.buffers.values():
+                entries.clear()
+            self.unassigned = []
+            self.buffered = 0
+        self.last_flush = now
+        if now - self.last_report >= DISPATCHER_CONFIG['report_interval']:
+            print(f"分发器: {self.dispatched / (now - self.last_report):.1f} 个URL/秒")
+            self.dispatched = 0
+            self.last_report = now
+
+
+class RoundRobinDispatcher(BufferedDispatcher):
+    """轮询分发"""
+
+    def open(self):
+        super().open()
+        self.current_crawler = 0  # 当前轮询到的爬虫索引
+
+    def select_crawler(self, url):
+        crawler_id = self.current_crawler
+        self.current_crawler = (self.current_crawler + 1) % self.crawler_count
+        return crawler_id
+
+
+class RandomDispatcher(BufferedDispatcher):
+    """随机分发"""
+
+    def select_crawler(self, url):
+        return random.randint(0, self.crawler_count - 1)
+
+
+class ShortestQueueDispatcher(BufferedDispatcher):
+    """负载感知分发：把URL交给预计等待时间最短的爬虫。预计等待时间 = 任务列表长度 / 最近的处理速度，
+    处理速度由心跳中 tasks_done 计数的变化得出。心跳过期的爬虫不再分配URL"""
+
+    def open(self):
+        super().open()
+        self.queue_lengths = {}  # 爬虫索引 -> 任务列表长度（加上之后分配的URL）
+        self.rates = {}  # 爬虫索引 -> 处理速度（个/秒）
+        self.done = {}  # 爬虫索引 -> (上次读取时的 tasks_done, 读取时间)
+        self.last_refresh = 0
+
+    def refresh(self):
+        """读取任务列表长度和心跳，更新各爬虫的负载"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for crawler_id in range(self.crawler_count):
+            pipe.llen(f'crawler:{crawler_id}:tasks')
+        lengths = pipe.execute()
+        heartbeats = read_heartbeats(self.redis_client, self.crawler_count)
+        now = time.time()
+        self.queue_lengths = {}
+        for crawler_id, data in heartbeats.items():
+            # 缓存中尚未写入的URL也算在任务列表中
+            self.queue_lengths[crawler_id] = lengths[crawler_id] + len(self.buffers[crawler_id])
+            done = data.get('counters', {}).get('tasks_done', 0)
+            last_done, last_time = self.done.get(crawler_id, (done, now))
+            if now > last_time:
+                rate = (done - last_done) / (now - last_time)
+                self.rates[crawler_id] = 0.5 * self.rates.get(crawler_id, rate) + 0.5 * rate  # 平滑速度的波动
+            self.done[crawler_id] = (done, now)
+        self.last_refresh = now
+
+    def select_crawler(self, url):
+        if time.time() - self.last_refresh >= DISPATCHER_CONFIG['load_refresh']:
+            self.refresh()
+        if not self.queue_lengths:
+            return None
+        crawler_id = min(self.queue_lengths, key=lambda i: (
+            self.queue_lengths[i] / max(self.rates.get(i, 0), DISPATCHER_CONFIG['min_rate']), self.queue_lengths[i]))
+        self.queue_lengths[crawler_id] += 1
+        return crawler_id
+
+
+class HostAffinityDispatcher(BufferedDispatcher):
+    """主机亲和分发：用一致性哈希把URL的主机映射到爬虫，同一主机的URL总是交给同一个爬虫，
+    复用该进程中的连接和DNS缓存，对同一主机的请求也不会被多个爬虫同时发出。
+    心跳过期的爬虫从哈希环中移除，只有它负责的主机换到其他爬虫，恢复后这些主机再换回来"""
+
+    def open(self):
+        super().open()
+        self.ring = HashRing(replicas=DISPATCHER_CONFIG['affinity_replicas'])  # 节点名称与心跳中的 crawler_{id} 相同
+        self.last_refresh = 0
+
+    def refresh(self):
+        """按心跳更新哈希环中的爬虫"""
+        live = {f'crawler_{crawler_id}' for crawler_id in read_heartbeats(self.redis_client, self.crawler_count)}
+        current = set(self.ring.nodes)
+        for node in live - current:
+            self.ring.add_node(node)
+        for node in current - live:
+            self.ring.remove_node(node)
+        if live != current:
+            print(f"分发器: 可用的爬虫变为 {sorted(live)}")
+        self.last_refresh = time.time()
+
+    def select_crawler(self, url):
+        if time.time() - self.last_refresh >= DISPATCHER_CONFIG['load_refresh']:
+            self.refresh()
+        node = self.ring.get_node(urlparse(url).netloc.lower())
+        return int(node.rsplit('_', 1)[1]) if node else None
+
+
+STRATEGIES = {
+    'roundrobin': RoundRobinDispatcher,
+    'random': RandomDispatcher,
+    'shortest': ShortestQueueDispatcher,
+    'affinity': HostAffinityDispatcher,
+}
+
+
+class URLDispatcher:
+    """分发器后端的基类。子类实现 run，持续从待爬取队列读取URL并交给分发策略"""
+
+    def __init__(self, redis_host, redis_port, redis_db, pending_urls_key, crawler_tasks_key_prefix):
+        self.redis_host = redis_host
+        self.redis_port = redis_port
+        self.redis_db = redis_db
+        self.pending_urls_key = pending_urls_key  # 待爬取 URL 的 Redis key
+        self.crawler_tasks_key_prefix = crawler_tasks_key_prefix  # 爬虫任务的 Redis key 前缀
+
+    def create_reader(self, crawler_count):
+        """创建待爬取队列的读取端"""
+        return FrontierReader(self.redis_host, self.redis_port, self.redis_db, crawler_count)
+
+    def create_strategy(self, crawler_count, dispatch_strategy):
+        """创建分发策略"""
+        if dispatch_strategy not in STRATEGIES:
+            raise ValueError(f"未知的分发策略: {dispatch_strategy}")
+        return STRATEGIES[dispatch_strategy](crawler_count, self.crawler_tasks_key_prefix, self.redis_host,
+                                             self.redis_port, self.redis_db)
+
+    def run(self, crawler_count, dispatch_strategy):
+        """运行分发，不会返回"""
+        raise NotImplementedError
+
+    def start_dispatch(self, crawler_count=3, dispatch_strategy=None):
+        """启动分发器。会一直运行，应在单独的进程中调用"""
+        dispatch_strategy = dispatch_strategy or DISPATCHER_CONFIG['strategy']
+        try:
+            print(f"启动 URL 分发器（{type(self).__name__}），爬虫数量: {crawler_count}，分发策略: {dispatch_strategy}")
+            self.run(crawler_count, dispatch_strategy)
+        except Exception as e:
+            print(f"启动分发器失败: {str(e)}")
+            raise
+
+
+class AsyncURLDispatcher(URLDispatcher):
+    """纯 Python 的 asyncio 后端，不需要启动 JVM。读取和写入 Redis 在线程中执行，
+    写入上一批URL的同时读取下一批，两者之间的有界队列在写入较慢时让读取端等待"""
+
+    async def read_loop(self, reader, queue):
+        """持续读取 (URL, 深度) 放入队列，空闲时放入 IDLE，让写入端写入缓存的URL"""
+        while True:
+            entries = await asyncio.to_thread(reader.read_batch)  # 没有取到时在线程中等待
+            if not entries:
+                await queue.put(IDLE)
+            for entry in entries:
+                await queue.put(entry)
+
+    async def dispatch_loop(self, strategy, queue):
+        """取出队列中已有的全部URL，在线程中交给分发策略"""
+        while True:
+            entries = [await queue.get()]
+            while not queue.empty():
+                entries.append(queue.get_nowait())
+            await asyncio.to_thread(lambda: [strategy.dispatch(entry) for entry in entries])
+
+    async def run_async(self, crawler_count, dispatch_strategy):
+        reader = self.create_reader(crawler_count)
+        strategy = self.create_strategy(crawler_count, dispatch_strategy)
+        reader.open()
+        strategy.open()
+        queue = asyncio.Queue(maxsize=DISPATCHER_CONFIG['batch_size'] * 2)
+        try:
+            await asyncio.gather(self.read_loop(reader, queue), self.dispatch_loop(strategy, queue))
+        finally:
+            strategy.close()
+            reader.close()
+
+    def run(self, crawler_count, dispatch_strategy):
+        try:
+            asyncio.run(self.run_async(crawler_count, dispatch_strategy))
+        except Exception as e:
+            print(f"URL 分发失败: {str(e)}")
+
+
+def create_dispatcher(redis_config, backend=None):
+    """按 DISPATCHER_CONFIG['backend'] 创建分发器"""
+    backend = backend or DISPATCHER_CONFIG['backend']
+    args = (redis_config['host'], redis_config['port'], redis_config['db'],
+            REDIS_KEYS['pending_urls'], REDIS_KEYS['crawler_tasks_prefix'])
+    if backend == 'flink':
+        from url_dispatcher_flink import URLDispatcherFlink  # 只有选择 flink 后端时才导入 pyflink 并启动 JVM
+        return URLDispatcherFlink(*args)
+    if backend == 'asyncio':
+        return AsyncURLDispatcher(*args)
+    raise ValueError(f"未知的分发器后端: {backend}")
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# DNS缓存：按记录的 TTL 缓存解析结果，爬虫进程之间通过 Redis 共享，待爬取队列中的主机提前解析
+
+import ipaddress
+import json
+import random
+import socket
+import time
+from urllib.parse import urlsplit
+import dns.resolver
+from config import REDIS_KEYS, DNS_CACHE_CONFIG
+
+
+class DNSCache:
+    """两级DNS缓存：进程内字典和 Redis 哈希表 dns_cache（主机 -> IP 列表和过期时间）。
+    缓存未命中时用 dnspython 解析 A 记录，过期时间取记录的 TTL，并限制在 [min_ttl, max_ttl] 之间。
+    解析失败时返回 None，由调用方回退到系统解析；失败结果以空 IP 列表缓存 negative_ttl 秒，
+    期间 get_ips 返回空列表，调用方直接按无法解析处理，不再每个请求都解析一次。
+    """
+
+    def __init__(self, redis_client=None, on_stat=None):
+        """初始化DNS缓存。on_stat(name, amount) 用于把计数累加到心跳中"""
+        self.redis_client = redis_client
+        self.on_stat = on_stat
+        self.local = {}  # 主机 -> {'ips': [...], 'expires': 过期时间}
+        self.resolver = dns.resolver.Resolver()
+        self.resolver.lifetime = DNS_CACHE_CONFIG['timeout']
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'failures': 0, 'resolve_ms': 0}
+
+    def incr(self, name, amount=1):
+        """累加计数"""
+        self.stats[name] += amount
+        if self.on_stat:
+            self.on_stat(f'dns_{name}', amount)
+
+    def normalize_host(self, host):
+        """主机名小写并去掉末尾的点。IP 地址和 localhost 不需要解析，返回 None"""
+        host = host.lower().rstrip('.')
+        if host == 'localhost':
+            return None
+        try:
+            ipaddress.ip_address(host.strip('[]'))
+            return None
+        except ValueError:
+            return host
+
+    def get_shared(self, host):
+        """从 Redis 读取其他进程的解析结果"""
+        if not self.redis_client:
+            return None
+        try:
+            entry = self.redis_client.hget(REDIS_KEYS['dns_cache'], host)
+            return json.loads(entry) if entry else None
+        except Exception as e:
+            print(f"读取DNS缓存失败 {host}: {str(e)}")
+            return None
+
+    def store(self, host, entry):
+        """写入两级缓存"""
+        self.local[host] = entry
+        if self.redis_client:
+            try:
+                self.redis_client.hset(REDIS_KEYS['dns_cache'], host, json.dumps(entry))
+            except Exception as e:
+                print(f"写入DNS缓存失败 {host}: {str(e)}")
+
+    def refresh(self, host):
+        """解析主机并写入两级缓存，失败时缓存空 IP 列表并返回 None"""
+        start = time.time()
+        try:
+            answers = self.resolver.resolve(host, 'A')
+        except Exception as e:
+            self.incr('failures')
+            print(f"DNS解析错误 ({host}): {str(e)}")
+            self.store(host, {'ips': [], 'expires': time.time() + DNS_CACHE_CONFIG['negative_ttl']})
+            return None
+        self.incr('resolve_ms', int((time.time() - start) * 1000))
+        ttl = min(max(answers.rrset.ttl, DNS_CACHE_CONFIG['min_ttl']), DNS_CACHE_CONFIG['max_ttl'])
+        entry = {'ips': [answer.address for answer in answers], 'expires': time.time() + ttl}
+        self.store(host, entry)
+        return entry
+
+    def get_ips(self, host, local_only=False):
+        """获取主机的 IP 列表。缓存中记录了解析失败时返回空列表；local_only 为 True 时只查进程内缓存，未命中返回 None 且不计数"""
+        host = self.normalize_host(host)
+        if not host:
+            return None
+        now = time.time()
+        entry = self.local.get(host)
+        if entry and entry['expires'] > now:
+            self.incr('local_hits')
+            return entry['ips']
+        if local_only:
+            return None
+        entry = self.get_shared(host)
+        if entry and entry['expires'] > now:
+            self.local[host] = entry
+            self.incr('shared_hits')
+            return entry['ips']
+        self.incr('misses')
+        entry = self.refresh(host)
+        return entry['ips'] if entry else None
+
+    def resolve(self, host):
+        """获取主机的一个 IP，多个 IP 时随机选择以分散连接，无法解析时返回 None。
+        缓存中记录了解析失败时抛出 socket.gaierror，不再回退到系统解析"""
+        ips = self.get_ips(host)
+        if ips == []:
+            raise socket.gaierror(socket.EAI_NONAME, f"无法解析主机 {host}（{DNS_CACHE_CONFIG['negative_ttl']} 秒内解析失败过）")
+        return random.choice(ips) if ips else None
+
+    def get_stats(self):
+        """命中率和平均解析耗时，供监控使用"""
+        hits = self.stats['local_hits'] + self.stats['shared_hits']
+        total = hits + self.stats['misses']
+        return {
+            'local_hits': self.stats['local_hits'],
+            'shared_hits': self.stats['shared_hits'],
+            'misses': self.stats['misses'],
+            'failures': self.stats['failures'],
+            'hit_rate': round(hits / total, 3) if total else 0,
+            'avg_resolve_ms': round(self.stats['resolve_ms'] / self.stats['misses'], 1) if self.stats['misses'] else 0,
+        }
+
+    def prefetch(self, hosts):
+        """提前解析缓存中没有或即将过期的主机，返回解析的主机数量。解析失败的主机在失败记录过期之前不再解析"""
+        now = time.time()
+        deadline = now + DNS_CACHE_CONFIG['prefetch_margin']
+        resolved = 0
+        for host in filter(None, map(self.normalize_host, hosts)):
+            entry = self.local.get(host) or self.get_shared(host)
+            if entry and entry['expires'] > (deadline if entry['ips'] else now):
+                continue
+            if self.refresh(host):
+                resolved += 1
+        return resolved
+
+    def prefetch_worker(self):
+        """DNS预解析进程，定时解析待爬取队列中有URL排队的主机"""
+        from frontier import Frontier
+        frontier = Frontier(self.redis_client)
+        print("DNS预解析进程已启动")
+        while True:
+            try:
+                # 待爬取队列记录了每个主机的排队数量，键为URL中的 host[:port]
+                netlocs = frontier.hosts()
+                hosts = {urlsplit(f'//{netloc}').hostname for netloc in netlocs} - {None}
+                resolved = self.prefetch(hosts)
+                if resolved:
+                    print(f"DNS预解析: 解析了 {resolved} 个主机")
+            except Exception as e:
+                print(f"DNS预解析出错: {str(e)}")
+            time.sleep(DNS_CACHE_CONFIG['prefetch_interval'])
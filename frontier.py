@@ -0,0 +1,561 @@
+# -*- coding: utf-8 -*-
+# 待爬取URL队列（frontier）。按优先级出队，统一URL的入队和出队，支持阻塞等待新任务，可按主机分片到多个 Redis
+
+import time
+from urllib.parse import urlparse
+import redis
+from config import REDIS_CONFIG, REDIS_KEYS, REDIS_SHARDS, FRONTIER_CONFIG, DISPATCHER_CONFIG
+from hash_ring import HashRing
+from heartbeat import read_heartbeats
+from url_canonicalizer import canonicalize_many
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+
+# 入队脚本。pending_urls 是有序集合，分数越小越先出队。
+# Python 端算好基础分数（发现时间 + 类型偏移 + 深度偏移），脚本中再按主机排队数量加上公平性偏移，
+# 同一主机排队的URL越多，新URL越靠后，各主机的URL交替出队。
+# 每新增一个URL就向通知列表推送一个令牌，唤醒阻塞等待的分发器。每取出一个URL同时删除一个令牌，
+# 令牌数量与待爬取URL数量保持一致，不会在队列已空时唤醒分发器。通知列表长度有上限，
+# URL 数量超过上限时分发器取完一批后会直接再取，不依赖令牌。
+PUSH_SCRIPT = """
+local cap = tonumber(ARGV[1])
+local host_weight = tonumber(ARGV[2])
+local added = 0
+for i = 3, #ARGV, 4 do
+    local url = ARGV[i]
+    if not redis.call('ZSCORE', KEYS[1], url) then
+        local backlog = redis.call('HINCRBY', KEYS[3], ARGV[i + 3], 1) - 1
+        redis.call('ZADD', KEYS[1], tonumber(ARGV[i + 1]) + backlog * host_weight, url)
+        redis.call('HSET', KEYS[2], url, ARGV[i + 2])
+        added = added + 1
+    end
+end
+if added > 0 then
+    for i = 1, math.min(added, cap) do
+        redis.call('LPUSH', KEYS[4], '1')
+    end
+    redis.call('LTRIM', KEYS[4], 0, cap - 1)
+end
+return added
+"""
+
+# 出队脚本。取出分数最小的URL，同时取出它的深度并减少所在主机的排队数量。
+# ARGV[1] 大于 0 时为租约到期时间，URL 同时放入在途有序集合，爬虫确认前进程被终止的话，到期后由回收进程放回队列。
+# ARGV[2] 为 1 时（通知列表在同一个 Redis 中）同时删除一个通知令牌
+POP_SCRIPT = """
+local item = redis.call('ZPOPMIN', KEYS[1])
+if #item == 0 then
+    return false
+end
+local url = item[1]
+local depth = redis.call('HGET', KEYS[2], url) or '0'
+redis.call('HDEL', KEYS[2], url)
+local host = string.lower(string.match(url, '^%a[%w+.-]*://([^/?#]+)') or '')
+if redis.call('HINCRBY', KEYS[3], host, -1) <= 0 then
+    redis.call('HDEL', KEYS[3], host)
+end
+if tonumber(ARGV[1]) > 0 then
+    redis.call('ZADD', KEYS[4], ARGV[1], url)
+    redis.call('HSET', KEYS[5], url, depth)
+end
+if ARGV[2] == '1' then
+    redis.call('LPOP', KEYS[6])
+end
+return {url, depth}
+"""
+
+# 从爬虫自己的任务列表出队，同时取出分发时记录的深度，ARGV[1] 大于 0 时同样记录租约
+LEASE_LPOP_SCRIPT = """
+local url = redis.call('LPOP', KEYS[1])
+if not url then
+    return false
+end
+local depth = redis.call('HGET', KEYS[4], url) or '0'
+redis.call('HDEL', KEYS[4], url)
+if tonumber(ARGV[1]) > 0 then
+    redis.call('ZADD', KEYS[2], ARGV[1], url)
+    redis.call('HSET', KEYS[3], url, depth)
+end
+return {url, depth}
+"""
+
+# 阻塞等待时用 BLMOVE 把URL从任务列表原子地移到爬虫的处理中列表，再由此脚本从处理中列表移入在途有序集合。
+# KEYS: 处理中列表、在途URL、在途深度、任务深度；ARGV[1] 为租约到期时间（0 表示不使用租约），ARGV[2] 为URL。
+# 回收进程可能已先把URL转为租约，此时深度从在途深度中读取
+CLAIM_SCRIPT = """
+redis.call('LREM', KEYS[1], 1, ARGV[2])
+local depth = redis.call('HGET', KEYS[4], ARGV[2]) or redis.call('HGET', KEYS[3], ARGV[2]) or '0'
+redis.call('HDEL', KEYS[4], ARGV[2])
+if tonumber(ARGV[1]) > 0 then
+    redis.call('ZADD', KEYS[2], ARGV[1], ARGV[2])
+    redis.call('HSET', KEYS[3], ARGV[2], depth)
+end
+return depth
+"""
+
+# 接管处理中列表。爬虫在 BLMOVE 之后、记录租约之前被终止时，URL留在处理中列表，
+# 回收进程把其中的URL转为租约（不缩短已有的租约），租约到期后放回待爬取队列。KEYS 与 CLAIM_SCRIPT 相同
+ADOPT_SCRIPT = """
+local urls = redis.call('LRANGE', KEYS[1], 0, -1)
+for _, url in ipairs(urls) do
+    local depth = redis.call('HGET', KEYS[4], url)
+    if depth then
+        redis.call('HDEL', KEYS[4], url)
+        redis.call('HSET', KEYS[3], url, depth)
+    end
+    redis.call('HSETNX', KEYS[3], url, '0')
+    redis.call('ZADD', KEYS[2], 'NX', ARGV[1], url)
+end
+redis.call('DEL', KEYS[1])
+return #urls
+"""
+
+# 分发脚本。把分发器取出的URL写入爬虫的任务列表，同时释放分发器取出时记录的租约，深度写入 task_depth。
+# 任务列表中的URL不持有租约，在列表中等待多久都不会被回收进程放回队列，爬虫取走时才记录租约。
+# KEYS[4] 起为任务列表，ARGV[1] 为 1 时URL持有租约，之后每三个参数为 (任务列表在 KEYS 中的序号, URL, 深度)。
+# 深度由分发器随URL一起传入，不使用租约时同样有效。租约已到期、URL已被放回待爬取队列的跳过，避免重复爬取
+HANDOFF_SCRIPT = """
+local moved = 0
+for i = 2, #ARGV, 3 do
+    local url = ARGV[i + 1]
+    if ARGV[1] == '0' or redis.call('ZREM', KEYS[1], url) == 1 then
+        redis.call('HDEL', KEYS[2], url)
+        redis.call('HSET', KEYS[3], url, ARGV[i + 2])
+        redis.call('RPUSH', KEYS[tonumber(ARGV[i])], url)
+        moved = moved + 1
+    end
+end
+return moved
+"""
+
+# 释放到期的租约。只有租约到期时间没有变化时才删除，回收期间被确认或重新租出的URL不受影响
+RELEASE_SCRIPT = """
+local released = 0
+for i = 1, #ARGV, 2 do
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if score and tonumber(score) == tonumber(ARGV[i + 1]) then
+        redis.call('ZREM', KEYS[1], ARGV[i])
+        redis.call('HDEL', KEYS[2], ARGV[i])
+        released = released + 1
+    end
+end
+return released
+"""
+
+# 删除脚本。分片调整后把URL移到新的分片时，从原分片删除URL并减少主机的排队数量
+REMOVE_SCRIPT = """
+local removed = 0
+for i = 1, #ARGV, 2 do
+    if redis.call('ZREM', KEYS[1], ARGV[i]) == 1 then
+        redis.call('HDEL', KEYS[2], ARGV[i])
+        if redis.call('HINCRBY', KEYS[3], ARGV[i + 1], -1) <= 0 then
+            redis.call('HDEL', KEYS[3], ARGV[i + 1])
+        end
+        removed = removed + 1
+    end
+end
+return removed
+"""
+
+# 任务窃取脚本。KEYS[1] 为空闲爬虫自己的任务列表，其余为其他爬虫的任务列表。
+# 找出最长的列表，长度不小于 ARGV[2] 时从队尾取走一半（最多 ARGV[1] 个）放到自己的列表，保持原来的先后顺序。
+# 队尾的URL是该爬虫最晚才会处理的，取走后不影响它接下来的任务。返回取走的数量
+STEAL_SCRIPT = """
+local victim, longest = nil, 0
+for i = 2, #KEYS do
+    local length = redis.call('LLEN', KEYS[i])
+    if length > longest then
+        victim, longest = KEYS[i], length
+    end
+end
+if not victim or longest < tonumber(ARGV[2]) then
+    return 0
+end
+local count = math.min(tonumber(ARGV[1]), math.ceil(longest / 2))
+for i = 1, count do
+    redis.call('LPUSH', KEYS[1], redis.call('RPOP', victim))
+end
+return count
+"""
+
+# 迁移脚本。旧版本的 pending_urls 是集合，启动时转换为有序集合
+MIGRATE_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'set' then
+    return 0
+end
+local urls = redis.call('SMEMBERS', KEYS[1])
+redis.call('DEL', KEYS[1])
+return urls
+"""
+
+
+def shard_name(config):
+    """分片名称，由地址组成，调整 REDIS_SHARDS 的顺序不影响URL所在的分片"""
+    return f"{config.get('host', 'localhost')}:{config.get('port', 6379)}/{config.get('db', 0)}"
+
+
+def is_image_url(url):
+    """判断URL是否为图片链接（按路径判断，忽略查询参数）"""
+    return urlparse(url).path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+class Frontier:
+    """待爬取URL队列，包括共享的 pending_urls 优先级队列和每个爬虫自己的任务列表。
+
+    配置 REDIS_SHARDS 后，pending_urls 及其深度、主机计数按主机名一致性哈希分布到各个分片，同一主机的URL总在同一个分片；
+    爬虫自己的任务列表和通知列表仍在主 Redis 中。每个爬虫从自己负责的分片开始依次取URL，各分片内按优先级出队。
+
+    优先级由 FRONTIER_CONFIG 配置，分数以秒为单位，可以理解为URL的“计划出队时间”：
+    发现时间越早越先出队；页面比同时发现的图片先出队，保证页面尽早展开出图片URL；
+    但图片等待超过 type_offset 秒后会排到新页面之前，避免图片一直得不到下载。
+    """
+
+    batch_size = 1000  # 每次执行入队脚本时的最大URL数量
+    notify_cap = 1024  # 通知列表的最大长度
+
+    def __init__(self, redis_client, crawler_id=None):
+        """初始化URL队列。redis_client 为主 Redis，crawler_id 决定爬虫优先取哪个分片"""
+        self.redis_client = redis_client
+        self.shards = {}  # 分片名称 -> Redis 客户端
+        if REDIS_SHARDS:
+            for config in REDIS_SHARDS:
+                self.shards[shard_name(config)] = redis.Redis(**{**REDIS_CONFIG, **config})
+        else:
+            self.shards[shard_name(REDIS_CONFIG)] = redis_client
+        self.ring = HashRing(self.shards, FRONTIER_CONFIG['ring_replicas'])
+        # 所有爬虫按相同顺序排列分片，第 crawler_id 个爬虫从第 crawler_id 个分片开始取，各分片的消费者数量大致相同
+        names = sorted(self.shards)
+        offset = int(crawler_id) % len(names) if crawler_id is not None else 0
+        self.pop_order = names[offset:] + names[:offset]
+        self.push_script = redis_client.register_script(PUSH_SCRIPT)
+        self.pop_script = redis_client.register_script(POP_SCRIPT)
+        self.lease_lpop_script = redis_client.register_script(LEASE_LPOP_SCRIPT)
+        self.handoff_script = redis_client.register_script(HANDOFF_SCRIPT)
+        self.claim_script = redis_client.register_script(CLAIM_SCRIPT)
+        self.adopt_script = redis_client.register_script(ADOPT_SCRIPT)
+        self.release_script = redis_client.register_script(RELEASE_SCRIPT)
+        self.remove_script = redis_client.register_script(REMOVE_SCRIPT)
+        self.steal_script = redis_client.register_script(STEAL_SCRIPT)
+
+    def shard_for(self, host):
+        """主机所在的分片名称"""
+        return self.ring.get_node(host)
+
+    def is_primary(self, name):
+        """分片是否就是主 Redis，此时入队脚本可以直接写入通知列表"""
+        return self.shards[name] is self.redis_client
+
+    def task_key(self, crawler_id):
+        """爬虫自己的任务列表"""
+        return f'crawler:{crawler_id}:tasks'
+
+    def processing_key(self, crawler_id):
+        """爬虫阻塞等待时取出、尚未记录租约的URL"""
+        return f'crawler:{crawler_id}:processing'
+
+    def task_keys(self):
+        """所有爬虫的任务列表"""
+        return list(self.redis_client.scan_iter(match=self.task_key('*'), count=1000))
+
+    def queued_count(self):
+        """已分发到爬虫任务列表、尚未被取走的URL数量"""
+        return sum(self.redis_client.llen(key) for key in self.task_keys())
+
+    def keys(self):
+        """优先级队列相关的键：有序集合、URL深度、各主机排队数量、通知列表"""
+        return [REDIS_KEYS['pending_urls'], REDIS_KEYS['pending_depth'],
+                REDIS_KEYS['pending_hosts'], REDIS_KEYS['pending_notify']]
+
+    def lease_keys(self):
+        """租约相关的键：在途URL有序集合（分数为租约到期时间）、在途URL的深度"""
+        return [REDIS_KEYS['inflight_urls'], REDIS_KEYS['inflight_depth']]
+
+    def lease_deadline(self):
+        """新租约的到期时间，不使用租约时为 0"""
+        if not FRONTIER_CONFIG['reliable']:
+            return 0
+        return time.time() + FRONTIER_CONFIG['lease_timeout']
+
+    def instances(self):
+        """保存租约的所有 Redis：各个分片和主 Redis"""
+        clients = list(self.shards.values())
+        if not any(client is self.redis_client for client in clients):
+            clients.append(self.redis_client)
+        return clients
+
+    def base_score(self, url, depth, now, image=None):
+        """不含主机公平性的基础分数。image 为 None 时按扩展名判断URL类型"""
+        url_type = 'image' if (is_image_url(url) if image is None else image) else 'page'
+        return now + FRONTIER_CONFIG['type_offset'][url_type] + depth * FRONTIER_CONFIG['depth_weight']
+
+    def push(self, urls, depth=0, image=None):
+        """批量添加待爬取URL，返回新增的URL数量。depth 为URL的深度，种子URL为0；
+        image 为 True 表示都是图片（如解析器从 img 元素中提取的URL），为 None 时按扩展名判断"""
+        now = time.time()
+        entries = []
+        for url in canonicalize_many(urls):  # 规范化，去掉无效值和重复值，保持顺序
+            host = urlparse(url).netloc.lower()
+            entries.append((url, self.base_score(url, depth, now, image), depth, host))
+        return self.push_entries(entries)
+
+    def push_entries(self, entries):
+        """按主机分片写入 (URL, 基础分数, 深度, 主机) 列表，返回新增的URL数量"""
+        by_shard = {}
+        for entry in entries:
+            by_shard.setdefault(self.shard_for(entry[3]), []).extend(entry)
+        added = remote_added = 0
+        step = self.batch_size * 4
+        for name, args in by_shard.items():
+            primary = self.is_primary(name)
+            for i in range(0, len(args), step):
+                count = self.push_script(
+                    keys=self.keys(),
+                    args=[self.notify_cap if primary else 0, FRONTIER_CONFIG['host_weight']] + args[i:i + step],
+                    client=self.shards[name]
+                )
+                added += count
+                if not primary:
+                    remote_added += count
+        if remote_added:
+            self.notify(remote_added)
+        return added
+
+    def notify(self, count):
+        """向主 Redis 的通知列表推送令牌，唤醒阻塞等待的爬虫"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.lpush(REDIS_KEYS['pending_notify'], *['1'] * min(count, self.notify_cap))
+        pipe.ltrim(REDIS_KEYS['pending_notify'], 0, self.notify_cap - 1)
+        pipe.execute()
+
+    def pop_entry(self):
+        """取出优先级最高的URL，返回 (URL, 深度)，没有时返回 None。分片时从自己负责的分片开始依次尝试"""
+        for name in self.pop_order:
+            primary = self.is_primary(name)
+            entry = self.pop_script(keys=self.keys()[:3] + self.lease_keys() + [REDIS_KEYS['pending_notify']],
+                                    args=[self.lease_deadline(), '1' if primary else '0'], client=self.shards[name])
+            if entry:
+                if not primary:  # 通知列表在主 Redis 中，单独删除一个令牌
+                    self.redis_client.lpop(REDIS_KEYS['pending_notify'])
+                return entry[0], int(entry[1])
+        return None
+
+    def wait_pending(self, timeout):
+        """阻塞等待共享队列的通知令牌，有新URL时立即返回 True，超时返回 False。只由分发器调用"""
+        return bool(self.redis_client.blpop([REDIS_KEYS['pending_notify']], timeout=timeout))
+
+    def pop(self):
+        """取出优先级最高的URL，没有时返回 None"""
+        entry = self.pop_entry()
+        return entry[0] if entry else None
+
+    def size(self):
+        """待爬取URL数量"""
+        return sum(self.shard_sizes().values())
+
+    def shard_sizes(self):
+        """每个分片的待爬取URL数量"""
+        return {name: client.zcard(REDIS_KEYS['pending_urls']) for name, client in self.shards.items()}
+
+    def hosts(self):
+        """有URL排队的主机（URL中的 host[:port]）"""
+        hosts = set()
+        for client in self.shards.values():
+            hosts.update(client.hkeys(REDIS_KEYS['pending_hosts']))
+        return hosts
+
+    def pop_task(self, crawler_id):
+        """不阻塞地获取任务：先取爬虫自己的任务列表，再取共享队列。返回 (URL, 深度)，深度未知时为 None"""
+        entry = self.lease_lpop_script(keys=[self.task_key(crawler_id)] + self.lease_keys() + [REDIS_KEYS['task_depth']],
+                                       args=[self.lease_deadline()])
+        if entry:
+            return entry[0], int(entry[1])
+        entry = self.pop_entry()  # 自己的队列中没有URL，则从pending_urls中获取URL
+        if entry or not self.steal(crawler_id):
+            return entry
+        return self.pop_task(crawler_id)  # 从其他爬虫的任务列表取来了URL
+
+    def steal(self, crawler_id):
+        """共享队列也为空时，从任务最多的其他爬虫的任务列表队尾取走一批URL，返回取走的数量。
+        URL的租约和深度记录在主 Redis 中，与爬虫无关，取走后由本爬虫处理和确认。
+        affinity 策略下同一主机固定交给一个爬虫，只从心跳已过期的爬虫取走，不打乱主机与爬虫的对应"""
+        if not FRONTIER_CONFIG['work_stealing']:
+            return 0
+        own = self.task_key(crawler_id)
+        siblings = [key for key in self.task_keys() if key != own]  # 实际存在的任务列表，空列表在 Redis 中不存在
+        if siblings and DISPATCHER_CONFIG['strategy'] == 'affinity':
+            live = {self.task_key(i) for i in read_heartbeats(self.redis_client)}
+            siblings = [key for key in siblings if key not in live]
+        if not siblings:
+            return 0
+        return self.steal_script(keys=[own] + siblings,
+                                 args=[FRONTIER_CONFIG['steal_batch'], FRONTIER_CONFIG['steal_min']])
+
+    def wait_task(self, crawler_id, timeout):
+        """获取任务，没有任务时阻塞等待分发器向自己的任务列表写入URL，最多等待 timeout 秒。
+        URL用 BLMOVE 原子地移到处理中列表，再转为租约，两步之间被终止时由回收进程接管，不会丢失。
+        共享队列中的新URL由分发器写入任务列表；超时后下一次调用会重新检查共享队列"""
+        entry = self.pop_task(crawler_id)
+        if entry:
+            return entry
+        url = self.redis_client.blmove(self.task_key(crawler_id), self.processing_key(crawler_id), timeout,
+                                       'LEFT', 'RIGHT')
+        if not url:
+            return None
+        depth = self.claim_script(keys=self.claim_keys(crawler_id), args=[self.lease_deadline(), url])
+        return url, int(depth)
+
+    def claim_keys(self, crawler_id):
+        """CLAIM_SCRIPT 和 ADOPT_SCRIPT 使用的键"""
+        return [self.processing_key(crawler_id)] + self.lease_keys() + [REDIS_KEYS['task_depth']]
+
+    def adopt_processing(self):
+        """把所有爬虫处理中列表里尚未记录租约的URL转为租约，返回数量"""
+        adopted = 0
+        deadline = time.time() + FRONTIER_CONFIG['lease_timeout']
+        for key in self.redis_client.scan_iter(match=self.processing_key('*'), count=1000):
+            crawler_id = key.split(':')[1]
+            adopted += self.adopt_script(keys=self.claim_keys(crawler_id), args=[deadline])
+        return adopted
+
+    def hand_off(self, assignments):
+        """把分发器用 pop_entry 取出的URL写入爬虫的任务列表，assignments 为 {爬虫索引: [(URL, 深度), ...]}，返回写入的数量。
+        租约在主 Redis 中的URL用一个脚本原子地从租约转入任务列表；租约在其他分片中的，写入任务列表后再释放分片中的租约，
+        两步之间分发器被终止时URL可能被重复爬取一次"""
+        reliable = FRONTIER_CONFIG['reliable']
+        task_keys = [self.task_key(crawler_id) for crawler_id in assignments]
+        by_shard = {}
+        for index, entries in enumerate(assignments.values()):
+            for url, depth in entries:
+                by_shard.setdefault(self.shard_for(urlparse(url).netloc.lower()), []).append((index, url, depth))
+        moved = 0
+        for name, items in by_shard.items():
+            if self.is_primary(name):
+                args = ['1' if reliable else '0'] + [
+                    value for index, url, depth in items for value in (index + 4, url, depth)]
+                moved += self.handoff_script(keys=self.lease_keys() + [REDIS_KEYS['task_depth']] + task_keys, args=args)
+                continue
+            shard = self.shards[name]
+            urls = [url for _, url, _ in items]
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hset(REDIS_KEYS['task_depth'], mapping={url: depth for _, url, depth in items})
+            for index, url, _ in items:
+                pipe.rpush(task_keys[index], url)
+            pipe.execute()
+            if reliable:
+                pipe = shard.pipeline(transaction=False)
+                pipe.zrem(REDIS_KEYS['inflight_urls'], *urls)
+                pipe.hdel(REDIS_KEYS['inflight_depth'], *urls)
+                pipe.execute()
+            moved += len(items)
+        return moved
+
+    def requeue(self, entries):
+        """把分发器取出、但没有交给爬虫的 (URL, 深度) 放回待爬取队列，并释放取出时记录的租约，返回放回的数量。
+        先放回再释放，分发器在两步之间被终止时URL最多被重复爬取一次"""
+        by_depth = {}
+        for url, depth in entries:
+            by_depth.setdefault(depth, []).append(url)
+        for depth, urls in by_depth.items():
+            self.push(urls, depth)
+        for url, _ in entries:
+            self.ack(url)
+        return len(entries)
+
+    def ack(self, url):
+        """确认URL已处理完（无论成功还是失败），释放租约"""
+        if not FRONTIER_CONFIG['reliable']:
+            return
+        # 租约在取出URL的分片或主 Redis 中，两处都删除
+        clients = [self.redis_client]
+        shard = self.shards[self.shard_for(urlparse(url).netloc.lower())]
+        if shard is not self.redis_client:
+            clients.append(shard)
+        for client in clients:
+            pipe = client.pipeline(transaction=False)
+            pipe.zrem(REDIS_KEYS['inflight_urls'], url)
+            pipe.hdel(REDIS_KEYS['inflight_depth'], url)
+            pipe.execute()
+
+    def inflight_count(self):
+        """在途URL数量"""
+        return sum(client.zcard(REDIS_KEYS['inflight_urls']) for client in self.instances())
+
+    def reap_expired(self, all_leases=False):
+        """把租约到期的URL放回待爬取队列，返回数量。all_leases 为 True 时不论是否到期全部放回，用于所有爬虫都已停止时恢复。
+        先放回队列再释放租约，回收进程在两步之间被终止也不会丢失URL，最坏情况下URL被重复爬取一次"""
+        self.adopt_processing()  # 先接管处理中列表，其中的URL在租约到期后（all_leases 时立即）放回队列
+        max_score = '+inf' if all_leases else time.time()
+        batch = FRONTIER_CONFIG['reap_batch']
+        reaped = 0
+        for client in self.instances():
+            while True:
+                expired = client.zrangebyscore(REDIS_KEYS['inflight_urls'], '-inf', max_score,
+                                               start=0, num=batch, withscores=True)
+                if not expired:
+                    break
+                depths = client.hmget(REDIS_KEYS['inflight_depth'], [url for url, _ in expired])
+                by_depth = {}
+                for (url, _), depth in zip(expired, depths):
+                    by_depth.setdefault(int(depth or 0), []).append(url)
+                for depth, urls in by_depth.items():
+                    self.push(urls, depth)
+                args = [value for url, score in expired for value in (url, repr(score))]
+                reaped += self.release_script(keys=self.lease_keys(), args=args, client=client)
+                if len(expired) < batch:
+                    break
+        return reaped
+
+    def reaper_worker(self):
+        """租约回收进程，定时把到期的在途URL放回待爬取队列"""
+        print("租约回收进程已启动")
+        while True:
+            try:
+                reaped = self.reap_expired()
+                if reaped:
+                    print(f"租约回收: {reaped} 个到期的在途URL已放回待爬取队列")
+            except Exception as e:
+                print(f"租约回收出错: {str(e)}")
+            time.sleep(FRONTIER_CONFIG['reap_interval'])
+
+    def migrate_legacy(self):
+        """将旧版本集合格式的 pending_urls 转换为优先级队列"""
+        urls = self.redis_client.register_script(MIGRATE_SCRIPT)(keys=[REDIS_KEYS['pending_urls']])
+        if urls:
+            print(f"将 {len(urls)} 个待爬取URL迁移到优先级队列")
+            self.push(urls)
+
+    def rebalance(self):
+        """调整 REDIS_SHARDS 后，把不属于所在分片的URL移到正确的分片，返回移动的URL数量。
+        一致性哈希保证只有少量主机换了分片；主 Redis 不再作为分片时，其中的URL全部移到各个分片"""
+        sources = dict(self.shards)
+        if not any(self.is_primary(name) for name in self.shards):
+            sources['primary'] = self.redis_client
+        moved = 0
+        for name, client in sources.items():
+            batch = []
+            for url, score in client.zscan_iter(REDIS_KEYS['pending_urls'], count=self.batch_size):
+                host = urlparse(url).netloc.lower()
+                if self.shard_for(host) != name:
+                    batch.append((url, score, host))
+                if len(batch) >= self.batch_size:
+                    moved += self.move(client, batch)
+                    batch = []
+            if batch:
+                moved += self.move(client, batch)
+        return moved
+
+    def move(self, client, batch):
+        """把一批 (URL, 分数, 主机) 从 client 所在的分片移到各自的分片，保留分数和深度"""
+        depths = client.hmget(REDIS_KEYS['pending_depth'], [url for url, _, _ in batch])
+        self.push_entries([(url, score, int(depth or 0), host) for (url, score, host), depth in zip(batch, depths)])
+        args = [value for url, _, host in batch for value in (url, host)]
+        return self.remove_script(keys=self.keys()[:3], args=args, client=client)
+
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:] != ['rebalance']:
+        print("用法: python frontier.py rebalance")
+        sys.exit(1)
+    frontier = Frontier(redis.Redis(**REDIS_CONFIG))
+    print(f"已移动 {frontier.rebalance()} 个URL，各分片待爬取URL数量: {frontier.shard_sizes()}")
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# 一致性哈希环：把主机名映射到分片，增减分片时只有少量主机换到别的分片
+
+import bisect
+import hashlib
+
+
+class HashRing:
+    """一致性哈希环。每个节点在环上放置 replicas 个虚拟节点，键顺时针找到的第一个虚拟节点即为它所属的节点。
+    增加一个节点时只有约 1/N 的键移动到新节点，删除节点时只有该节点上的键移动"""
+
+    def __init__(self, nodes=(), replicas=160):
+        """初始化哈希环，nodes 为节点名称"""
+        self.replicas = replicas
+        self.ring = []  # 排好序的虚拟节点哈希值
+        self.owners = {}  # 虚拟节点哈希值 -> 节点名称
+        for node in nodes:
+            self.add_node(node)
+
+    def hash(self, key):
+        """64 位哈希值"""
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def add_node(self, node):
+        """添加节点"""
+        for i in range(self.replicas):
+            h = self.hash(f'{node}#{i}')
+            if h not in self.owners:
+                bisect.insort(self.ring, h)
+            self.owners[h] = node
+
+    def remove_node(self, node):
+        """删除节点"""
+        for i in range(self.replicas):
+            h = self.hash(f'{node}#{i}')
+            if self.owners.get(h) == node:
+                del self.owners[h]
+                self.ring.pop(bisect.bisect_left(self.ring, h))
+
+    @property
+    def nodes(self):
+        """所有节点名称"""
+        return sorted(set(self.owners.values()))
+
+    def get_node(self, key):
+        """键所属的节点，环为空时返回 None"""
+        if not self.ring:
+            return None
+        i = bisect.bisect(self.ring, self.hash(key)) % len(self.ring)
+        return self.owners[self.ring[i]]
+
+
+if __name__ == '__main__':
+    # 演示增减分片时移动的主机比例
+    hosts = [f'img{i}.example{i % 997}.com' for i in range(100000)]
+    ring = HashRing([f'shard-{i}' for i in range(4)])
+    before = {host: ring.get_node(host) for host in hosts}
+    ring.add_node('shard-4')
+    moved = sum(1 for host in hosts if ring.get_node(host) != before[host])
+    print(f"4 个分片增加到 5 个: {moved / len(hosts) * 100:.1f}% 的主机移动到其他分片（理想值 20.0%）")
+    ring.remove_node('shard-4')
+    ring.remove_node('shard-0')
+    moved = sum(1 for host in hosts if ring.get_node(host) != before[host])
+    print(f"4 个分片删除 1 个: {moved / len(hosts) * 100:.1f}% 的主机移动到其他分片（理想值 25.0%）")
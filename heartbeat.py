@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# 爬虫心跳：在内存中合并状态变化和计数，按固定间隔批量写入 Redis
+
+import json
+import threading
+import time
+from config import REDIS_KEYS, HEARTBEAT_CONFIG, DISPATCHER_CONFIG
+
+
+def read_heartbeats(redis_client, crawler_count=None):
+    """读取各爬虫的心跳，返回 {爬虫索引: 心跳数据}，心跳超过 stale_after 秒未更新的爬虫不在其中。
+    crawler_count 不为 None 时只返回索引小于它的爬虫"""
+    now = time.time()
+    heartbeats = {}
+    for name, value in redis_client.hgetall(REDIS_KEYS['crawler_status']).items():
+        name = name.decode('utf-8') if isinstance(name, bytes) else name
+        try:
+            crawler_id = int(name.rsplit('_', 1)[1])
+            data = json.loads(value)
+        except (IndexError, ValueError):
+            continue
+        if crawler_count is not None and crawler_id >= crawler_count:
+            continue
+        if now - data.get('last_update', 0) <= DISPATCHER_CONFIG['stale_after']:
+            heartbeats[crawler_id] = data
+    return heartbeats
+
+
+class Heartbeat:
+    """记录爬虫的最新状态和计数，由后台线程每隔 interval 秒用一次管道写入 Redis"""
+
+    def __init__(self, redis_client, crawler_id, interval=None, stats_provider=None):
+        """初始化心跳。stats_provider 返回需要一起上报的附加信息（如连接池统计）"""
+        self.redis_client = redis_client
+        self.crawler_id = crawler_id
+        self.interval = interval or HEARTBEAT_CONFIG['interval']
+        self.stats_provider = stats_provider
+        self.status = 'starting'
+        self.status_since = time.time()
+        self.counters = {}  # 进程启动以来的累计计数
+        self.pending_counters = {}  # 上次写入之后新增的计数，写入全局统计时使用
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def set_status(self, status):
+        """更新状态，只修改内存"""
+        with self.lock:
+            if status != self.status:
+                self.status = status
+                self.status_since = time.time()
+
+    def incr(self, name, amount=1):
+        """增加计数，只修改内存"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            self.pending_counters[name] = self.pending_counters.get(name, 0) + amount
+
+    def flush(self):
+        """将最新状态和计数用一次管道写入 Redis"""
+        with self.lock:
+            data = {
+                'status': self.status,
+                'status_since': self.status_since,
+                'last_update': time.time(),
+                'counters': dict(self.counters)
+            }
+            pending_counters, self.pending_counters = self.pending_counters, {}
+        try:
+            if self.stats_provider:
+                data.update(self.stats_provider())
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hset(REDIS_KEYS['crawler_status'], f'crawler_{self.crawler_id}', json.dumps(data))
+            for name, amount in pending_counters.items():  # 所有爬虫的累计计数
+                pipe.hincrby(REDIS_KEYS['crawler_stats'], name, amount)
+            pipe.execute()
+        except Exception as e:
+            print(f"更新爬虫状态失败: {str(e)}")
+            with self.lock:  # 写入失败的计数留到下次写入
+                for name, amount in pending_counters.items():
+                    self.pending_counters[name] = self.pending_counters.get(name, 0) + amount
+
+    def run(self):
+        """后台线程，定时写入"""
+        while self.running:
+            time.sleep(self.interval)
+            self.flush()
+
+    def start(self):
+        """启动后台写入线程"""
+        self.running = True
+        self.flush()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止后台写入线程，并写入最后一次状态"""
+        self.running = False
+        self.flush()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# HTTP 连接池管理：页面请求和图片下载共用长连接
+
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from config import HTTP_POOL_CONFIG
+
+
+class CachedDNSMixin:
+    """新建连接时使用DNS缓存中的 IP。urllib3 的 host 属性由 _dns_host 得出，TLS 的 SNI 和证书校验都使用 host，
+    所以只在建立 TCP 连接期间把 _dns_host 换成 IP，连接建立后立即恢复"""
+    dns_cache = None
+
+    def _new_conn(self):
+        ip = self.dns_cache.resolve(self._dns_host) if self.dns_cache else None
+        if not ip:
+            return super()._new_conn()
+        dns_host = self._dns_host
+        self._dns_host = ip
+        try:
+            return super()._new_conn()
+        finally:
+            self._dns_host = dns_host
+
+
+class DNSCachingAdapter(HTTPAdapter):
+    """直接连接时通过DNS缓存解析主机的 HTTPAdapter。使用代理时连接的是代理服务器，不经过此缓存"""
+
+    def __init__(self, dns_cache, **kwargs):
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        attrs = {'dns_cache': self.dns_cache}
+        http_connection = type('CachedDNSHTTPConnection', (CachedDNSMixin, HTTPConnection), attrs)
+        https_connection = type('CachedDNSHTTPSConnection', (CachedDNSMixin, HTTPSConnection), attrs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': type('CachedDNSHTTPConnectionPool', (HTTPConnectionPool,), {'ConnectionCls': http_connection}),
+            'https': type('CachedDNSHTTPSConnectionPool', (HTTPSConnectionPool,), {'ConnectionCls': https_connection}),
+        }
+
+
+class HTTPSessionPool:
+    """按 (协议, 主机, 代理) 维护 requests.Session，复用 TCP/TLS 连接"""
+
+    def __init__(self, pool_maxsize=None, keep_alive=None, idle_timeout=None, max_pools=None, dns_cache=None):
+        """初始化连接池管理器，未指定的参数使用 HTTP_POOL_CONFIG。提供 dns_cache 时新建连接使用缓存的解析结果"""
+        self.pool_maxsize = pool_maxsize or HTTP_POOL_CONFIG['pool_maxsize']
+        self.keep_alive = HTTP_POOL_CONFIG['keep_alive'] if keep_alive is None else keep_alive
+        self.idle_timeout = idle_timeout or HTTP_POOL_CONFIG['idle_timeout']
+        self.max_pools = max_pools or HTTP_POOL_CONFIG['max_pools']
+        self.dns_cache = dns_cache
+        self.sessions = {}  # 连接池键 -> [session, 最后使用时间]
+        self.lock = threading.Lock()
+        self.last_eviction = time.time()
+        # 已关闭连接池的连接计数，关闭后仍需计入统计
+        self.closed_stats = {'connection_hits': 0, 'connection_misses': 0}
+        self.session_hits = 0
+        self.session_misses = 0
+
+    def pool_key(self, url, proxies=None):
+        """连接池键：同一协议、主机和代理的请求共用一个连接池"""
+        parsed = urlparse(url)
+        proxy = proxies.get(parsed.scheme) if proxies else None
+        return parsed.scheme, parsed.netloc.lower(), proxy
+
+    def create_session(self):
+        """创建带固定大小连接池的会话"""
+        session = requests.Session()
+        if self.dns_cache:
+            adapter = DNSCachingAdapter(self.dns_cache, pool_connections=1, pool_maxsize=self.pool_maxsize)
+        else:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def get_session(self, url, proxies=None):
+        """获取URL对应的会话，没有则新建"""
+        key = self.pool_key(url, proxies)
+        now = time.time()
+        with self.lock:
+            if now - self.last_eviction > self.idle_timeout:
+                self.evict_idle(now)
+            entry = self.sessions.get(key)
+            if entry:
+                self.session_hits += 1
+                entry[1] = now
+                return entry[0]
+
+            self.session_misses += 1
+            if len(self.sessions) >= self.max_pools:  # 连接池数量达到上限时关闭最久未使用的
+                oldest = min(self.sessions, key=lambda k: self.sessions[k][1])
+                self.close_session(oldest)
+            session = self.create_session()
+            self.sessions[key] = [session, now]
+            return session
+
+    def get(self, url, **kwargs):
+        """通过连接池发送 GET 请求，参数与 requests.get 相同"""
+        session = self.get_session(url, kwargs.get('proxies'))
+        return session.get(url, **kwargs)
+
+    def evict_idle(self, now=None):
+        """关闭空闲超时的连接池，调用方需持有锁"""
+        now = now or time.time()
+        for key in [k for k, (_, last_used) in self.sessions.items() if now - last_used > self.idle_timeout]:
+            self.close_session(key)
+        self.last_eviction = now
+
+    def close_session(self, key):
+        """关闭单个会话并保留其连接计数"""
+        session, _ = self.sessions.pop(key)
+        stats = self.connection_stats(session)
+        self.closed_stats['connection_hits'] += stats['connection_hits']
+        self.closed_stats['connection_misses'] += stats['connection_misses']
+        session.close()
+
+    def connection_stats(self, session):
+        """统计会话中 urllib3 连接池的连接复用情况。新建连接记为未命中，其余请求记为命中"""
+        hits = misses = 0
+        # 同一个 adapter 同时挂载在 http:// 和 https:// 上，按对象去重避免重复计数
+        adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+        for adapter in adapters.values():
+            managers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+            for manager in managers:
+                for pool_key in list(manager.pools.keys()):
+                    pool = manager.pools.get(pool_key)
+                    if pool is None:
+                        continue
+                    misses += pool.num_connections
+                    hits += max(pool.num_requests - pool.num_connections, 0)
+        return {'connection_hits': hits, 'connection_misses': misses}
+
+    def get_stats(self):
+        """获取连接池命中统计"""
+        with self.lock:
+            hits = self.closed_stats['connection_hits']
+            misses = self.closed_stats['connection_misses']
+            for session, _ in self.sessions.values():
+                stats = self.connection_stats(session)
+                hits += stats['connection_hits']
+                misses += stats['connection_misses']
+            return {
+                'pools': len(self.sessions),
+                'session_hits': self.session_hits,
+                'session_misses': self.session_misses,
+                'connection_hits': hits,
+                'connection_misses': misses,
+            }
+
+    def close(self):
+        """关闭所有会话"""
+        with self.lock:
+            for key in list(self.sessions):
+                self.close_session(key)
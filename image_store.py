@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# 图片存储：按内容摘要去重保存图片。流式写入临时文件，下载完成后原子重命名，支持断点续传
+
+import hashlib
+import json
+import os
+import re
+from config import CRAWLER_CONFIG, IMAGE_STORE_CONFIG, REDIS_KEYS
+
+
+class PartialDownload:
+    """正在写入的临时文件，写入的同时计算内容摘要"""
+
+    def __init__(self, path, mode, total, chunk_size):
+        """打开临时文件。续传时先读取已有内容计算摘要"""
+        self.hasher = hashlib.sha256()
+        self.written = 0
+        if mode == 'ab':
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    self.hasher.update(chunk)
+        self.file = open(path, mode)
+        self.total = total  # 完整图片的字节数，服务器没有给出时为 None
+
+    def write(self, chunk):
+        """写入一块数据"""
+        self.hasher.update(chunk)
+        self.file.write(chunk)
+        self.written += len(chunk)
+
+    def hexdigest(self):
+        """内容摘要"""
+        return self.hasher.hexdigest()
+
+    def close(self):
+        """关闭临时文件"""
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ImageStore:
+    """按内容寻址的图片存储。
+
+    每个不同内容的图片只保存一份，路径为 objects/摘要前两位/摘要.扩展名。
+    Redis 中的清单记录 URL -> 摘要、标题、ETag，ETag 索引记录 (URL, ETag) -> 摘要，
+    已知的图片在下载前即可跳过。未完成的下载保存在 .partial 目录中，下次下载时用 Range 请求续传。
+    """
+
+    def __init__(self, download_dir=None, chunk_size=None, redis_client=None, on_stat=None):
+        """初始化图片存储。没有 redis_client 时只保存文件，不记录清单；on_stat(名称, 数量) 用于上报统计"""
+        self.download_dir = download_dir or CRAWLER_CONFIG['download_path']
+        self.chunk_size = chunk_size or IMAGE_STORE_CONFIG['chunk_size']  # 每次读取和写入的块大小，决定了内存占用上限
+        self.redis_client = redis_client
+        self.on_stat = on_stat or (lambda name, amount: None)
+        # 临时目录与下载目录位于同一文件系统，保证 os.replace 是原子操作
+        self.partial_dir = os.path.join(self.download_dir, '.partial')
+        self.objects_dir = os.path.join(self.download_dir, 'objects')
+        os.makedirs(self.partial_dir, exist_ok=True)
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def partial_path(self, url):
+        """URL对应的临时文件路径"""
+        return os.path.join(self.partial_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.part')
+
+    def meta_path(self, url):
+        """临时文件对应的校验信息（ETag / Last-Modified）路径"""
+        return self.partial_path(url) + '.meta'
+
+    def blob_path(self, digest, extension):
+        """摘要对应的图片文件路径"""
+        return os.path.join(self.objects_dir, digest[:2], f'{digest}.{extension}')
+
+    def get_extension(self, url):
+        """从URL中提取图片扩展名"""
+        match = re.search(r'\.(png|jpe?g|gif|bmp|webp)$', url.split('?')[0], re.I)
+        return match.group(1).lower() if match else 'jpg'
+
+    def etag_key(self, url, etag):
+        """ETag 索引的键。ETag 只在同一个资源内有意义（nginx 的 修改时间-大小 格式、CDN 的固定值在不同图片间会重复），
+        所以按规范化后的URL和 ETag 一起索引"""
+        return f'{url} {etag}'
+
+    def lookup(self, url):
+        """查询URL是否已保存过且文件仍在，返回清单记录或 None"""
+        if not self.redis_client:
+            return None
+        entry = self.redis_client.hget(REDIS_KEYS['image_manifest'], url)
+        if not entry:
+            return None
+        entry = json.loads(entry)
+        return entry if os.path.exists(entry['path']) else None
+
+    def reuse_by_etag(self, url, status, headers, title=None, name=None):
+        """收到完整响应的响应头后，如果 ETag 对应的图片已保存过，则直接记录清单，不再读取响应体"""
+        etag = headers.get('ETag')
+        if status != 200 or not etag or not self.redis_client:
+            return False
+        blob = self.redis_client.hget(REDIS_KEYS['image_etags'], self.etag_key(url, etag))
+        if not blob:
+            return False
+        blob = json.loads(blob)
+        if blob.get('url') != url or not os.path.exists(blob['path']):  # 只复用同一个URL保存过的图片
+            return False
+        self.record(url, blob['digest'], blob['path'], blob['size'], title, name, etag)
+        self.on_stat('image_bandwidth_bytes_saved', blob['size'])
+        self.on_stat('image_etag_hits', 1)
+        return True
+
+    def skip_known(self, entry):
+        """跳过已保存的图片，统计节省的流量"""
+        self.on_stat('image_bandwidth_bytes_saved', entry['size'])
+        self.on_stat('image_url_hits', 1)
+
+    def resume_offset(self, url):
+        """已下载的字节数，没有临时文件时为0"""
+        try:
+            return os.path.getsize(self.partial_path(url))
+        except OSError:
+            return 0
+
+    def range_headers(self, url):
+        """续传请求头。带上 If-Range，服务器上的图片已变化时会返回完整内容而不是片段"""
+        offset = self.resume_offset(url)
+        if not offset:
+            return {}
+        headers = {'Range': f'bytes={offset}-'}
+        try:
+            with open(self.meta_path(url), 'r') as f:
+                validator = json.load(f).get('validator')
+            if validator:
+                headers['If-Range'] = validator
+        except (OSError, ValueError):
+            pass
+        return headers
+
+    def open_for_response(self, url, status, headers):
+        """根据响应状态打开临时文件，返回 PartialDownload，无法写入时返回 None"""
+        offset = self.resume_offset(url)
+        if status == 206 and offset:
+            # Content-Range: bytes start-end/total，起始位置必须与已下载的字节数一致
+            match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', headers.get('Content-Range', ''))
+            if not match or int(match.group(1)) != offset:
+                self.discard(url)
+                return None
+            total = int(match.group(2)) if match.group(2) != '*' else None
+            return PartialDownload(self.partial_path(url), 'ab', total, self.chunk_size)
+
+        if status == 200:  # 不支持 Range 或图片已变化，从头下载
+            length = headers.get('Content-Length')
+            validator = headers.get('ETag') or headers.get('Last-Modified')
+            with open(self.meta_path(url), 'w') as f:
+                json.dump({'validator': validator}, f)
+            total = int(length) if length and length.isdigit() else None
+            return PartialDownload(self.partial_path(url), 'wb', total, self.chunk_size)
+
+        if status == 416:  # 请求的范围无效，丢弃临时文件，下次从头下载
+            self.discard(url)
+        return None
+
+    def is_complete(self, url, download):
+        """临时文件是否已完整。服务器没有给出大小时，以连接正常结束为准"""
+        return download.total is None or self.resume_offset(url) >= download.total
+
+    def commit(self, url, download, title=None, name=None, etag=None):
+        """保存下载完成的图片。相同内容已存在时丢弃临时文件，否则原子地重命名为图片文件。返回图片路径"""
+        digest = download.hexdigest()
+        size = self.resume_offset(url)
+        path = self.blob_path(digest, self.get_extension(url))
+        self.on_stat('image_bytes_downloaded', download.written)
+        if os.path.exists(path):
+            self.discard(url)
+            self.on_stat('image_duplicates', 1)
+            self.on_stat('image_disk_bytes_saved', size)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.partial_path(url), path)
+            self.remove_meta(url)
+        self.record(url, digest, path, size, title, name, etag)
+        return path
+
+    def record(self, url, digest, path, size, title=None, name=None, etag=None):
+        """在清单中记录 URL -> 摘要，(URL, ETag) -> 摘要"""
+        if not self.redis_client:
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hset(REDIS_KEYS['image_manifest'], url, json.dumps({
+            'digest': digest,
+            'path': path,
+            'size': size,
+            'title': title,
+            'name': name,  # 以图片标题命名的文件名，便于按关键词查找
+            'etag': etag
+        }, ensure_ascii=False))
+        if etag:
+            pipe.hset(REDIS_KEYS['image_etags'], self.etag_key(url, etag), json.dumps(
+                {'url': url, 'digest': digest, 'path': path, 'size': size}, ensure_ascii=False))
+        pipe.execute()
+
+    def discard(self, url):
+        """删除临时文件"""
+        try:
+            os.remove(self.partial_path(url))
+        except OSError:
+            pass
+        self.remove_meta(url)
+
+    def remove_meta(self, url):
+        """删除校验信息文件"""
+        try:
+            os.remove(self.meta_path(url))
+        except OSError:
+            pass
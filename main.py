@@ -4,13 +4,16 @@ import time
 import multiprocessing
 from multiprocessing import Queue, Process
 from url_manager import URLManagerFlink  # Flink 版本的 URLManager
-from url_dispatcher_flink import URLDispatcherFlink
+from dispatcher import create_dispatcher  # 只有选择 flink 后端时才导入 pyflink
 from data_parser import DataParser
 from crawler import Crawler
 from monitor import Monitor
 from storage import Storage
+from frontier import Frontier
+from retry_queue import RetryQueue
+from dns_cache import DNSCache
 from config import (
-    SEED_URLS, REDIS_CONFIG, REDIS_KEYS, CRAWLER_CONFIG
+    SEED_URLS, REDIS_CONFIG, CRAWLER_CONFIG, DNS_CACHE_CONFIG, FRONTIER_CONFIG
 )
 import redis  # 导入 Redis 客户端
 
@@ -32,12 +35,52 @@ def start_crawler(crawler_id, redis_config, parse_queue):
     """启动爬虫进程"""
     try:
         print(f"爬虫 {crawler_id} 启动...")
-        crawler = Crawler(parse_queue)  # 在子进程中初始化 Crawler
+        # 在子进程中初始化 Crawler
+        if CRAWLER_CONFIG['worker_mode'] == 'async':
+            from async_crawler import AsyncCrawler  # 只有异步模式才需要 aiohttp
+            crawler = AsyncCrawler(parse_queue)
+        else:
+            crawler = Crawler(parse_queue)
         crawler.crawler_worker(crawler_id)  # 直接调用爬虫的工作方法
     except Exception as e:
         print(f"爬虫 {crawler_id} 运行出错: {str(e)}")
 
 
+def start_retry_promoter(redis_config):
+    """启动重试调度进程，将到期的失败URL放回待爬取队列"""
+    try:
+        redis_client = redis.Redis(**redis_config)
+        RetryQueue(redis_client, Frontier(redis_client)).promote_worker()
+    except Exception as e:
+        print(f"重试调度进程运行出错: {str(e)}")
+
+
+def start_dns_prefetcher(redis_config):
+    """启动DNS预解析进程，提前解析待爬取队列中的主机"""
+    try:
+        DNSCache(redis.Redis(**redis_config)).prefetch_worker()
+    except Exception as e:
+        print(f"DNS预解析进程运行出错: {str(e)}")
+
+
+def start_lease_reaper(redis_config):
+    """启动租约回收进程，将租约到期的在途URL放回待爬取队列"""
+    try:
+        redis_client = redis.Redis(**redis_config)
+        Frontier(redis_client).reaper_worker()
+    except Exception as e:
+        print(f"租约回收进程运行出错: {str(e)}")
+
+
+def start_dispatcher(redis_config, crawler_count):
+    """启动 URL 分发进程，持续把待爬取队列中的URL分发到各爬虫的任务列表"""
+    try:
+        dispatcher = create_dispatcher(redis_config)  # 后端由 DISPATCHER_CONFIG['backend'] 选择
+        dispatcher.start_dispatch(crawler_count=crawler_count)
+    except Exception as e:
+        print(f"URL 分发进程运行出错: {str(e)}")
+
+
 def start_parser(parse_queue, worker_count=2):
     """启动解析器进程"""
     try:
@@ -65,17 +108,14 @@ def main():
 
     # 1. 初始化各个模块
     url_manager = URLManagerFlink(redis_config)  # 基于 Flink 的 URL 管理
-    dispatcher = URLDispatcherFlink(
-        redis_config['host'], redis_config['port'], redis_config['db'],
-        REDIS_KEYS['pending_urls'], REDIS_KEYS['crawler_tasks_prefix']
-    )  # 基于 Flink 的 URL 分发
     monitor = Monitor()  # 监控系统状态
     storage = Storage()  # 数据存储
 
     try:
-        # 2. 添加种子URL
-        print("正在初始化种子URL...")
-        url_manager.add_seed_urls(SEED_URLS)
+        # 2. 上次运行被终止时，从中断的位置继续；否则添加种子URL
+        if not url_manager.resume_crawl():
+            print("正在初始化种子URL...")
+            url_manager.add_seed_urls(SEED_URLS)
 
         # 3. 启动数据解析器（先启动解析器）
         print("启动数据解析器...")
@@ -90,9 +130,26 @@ def main():
             crawler_processes.append(p)
             print(f"爬虫 {i} 已启动")
 
-        # 5. 启动 URL 分发器
+        # 启动重试调度进程
+        retry_process = Process(target=start_retry_promoter, args=(redis_config,))
+        retry_process.start()
+
+        # 启用DNS缓存时启动DNS预解析进程
+        dns_process = None
+        if DNS_CACHE_CONFIG['enabled']:
+            dns_process = Process(target=start_dns_prefetcher, args=(redis_config,))
+            dns_process.start()
+
+        # 使用租约时启动租约回收进程
+        reaper_process = None
+        if FRONTIER_CONFIG['reliable']:
+            reaper_process = Process(target=start_lease_reaper, args=(redis_config,))
+            reaper_process.start()
+
+        # 5. 启动 URL 分发器，与爬虫同时持续运行
         print("启动 URL 分发器...")
-        dispatcher.start_dispatch(crawler_count=3)
+        dispatch_process = Process(target=start_dispatcher, args=(redis_config, 3))
+        dispatch_process.start()
 
         # 6. 启动监控
         print("启动监控...")
@@ -110,6 +167,16 @@ def main():
                 # 停止解析器
                 for p in parser_processes:
                     p.terminate()
+                # 停止重试调度
+                retry_process.terminate()
+                # 停止DNS预解析
+                if dns_process:
+                    dns_process.terminate()
+                # 停止租约回收
+                if reaper_process:
+                    reaper_process.terminate()
+                # 停止 URL 分发
+                dispatch_process.terminate()
                 # 停止监控
                 monitor_process.terminate()
                 print("系统已停止")
@@ -123,6 +190,12 @@ def main():
                 p.terminate()
             for p in parser_processes:
                 p.terminate()
+            retry_process.terminate()
+            if dns_process:
+                dns_process.terminate()
+            if reaper_process:
+                reaper_process.terminate()
+            dispatch_process.terminate()
             monitor_process.terminate()
         except:
             pass
@@ -6,6 +6,8 @@ import json
 import psutil
 from datetime import datetime
 from config import REDIS_CONFIG, REDIS_KEYS
+from bloom import SeenSet
+from frontier import Frontier
 from multiprocessing import Process
 
 
@@ -13,6 +15,7 @@ class Monitor:
     def __init__(self):
         """初始化监控"""
         self.running = True
+        self.frontier = None  # 待爬取队列，在监控进程中连接 Redis 后创建，分片时需要读取各个分片
 
     def get_crawler_status(self, redis_client):
         """获取所有爬虫状态"""
@@ -28,7 +31,11 @@ class Monitor:
                     'status': status_data['status'],
                     'last_update': last_update.strftime('%Y-%m-%d %H:%M:%S'),
                     'idle_time': idle_time,
-                    'warning': idle_time > 300  # 5分钟无响应标记为警告
+                    'warning': idle_time > 300,  # 5分钟无响应标记为警告
+                    'counters': status_data.get('counters', {}),  # 爬虫进程的累计计数
+                    'http_pool': status_data.get('http_pool', {}),  # 连接池命中统计
+                    'proxies': status_data.get('proxies', {}),  # 代理的状态和得分
+                    'dns': status_data.get('dns', {})  # DNS缓存命中率和解析耗时
                 }
             return result  # 每个爬虫的状态信息
         except Exception as e:
@@ -50,11 +57,18 @@ class Monitor:
     def get_statistics(self, redis_client):
         """获取统计信息"""
         try:
+            if self.frontier is None:
+                self.frontier = Frontier(redis_client)
+            shard_sizes = self.frontier.shard_sizes()
             return {
-                '待爬取URL数': redis_client.scard(REDIS_KEYS['pending_urls']),
-                '已成功URL数': redis_client.scard(REDIS_KEYS['success_urls']),
-                '失败URL数': redis_client.scard(REDIS_KEYS['failed_urls']),
-                '解析数据数': redis_client.llen(REDIS_KEYS['parsed_data'])
+                '待爬取URL数': sum(shard_sizes.values()),
+                '各分片待爬取URL数': shard_sizes,
+                '在途URL数': self.frontier.inflight_count(),
+                '已成功URL数': SeenSet(redis_client, 'success_urls').count(),
+                '失败URL数': SeenSet(redis_client, 'failed_urls').count(),
+                '等待重试URL数': redis_client.zcard(REDIS_KEYS['retry_schedule']),
+                '解析数据数': redis_client.llen(REDIS_KEYS['parsed_data']),
+                '爬虫累计计数': redis_client.hgetall(REDIS_KEYS['crawler_stats'])
             }
         except Exception as e:
             print(f"获取统计信息失败: {str(e)}")
@@ -88,6 +102,23 @@ class Monitor:
                         print(f"  - 状态: {status['status']}")
                         print(f"  - 最后更新: {status['last_update']}")
                         print(f"  - 空闲时间: {status['idle_time']}秒")
+                        if status['counters']:
+                            print(f"  - 计数: {', '.join(f'{k}={v}' for k, v in status['counters'].items())}")
+                        pool = status['http_pool']
+                        if pool:
+                            total = pool.get('connection_hits', 0) + pool.get('connection_misses', 0)
+                            hit_rate = pool.get('connection_hits', 0) / total * 100 if total else 0
+                            print(f"  - 连接复用: 命中 {pool.get('connection_hits', 0)}, "
+                                  f"新建 {pool.get('connection_misses', 0)}, 命中率 {hit_rate:.1f}%")
+                        dns_stats = status['dns']
+                        if dns_stats:
+                            print(f"  - DNS缓存: 命中率 {dns_stats['hit_rate'] * 100:.1f}% "
+                                  f"(本地 {dns_stats['local_hits']}, 共享 {dns_stats['shared_hits']}, "
+                                  f"解析 {dns_stats['misses']}, 失败 {dns_stats['failures']}), "
+                                  f"平均解析耗时 {dns_stats['avg_resolve_ms']}ms")
+                        for proxy, score in status['proxies'].items():
+                            print(f"  - 代理 {proxy}: {score['state']}, 得分 {score['score']}, "
+                                  f"延迟 {score['latency']}s, 成功/失败 {score['successes']}/{score['failures']}")
                         if status['status'] == "warning":
                             print("  ⚠️ 警告: 爬虫可能已停止响应")
                 else:
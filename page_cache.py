@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# 页面校验信息缓存：用条件请求和内容摘要跳过没有变化的页面
+
+import hashlib
+import json
+from config import REDIS_KEYS
+
+
+class PageCache:
+    """按URL保存页面的 ETag、Last-Modified 和内容摘要"""
+
+    def __init__(self, redis_client):
+        """初始化页面缓存"""
+        self.redis_client = redis_client
+
+    def get(self, url):
+        """获取URL的校验信息，没有时返回空字典"""
+        try:
+            entry = self.redis_client.hget(REDIS_KEYS['page_validators'], url)
+            return json.loads(entry) if entry else {}
+        except Exception as e:
+            print(f"读取页面缓存失败 {url}: {str(e)}")
+            return {}
+
+    def conditional_headers(self, entry):
+        """条件请求头。页面没有变化时服务器返回 304，不再传输页面内容"""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def body_hash(self, content):
+        """页面内容摘要"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return hashlib.sha256(content).hexdigest()
+
+    def is_unchanged(self, entry, body_hash):
+        """服务器不支持条件请求时，用内容摘要判断页面是否变化"""
+        return bool(entry) and entry.get('body_hash') == body_hash
+
+    def validators(self, response_headers, body_hash):
+        """从响应中取出校验信息，随页面内容一起交给解析器，解析完成后再保存"""
+        return {
+            'etag': response_headers.get('ETag'),
+            'last_modified': response_headers.get('Last-Modified'),
+            'body_hash': body_hash
+        }
+
+    def update(self, url, validators):
+        """保存页面最新的校验信息。只在页面解析完成、新URL已放入待爬取队列之后调用，
+        否则解析失败的页面下次会被当作没有变化而跳过"""
+        try:
+            self.redis_client.hset(REDIS_KEYS['page_validators'], url, json.dumps(validators))
+        except Exception as e:
+            print(f"更新页面缓存失败 {url}: {str(e)}")
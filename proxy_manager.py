@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# 代理管理：按成功率和延迟为代理打分，优先选择快速可用的代理，连续失败的代理熔断后定时试探恢复
+
+import random
+import threading
+import time
+from config import PROXY_POOL, PROXY_CONFIG, REDIS_KEYS
+
+CLOSED = 'closed'  # 正常使用
+OPEN = 'open'  # 已熔断，暂不使用
+HALF_OPEN = 'half_open'  # 熔断冷却结束，只放行一个试探请求
+
+
+class ProxyUnavailable(RuntimeError):
+    """没有可用的代理且不允许直接连接。不是URL本身的问题，稍后重试时不计入URL的重试次数"""
+
+
+class ProxyManager:
+    """代理池。记录每个代理的成功率和延迟，按得分加权随机选择，失败过多的代理会被熔断"""
+
+    def __init__(self, proxies=None, redis_client=None):
+        """初始化代理池。提供 redis_client 时定时从 Redis 的 proxy_pool 集合更新代理列表"""
+        self.redis_client = redis_client
+        self.proxies = {}
+        self.lock = threading.Lock()
+        self.last_refresh = 0
+        self.update_pool(PROXY_POOL if proxies is None else proxies)
+
+    def new_state(self):
+        """新代理的初始统计"""
+        return {
+            'state': CLOSED,
+            'successes': 0,
+            'failures': 0,
+            'consecutive_failures': 0,
+            'latency': PROXY_CONFIG['initial_latency'],  # 延迟的指数移动平均（秒）
+            'opened_at': 0,
+            'probing': False  # 半开状态下是否已有试探请求在途
+        }
+
+    def update_pool(self, proxies):
+        """运行时更新代理列表。保留仍在列表中的代理的统计，删除不在列表中的代理"""
+        with self.lock:
+            proxies = set(proxies)
+            for proxy in list(self.proxies):
+                if proxy not in proxies:
+                    del self.proxies[proxy]
+            for proxy in proxies:
+                if proxy not in self.proxies:
+                    self.proxies[proxy] = self.new_state()
+
+    def refresh_pool(self):
+        """每隔 refresh_interval 秒从 Redis 读取代理列表，集合为空时保持当前列表"""
+        if not self.redis_client or time.time() - self.last_refresh < PROXY_CONFIG['refresh_interval']:
+            return
+        self.last_refresh = time.time()
+        try:
+            proxies = self.redis_client.smembers(REDIS_KEYS['proxy_pool'])
+            if proxies:
+                self.update_pool(proxies)
+        except Exception as e:
+            print(f"更新代理池失败: {str(e)}")
+
+    def score(self, stats):
+        """代理得分：平滑后的成功率除以平均延迟"""
+        success_rate = (stats['successes'] + 1) / (stats['successes'] + stats['failures'] + 2)
+        return success_rate / max(stats['latency'], 0.01)
+
+    def choose(self):
+        """按得分加权随机选择一个可用代理，没有可用代理时返回 None"""
+        self.refresh_pool()
+        now = time.time()
+        with self.lock:
+            candidates = []
+            for proxy, stats in self.proxies.items():
+                if stats['state'] == OPEN and now - stats['opened_at'] >= PROXY_CONFIG['open_timeout']:
+                    stats['state'] = HALF_OPEN
+                if stats['state'] == HALF_OPEN and not stats['probing']:
+                    # 冷却结束的代理优先试探，同一时间只放行一个请求
+                    stats['probing'] = True
+                    return proxy
+                if stats['state'] == CLOSED:
+                    candidates.append(proxy)
+            if not candidates:
+                return None
+            weights = [self.score(self.proxies[proxy]) for proxy in candidates]
+            return random.choices(candidates, weights=weights)[0]
+
+    def get_proxies(self):
+        """获取请求使用的代理，http 和 https 使用同一个代理。没有可用代理时返回 None，直接连接"""
+        proxy = self.choose()
+        if not proxy:
+            if not PROXY_CONFIG['allow_direct'] and self.proxies:
+                raise ProxyUnavailable("没有可用的代理")
+            return None
+        return {'http': proxy, 'https': proxy}
+
+    def report(self, proxy, success, latency=None):
+        """记录一次请求的结果"""
+        if not proxy:
+            return
+        with self.lock:
+            stats = self.proxies.get(proxy)
+            if not stats:  # 代理已被移出代理池
+                return
+            stats['probing'] = False
+            if success:
+                stats['successes'] += 1
+                stats['consecutive_failures'] = 0
+                stats['state'] = CLOSED
+                if latency is not None:
+                    alpha = PROXY_CONFIG['latency_alpha']
+                    stats['latency'] = alpha * latency + (1 - alpha) * stats['latency']
+                return
+            stats['failures'] += 1
+            stats['consecutive_failures'] += 1
+            if stats['state'] == HALF_OPEN or stats['consecutive_failures'] >= PROXY_CONFIG['failure_threshold']:
+                stats['state'] = OPEN
+                stats['opened_at'] = time.time()
+                print(f"代理 {proxy} 连续失败 {stats['consecutive_failures']} 次，已熔断")
+
+    def get_scores(self):
+        """获取所有代理的状态和得分，供监控使用"""
+        with self.lock:
+            return {
+                proxy: {
+                    'state': stats['state'],
+                    'successes': stats['successes'],
+                    'failures': stats['failures'],
+                    'latency': round(stats['latency'], 3),
+                    'score': round(self.score(stats), 3)
+                }
+                for proxy, stats in self.proxies.items()
+            }
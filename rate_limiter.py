@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# 基于 Redis 的分布式令牌桶限速器，所有爬虫进程共享每个主机的请求速率
+
+import time
+from urllib.parse import urlparse
+from config import REDIS_KEYS, RATE_LIMIT_CONFIG
+from url_canonicalizer import match_domain
+
+# 令牌桶脚本。在 Redis 内部按服务器时间补充令牌并预约一个令牌，整个过程是原子的。
+# 令牌不足时允许余额为负，返回需要等待的秒数，调用方等待后即可发送请求，无需反复轮询。
+TOKEN_BUCKET_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+
+class HostRateLimiter:
+    """按主机限速。每个主机一个令牌桶，速率和突发量在 RATE_LIMIT_CONFIG 中配置"""
+
+    def __init__(self, redis_client):
+        """初始化限速器"""
+        self.redis_client = redis_client
+        self.script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def get_limit(self, host):
+        """获取主机的限速配置。依次匹配主机名及其上级域名，都没有配置时使用默认值"""
+        return match_domain(host, RATE_LIMIT_CONFIG['domains']) or RATE_LIMIT_CONFIG['default']
+
+    def reserve(self, url):
+        """为URL所在主机预约一个令牌，返回发送请求前需要等待的秒数"""
+        if not RATE_LIMIT_CONFIG['enabled']:
+            return 0
+        host = urlparse(url).hostname or ''
+        limit = self.get_limit(host)
+        try:
+            wait = self.script(
+                keys=[f"{REDIS_KEYS['rate_limit_prefix']}:{host}"],
+                args=[limit['rate'], limit['burst']]
+            )
+            return float(wait)
+        except Exception as e:
+            print(f"限速器访问失败，不做限速: {str(e)}")
+            return 0
+
+    def acquire(self, url):
+        """阻塞直到可以向URL所在主机发送请求"""
+        wait = self.reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# 延迟重试队列：失败的URL按指数退避加随机抖动放入有序集合，到期后重新放回待爬取队列
+
+import json
+import random
+import time
+from bloom import SeenSet
+from config import REDIS_KEYS, CRAWLER_CONFIG, RETRY_CONFIG
+
+# 取出到期的URL。查询和删除在同一个脚本中完成，多个进程同时执行时每个URL只会被取出一次
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+class RetryQueue:
+    """失败URL的延迟重试队列。retry_schedule 有序集合的分数是下次尝试的时间，
+    retry_meta 哈希表记录重试次数、不计入重试次数的失败次数、URL的深度和最后的错误"""
+
+    def __init__(self, redis_client, frontier=None):
+        """初始化重试队列。frontier 用于把到期的URL放回待爬取队列，只有执行 promote_due 时需要"""
+        self.redis_client = redis_client
+        self.frontier = frontier
+        self.success_urls = SeenSet(redis_client, 'success_urls')
+        self.failed_urls = SeenSet(redis_client, 'failed_urls')
+        self.pop_due_script = redis_client.register_script(POP_DUE_SCRIPT)
+
+    def get_meta(self, url):
+        """获取URL的重试信息"""
+        meta = self.redis_client.hget(REDIS_KEYS['retry_meta'], url)
+        return json.loads(meta) if meta else {'attempts': 0, 'uncharged': 0}
+
+    def get_delay(self, attempts):
+        """第 attempts 次失败后的等待时间：指数退避，再乘以随机抖动，避免大量URL同时到期"""
+        delay = min(RETRY_CONFIG['max_delay'], RETRY_CONFIG['base_delay'] * 2 ** (attempts - 1))
+        return delay * random.uniform(1 - RETRY_CONFIG['jitter'], 1)
+
+    def schedule(self, url, error, charge=True, depth=0):
+        """安排URL稍后重试，depth 为URL的深度，到期后按原深度放回队列。达到最大尝试次数时返回 False，由调用方标记为失败。
+        charge 为 False 时失败不是URL的原因（如代理都不可用），不增加重试次数，单独计数：
+        两种失败都使等待时间加倍，不计入的失败超过 max_uncharged 次时同样放弃"""
+        meta = self.get_meta(url)
+        if charge:
+            meta['attempts'] += 1
+        else:
+            meta['uncharged'] = meta.get('uncharged', 0) + 1
+        meta['depth'] = depth
+        meta['last_error'] = error
+        if (meta['attempts'] >= CRAWLER_CONFIG['max_retries']
+                or meta.get('uncharged', 0) >= RETRY_CONFIG['max_uncharged']):
+            return False
+        delay = self.get_delay(meta['attempts'] + meta.get('uncharged', 0))
+        meta['next_attempt'] = time.time() + delay
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hset(REDIS_KEYS['retry_meta'], url, json.dumps(meta, ensure_ascii=False))
+        pipe.zadd(REDIS_KEYS['retry_schedule'], {url: meta['next_attempt']})
+        pipe.execute()
+        print(f"URL {url} 第 {meta['attempts']} 次失败，{delay:.1f} 秒后重试: {error}")
+        return True
+
+    def give_up(self, url, error):
+        """不再重试，标记为失败"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        self.failed_urls.add([url], pipe)
+        pipe.hdel(REDIS_KEYS['retry_meta'], url)
+        pipe.execute()
+        print(f"URL {url} 放弃重试: {error}")
+
+    def mark_success(self, url):
+        """标记为成功，并清除重试信息"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        self.success_urls.add([url], pipe)
+        pipe.hdel(REDIS_KEYS['retry_meta'], url)
+        pipe.execute()
+
+    def promote_due(self):
+        """将到期的URL按原来的深度放回待爬取队列，返回数量"""
+        urls = self.pop_due_script(
+            keys=[REDIS_KEYS['retry_schedule']],
+            args=[time.time(), RETRY_CONFIG['promote_batch']]
+        )
+        if not urls:
+            return 0
+        by_depth = {}
+        for url, meta in zip(urls, self.redis_client.hmget(REDIS_KEYS['retry_meta'], urls)):
+            depth = json.loads(meta).get('depth', 0) if meta else 0
+            by_depth.setdefault(depth, []).append(url)
+        for depth, group in by_depth.items():
+            self.frontier.push(group, depth)
+        return len(urls)
+
+    def promote_worker(self):
+        """重试调度进程，定时将到期的URL放回待爬取队列"""
+        print("重试调度进程已启动")
+        while True:
+            try:
+                promoted = self.promote_due()
+                if promoted:
+                    print(f"重试调度: {promoted} 个URL已放回待爬取队列")
+                if promoted < RETRY_CONFIG['promote_batch']:  # 一批没有取完时说明已无到期URL，等待下一轮
+                    time.sleep(RETRY_CONFIG['promote_interval'])
+            except Exception as e:
+                print(f"重试调度出错: {str(e)}")
+                time.sleep(RETRY_CONFIG['promote_interval'])
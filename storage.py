@@ -6,6 +6,8 @@ import time
 from datetime import datetime
 import redis
 from config import REDIS_CONFIG, CRAWLER_CONFIG, REDIS_KEYS
+from frontier import Frontier
+from bloom import SeenSet
 import sqlite3
 
 
@@ -14,6 +16,7 @@ class Storage:
         """初始化存储系统"""
         try:
             self.redis_client = redis.Redis(**REDIS_CONFIG)
+            self.frontier = Frontier(self.redis_client)
             print("Storage: Redis连接成功")
 
             # 创建数据存储目录
@@ -107,7 +110,7 @@ class Storage:
             print(f"✓ 数据保存成功: {title}")
 
             # 将URL添加到Redis的待处理队列
-            self.redis_client.sadd(REDIS_KEYS['pending_urls'], url)
+            self.frontier.push([url])
 
         except Exception as e:
             print(f"× 数据保存失败: {str(e)}")
@@ -132,38 +135,60 @@ class Storage:
             stats = {}
 
             # 从Redis获取统计信息
-            stats['待下载URL数'] = self.redis_client.scard(REDIS_KEYS['pending_urls'])  # scard返回集合中元素的数量
-            stats['已下载URL数'] = self.redis_client.scard(REDIS_KEYS['success_urls'])
-            stats['下载失败数'] = self.redis_client.scard(REDIS_KEYS['failed_urls'])
+            stats['待下载URL数'] = self.frontier.size()  # 所有分片的待爬取URL数量
+            stats['已下载URL数'] = SeenSet(self.redis_client, 'success_urls').count()
+            stats['下载失败数'] = SeenSet(self.redis_client, 'failed_urls').count()
             stats['图片标题数'] = self.redis_client.hlen(REDIS_KEYS['image_titles'])  # hlen返回哈希表中字段数量
 
-            # 获取下载目录大小
+            # 获取下载目录大小（图片按内容摘要保存在子目录中）
             download_size = sum(
-                os.path.getsize(os.path.join(CRAWLER_CONFIG['download_path'], f))
-                for f in os.listdir(CRAWLER_CONFIG['download_path'])
-                if os.path.isfile(os.path.join(CRAWLER_CONFIG['download_path'], f))
+                os.path.getsize(os.path.join(root, f))
+                for root, _, files in os.walk(CRAWLER_CONFIG['download_path'])
+                for f in files
             )
             stats['下载目录大小'] = f"{download_size / 1024 / 1024:.2f} MB"
 
+            # 按内容去重节省的磁盘空间和流量
+            crawler_stats = self.redis_client.hgetall(REDIS_KEYS['crawler_stats'])
+            stats['图片清单数'] = self.redis_client.hlen(REDIS_KEYS['image_manifest'])
+            stats['重复图片数'] = int(crawler_stats.get('image_duplicates', 0))
+            stats['去重节省磁盘'] = f"{int(crawler_stats.get('image_disk_bytes_saved', 0)) / 1024 / 1024:.2f} MB"
+            stats['跳过下载数'] = int(crawler_stats.get('image_url_hits', 0)) + int(crawler_stats.get('image_etag_hits', 0))
+            stats['跳过下载节省流量'] = f"{int(crawler_stats.get('image_bandwidth_bytes_saved', 0)) / 1024 / 1024:.2f} MB"
+
             return stats
 
         except Exception as e:
             print(f"获取统计信息失败: {str(e)}")
             return {}
 
+    def get_downloaded_images(self):
+        """获取已下载的图片，返回 (以标题命名的文件名, 图片路径) 列表"""
+        try:
+            images = []
+            for url, entry in self.redis_client.hgetall(REDIS_KEYS['image_manifest']).items():
+                entry = json.loads(entry)
+                if os.path.exists(entry['path']):
+                    images.append((entry.get('name') or os.path.basename(entry['path']), entry['path']))
+            return images
+        except Exception as e:
+            print(f"获取图片清单失败: {str(e)}")
+            return []
+
     def search_data(self, keyword):
         """搜索图片数据"""
         try:
             results = []
             # 从图片标题中搜索
             all_titles = self.redis_client.hgetall(REDIS_KEYS['image_titles'])
-            for url, title in all_titles.items():
-                if keyword in title:
-                    results.append({
-                        'title': title,
-                        'url': url,
-                        'status': '已下载' if self.redis_client.sismember(REDIS_KEYS['success_urls'], url) else '待下载'
-                    })
+            matched = [(url, title) for url, title in all_titles.items() if keyword in title]
+            downloaded = SeenSet(self.redis_client, 'success_urls').contains_many(url for url, _ in matched)
+            for (url, title), done in zip(matched, downloaded):
+                results.append({
+                    'title': title,
+                    'url': url,
+                    'status': '已下载' if done else '待下载'
+                })
 
             print(f"\n找到 {len(results)} 个包含 '{keyword}' 的图片:")
             for item in results:
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# URL规范化：同一资源的不同写法统一为同一个URL，在入队和去重检查之前执行
+
+import re
+import string
+from urllib.parse import urljoin, urlsplit, urlunsplit, unquote_plus, quote
+from config import CANONICAL_CONFIG
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# 路径中不需要编码的字符，其余字符（空格、中文等）按 UTF-8 编码
+PATH_SAFE = "/:@!$&'()*+,;=%"
+# 查询参数名和值中不需要编码的字符（& 和 = 是分隔符，在拆分之后编码）
+QUERY_SAFE = "/:@!$'()*+,;?%"
+PERCENT_ESCAPE = re.compile(r'%[0-9a-fA-F]{2}')
+UNRESERVED = frozenset(string.ascii_letters + string.digits + '-._~')
+
+
+def match_domain(host, domains):
+    """按域名查找配置：依次匹配主机名及其上级域名（a.b.com、b.com、com），返回最先匹配到的配置，都没有时返回 None。
+    按域名配置的规则（规范化、限速、图片提取）都通过这里查找"""
+    parts = host.lower().rstrip('.').split('.')
+    for i in range(len(parts)):
+        value = domains.get('.'.join(parts[i:]))
+        if value:
+            return value
+    return None
+
+
+def get_site_rules(host):
+    """获取主机的规范化规则，子域名未单独配置时使用上级域名的规则"""
+    return match_domain(host, CANONICAL_CONFIG['sites']) or {}
+
+
+def is_dropped_param(name, patterns):
+    """查询参数是否需要去掉，patterns 中以 * 结尾的表示前缀匹配"""
+    name = name.lower()
+    for pattern in patterns:
+        if pattern.endswith('*') and name.startswith(pattern[:-1]) or name == pattern:
+            return True
+    return False
+
+
+def normalize_escape(match):
+    """非保留字符的百分号编码解码，其余编码统一为大写"""
+    char = chr(int(match.group(0)[1:], 16))
+    return char if char in UNRESERVED else match.group(0).upper()
+
+
+def normalize_escapes(text, safe):
+    """编码不安全的字符，统一已有的百分号编码"""
+    return PERCENT_ESCAPE.sub(normalize_escape, quote(text, safe=safe))
+
+
+def remove_dot_segments(path):
+    """去掉 . 和 .. 路径段（RFC 3986 5.2.4），重复的斜杠是不同的路径，保持原样"""
+    segments = path.split('/')[1:]
+    output = []
+    for segment in segments:
+        if segment == '..':
+            if output:
+                output.pop()
+        elif segment != '.':
+            output.append(segment)
+    if segments and segments[-1] in ('.', '..'):  # /a/. 和 /a/b/.. 都是目录 /a/
+        output.append('')
+    return '/' + '/'.join(output)
+
+
+def normalize_path(path, rules):
+    """统一百分号编码，去掉 . 和 .. 路径段，保留末尾的斜杠。站点规则可以合并重复的斜杠"""
+    path = normalize_escapes(path, PATH_SAFE)
+    if not path:
+        return '/'
+    if rules.get('merge_slashes'):
+        path = re.sub('/{2,}', '/', path)
+    return remove_dot_segments(path)
+
+
+def normalize_query(query, rules):
+    """去掉跟踪参数，按参数名排序。没有值的参数（?flag）与值为空的参数（?flag=）不同，保持原样。
+    站点规则可以只保留指定参数，或去掉全部参数"""
+    if not query or rules.get('drop_query'):
+        return ''
+    params = []
+    for part in query.split('&'):
+        if not part:
+            continue
+        name, sep, value = part.partition('=')
+        params.append((normalize_escapes(name, QUERY_SAFE), normalize_escapes(value, QUERY_SAFE) if sep else None))
+    keep = rules.get('keep_params')
+    if keep is not None:
+        params = [(name, value) for name, value in params if unquote_plus(name) in keep]
+    drop = CANONICAL_CONFIG['drop_params'] + rules.get('drop_params', [])
+    params = [(name, value) for name, value in params if not is_dropped_param(unquote_plus(name), drop)]
+    if CANONICAL_CONFIG['sort_query']:
+        params.sort(key=lambda param: (param[0], param[1] is not None, param[1] or ''))
+    return '&'.join(name if value is None else f'{name}={value}' for name, value in params)
+
+
+def canonicalize(url, base=None):
+    """返回规范化后的URL。base 为页面URL，用于补全相对地址和省略协议的地址；不是 http(s) URL 时返回 None"""
+    if not url:
+        return None
+    url = url.strip()
+    if base:
+        url = urljoin(base, url)
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:  # 端口或 IPv6 地址格式错误
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    host = parts.hostname.rstrip('.')
+    rules = get_site_rules(host)
+    netloc = host
+    if ':' in host:  # IPv6 地址
+        netloc = f'[{host}]'
+    # 先统一协议，再去掉默认端口：原来协议的默认端口（如 http://host:80）等于没有写端口，最终协议的默认端口同样省略
+    final_scheme = rules.get('scheme', scheme)
+    if port and port not in (DEFAULT_PORTS[scheme], DEFAULT_PORTS[final_scheme]):
+        netloc = f'{netloc}:{port}'
+    scheme = final_scheme
+    if parts.username:
+        userinfo = parts.username + (f':{parts.password}' if parts.password else '')
+        netloc = f'{userinfo}@{netloc}'
+
+    return urlunsplit((scheme, netloc, normalize_path(parts.path, rules), normalize_query(parts.query, rules), ''))
+
+
+def canonicalize_many(urls, base=None):
+    """批量规范化，去掉无效URL和规范化后重复的URL，保持原有顺序"""
+    return list(dict.fromkeys(filter(None, (canonicalize(url, base) for url in urls))))
@@ -1,132 +1,86 @@
 # -*- coding: utf-8 -*-
 
+from pyflink.common import Types, WatermarkStrategy
 from pyflink.datastream import StreamExecutionEnvironment
-from pyflink.datastream.functions import ProcessFunction
-import redis
-import time
+from pyflink.datastream.connectors.number_seq import NumberSequenceSource
+from pyflink.datastream.functions import FlatMapFunction, ProcessFunction
+from dispatcher import IDLE, URLDispatcher
 
-class URLDispatcherFlink:
+
+class FrontierSourceFunction(FlatMapFunction):
+    """无界的待爬取队列数据源。PyFlink 不支持用 Python 实现 Source，所以用无限的数字序列作为节拍，
+    每个节拍从待爬取队列中取出一批带租约的URL，不需要 Flink 的检查点来记录读取位置"""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def open(self, runtime_context):
+        """算子启动时连接 Redis"""
+        self.reader.open()
+
+    def close(self):
+        """算子停止时关闭连接"""
+        self.reader.close()
+
+    def flat_map(self, tick):
+        """每个节拍取出一批 (URL, 深度)。没有取到时读取端已等待过，发出 IDLE，通知下游把缓存的URL写入任务列表"""
+        entries = self.reader.read_batch()
+        if not entries:
+            yield IDLE
+            return
+        yield from entries
+
+
+class DispatchProcessFunction(ProcessFunction):
+    """用于处理URL分发逻辑，把 dispatcher.py 中的分发策略包装为 Flink 算子"""
+
+    def __init__(self, strategy):
+        self.strategy = strategy
+
+    def open(self, runtime_context):
+        """算子启动时创建连接池"""
+        self.strategy.open()
+
+    def close(self):
+        """算子停止时写入剩余的URL"""
+        self.strategy.close()
+
+    def process_element(self, entry, context):
+        """处理每个 (URL, 深度) 的方法"""
+        self.strategy.dispatch(tuple(entry))
+
+
+class URLDispatcherFlink(URLDispatcher):
     def __init__(self, redis_host, redis_port, redis_db, pending_urls_key, crawler_tasks_key_prefix):
         """初始化基于 Flink 的 URL 分发器"""
+        super().__init__(redis_host, redis_port, redis_db, pending_urls_key, crawler_tasks_key_prefix)
         self.env = StreamExecutionEnvironment.get_execution_environment()  # flink的流处理环境
-        self.redis_host = redis_host
-        self.redis_port = redis_port
-        self.redis_db = redis_db
-        self.pending_urls_key = pending_urls_key  # 待爬取 URL 的 Redis key
-        self.crawler_tasks_key_prefix = crawler_tasks_key_prefix  # 爬虫任务的 Redis key 前缀
-
-    def round_robin_dispatch(self, crawler_count):
-        """轮询分发策略"""
-        try:
-            # 连接到 Redis
-            redis_client = redis.Redis(host=self.redis_host, port=self.redis_port, db=self.redis_db)
-
-            # 从 Redis 待爬取列表读取 URL 流
-            pending_urls = redis_client.lrange(self.pending_urls_key, 0, -1)
-            # pending_urls = redis_client.spop(self.pending_urls_key)
-            print("pending urls: ", pending_urls)
-            pending_url_stream = self.env.from_collection(pending_urls)  # 从URL列表转换为flink数据流
-
-            # 轮询分发 URL 到爬虫任务列表
-            class DispatchProcessFunction(ProcessFunction):
-                """用于处理URL分发逻辑"""
-                def __init__(self, crawler_count, crawler_tasks_key_prefix, redis_host, redis_port, redis_db):
-                    self.crawler_count = crawler_count
-                    self.crawler_tasks_key_prefix = crawler_tasks_key_prefix
-                    self.redis_host = redis_host
-                    self.redis_port = redis_port
-                    self.redis_db = redis_db
-                    self.current_crawler = 0  # 当前轮询到的爬虫索引
-
-                def process_element(self, url, context):
-                    """处理每个URL的方法"""
-                    if not url:
-                        return
-                    # 动态创建 Redis 连接
-                    redis_client = redis.Redis(host=self.redis_host, port=self.redis_port, db=self.redis_db)
-
-                    # 轮询分发
-                    # task_key = f"{self.crawler_tasks_key_prefix}_{self.current_crawler}"  # 根据当前爬虫索引，生成对应任务列表的键名
-                    # redis_client.rpush(task_key, url)  # 将 URL 写入 Redis
-                    redis_client.rpush(f'crawler:{self.current_crawler}:tasks', url)  # 将 URL 写入 Redis
-                    print(f"分发器: 将URL {url} 分发给爬虫 {self.current_crawler}")
-
-                    # 更新爬虫索引
-                    self.current_crawler = (self.current_crawler + 1) % self.crawler_count
-
-                    # 关闭 Redis 连接
-                    redis_client.close()
-
-            # 分发 URL 到爬虫任务列表
-            dispatched_stream = pending_url_stream.process(
-                DispatchProcessFunction(crawler_count, self.crawler_tasks_key_prefix, self.redis_host, self.redis_port, self.redis_db)
-            )
 
-            # 启动 Flink 任务
-            self.env.execute("URL Dispatcher Flink Job")
-        except Exception as e:
-            print(f"URL 分发失败: {str(e)}")
-
-    def random_dispatch(self, crawler_count):
-        """随机分发策略"""
-        import random
+    def pending_url_stream(self, crawler_count):
+        """从待爬取队列持续读取 (URL, 深度) 的无界数据流"""
+        ticks = self.env.from_source(
+            NumberSequenceSource(0, 2 ** 63 - 1),  # 实际上不会结束的节拍流
+            WatermarkStrategy.no_watermarks(),
+            "Frontier Ticks"
+        )
+        return ticks.flat_map(FrontierSourceFunction(self.create_reader(crawler_count)),
+                              output_type=Types.TUPLE([Types.STRING(), Types.INT()]))
+
+    def run(self, crawler_count, dispatch_strategy):
+        """按分发策略把URL分发到爬虫任务列表"""
         try:
-            # 连接到 Redis
-            redis_client = redis.Redis(host=self.redis_host, port=self.redis_port, db=self.redis_db)
-
-            # 从 Redis 待爬取列表读取 URL 流
-            pending_urls = redis_client.lrange(self.pending_urls_key, 0, -1)
-            # pending_urls = redis_client.spop(self.pending_urls_key)
-            print("pending urls: ", pending_urls)
-            pending_url_stream = self.env.from_collection(pending_urls)  # 从URL列表转换为flink数据流
-
-            # 随机分发 URL 到爬虫任务列表
-            class RandomDispatchProcessFunction(ProcessFunction):
-                def __init__(self, crawler_count, crawler_tasks_key_prefix, redis_host, redis_port, redis_db):
-                    self.crawler_count = crawler_count
-                    self.crawler_tasks_key_prefix = crawler_tasks_key_prefix
-                    self.redis_host = redis_host
-                    self.redis_port = redis_port
-                    self.redis_db = redis_db
-
-                def process_element(self, url, context):
-                    """处理每个URL的方法"""
-                    if not url:
-                        return
-                    # 动态创建 Redis 连接
-                    redis_client = redis.Redis(host=self.redis_host, port=self.redis_port, db=self.redis_db)
-
-                    # 随机选择爬虫
-                    selected_crawler = random.randint(0, self.crawler_count - 1)
-                    # task_key = f"{self.crawler_tasks_key_prefix}_{selected_crawler}"  # 每个爬虫有独立的任务列表
-                    # redis_client.rpush(task_key, url)  # 将 URL 写入 Redis
-                    redis_client.rpush(f'crawler:{selected_crawler}:tasks', url)  # 将 URL 写入 Redis
-                    print(f"分发器: 将URL {url} 随机分发给爬虫 {selected_crawler}")
-
-                    # 关闭 Redis 连接
-                    redis_client.close()
-
-            # 分发 URL 到爬虫任务列表
-            dispatched_stream = pending_url_stream.process(
-                RandomDispatchProcessFunction(crawler_count, self.crawler_tasks_key_prefix, self.redis_host,
-                                              self.redis_port, self.redis_db)
+            # 从 Redis 待爬取队列持续读取 URL 流
+            pending_url_stream = self.pending_url_stream(crawler_count)
+
+            # 分发 URL 到爬虫任务列表，写入 Redis 在算子内完成，不需要下游 sink
+            pending_url_stream.process(
+                DispatchProcessFunction(self.create_strategy(crawler_count, dispatch_strategy))
             )
 
-            # 启动 Flink 任务
+            # 启动 Flink 任务，数据源是无界的，任务会一直运行
             self.env.execute("URL Dispatcher Flink Job")
         except Exception as e:
             print(f"URL 分发失败: {str(e)}")
-
-    def start_dispatch(self, crawler_count=3, dispatch_strategy="roundrobin"):
-        """启动分发器"""
-        try:
-            print(f"启动 URL 分发器，爬虫数量: {crawler_count}")
-            if dispatch_strategy == "roundrobin":
-                self.round_robin_dispatch(crawler_count)
-            elif dispatch_strategy == "random":
-                self.random_dispatch(crawler_count)
-        except Exception as e:
-            print(f"启动分发器失败: {str(e)}")
             raise
 
 if __name__ == "__main__":
@@ -140,4 +94,4 @@ if __name__ == "__main__":
     dispatcher = URLDispatcherFlink(redis_host, redis_port, redis_db, pending_urls_key, crawler_tasks_key_prefix)
 
     # 启动 URL 分发器
-    dispatcher.start_dispatch(crawler_count=3)
\ No newline at end of file
+    dispatcher.start_dispatch(crawler_count=3)
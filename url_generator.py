@@ -1,61 +1,114 @@
 # -*- coding: utf-8 -*-
-# 动态URL分发
+# 动态URL分发：按配置的关键词和页码模板批量生成列表页URL
 
+import argparse
+import re
+import time
+from itertools import islice
+from urllib.parse import urljoin
 import redis
-from config import REDIS_CONFIG, REDIS_KEYS
 import requests
 from fake_useragent import UserAgent
-import time
+from lxml import etree
+from config import REDIS_CONFIG, URL_GENERATOR_CONFIG
+from frontier import Frontier
+from bloom import SeenSet
+
+
+def load_keywords(template, keywords_file=None):
+    """模板的关键词列表，与关键词文件（每行一个，# 开头为注释）合并，去掉重复的关键词"""
+    keywords = list(template.get('keywords', []))
+    for path in filter(None, [template.get('keywords_file'), keywords_file]):
+        with open(path, 'r', encoding='utf-8') as f:
+            keywords.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    return list(dict.fromkeys(keywords))
+
+
+def build_page_url(template, keyword, page):
+    """第 page 页的URL，第一页可以使用单独的模板"""
+    if page == 1 and template.get('first_page'):
+        return template['first_page'].format(keyword=keyword)
+    return template['page'].format(keyword=keyword, page=page)
+
+
+def discover_last_page(template, keyword, headers):
+    """请求第一页，从分页链接中找出最大的页码，失败时返回 None"""
+    first_url = build_page_url(template, keyword, 1)
+    # 把页码模板转换为正则表达式，例如 .../laohutupian_(\d+).html
+    pattern = re.compile(re.escape(template['page'].format(keyword=keyword, page='{page}')).replace(
+        re.escape('{page}'), r'(\d+)') + '$')
+    try:
+        response = requests.get(first_url, headers=headers, timeout=URL_GENERATOR_CONFIG['timeout'])
+        if response.status_code != 200:
+            print(f"获取最后一页失败 {first_url}: HTTP {response.status_code}")
+            return None
+        response.encoding = 'utf-8'
+        tree = etree.HTML(response.text)
+        pages = [
+            int(match.group(1))
+            for href in tree.xpath('//a/@href')
+            for match in [pattern.search(urljoin(first_url, href))]
+            if match
+        ]
+        return max(pages) if pages else 1
+    except Exception as e:
+        print(f"获取最后一页失败 {first_url}: {str(e)}")
+        return None
 
-def generate_urls_by_keywords():
-    """通过关键词生成URL"""
+
+def iter_candidate_urls(keywords_file=None, discover=None):
+    """按模板逐个生成候选URL"""
+    discover = URL_GENERATOR_CONFIG['discover_last_page'] if discover is None else discover
+    headers = {'User-Agent': UserAgent().random} if discover else None
+    for template in URL_GENERATOR_CONFIG['templates']:
+        first, last = template['pages']
+        for keyword in load_keywords(template, keywords_file):
+            end = last
+            if discover:
+                found = discover_last_page(template, keyword, headers)
+                if found:
+                    end = min(found, URL_GENERATOR_CONFIG['max_pages'])
+                    print(f"关键词 {keyword} 共 {found} 页，生成第 {first} - {end} 页")
+            for page in range(first, end + 1):
+                yield build_page_url(template, keyword, page)
+
+
+def generate_urls_by_keywords(keywords_file=None, discover=None):
+    """通过关键词生成URL。候选URL分批检查是否已处理，未处理的批量放入待爬取队列"""
     redis_client = redis.Redis(**REDIS_CONFIG)
-    ua = UserAgent()
-    
-    # 动物关键词列表（使用拼音，站长之家的URL格式）
-    keywords = [
-        'xiaogouxiaomaotupian',  # 小狗小猫图片
-        'laohutupian',  # 老虎图片
-        'madetupian',  # 马的图片
-    ]
-    
-    base_url = 'https://sc.chinaz.com/tupian/'
-    
+    frontier = Frontier(redis_client)
+    success_urls = SeenSet(redis_client, 'success_urls')
+    batch_size = URL_GENERATOR_CONFIG['batch_size']
+
     print("=== 开始生成新的URL ===")
-    total_added = 0
-    
-    for keyword in keywords:
-        print(f"\n正在处理关键词: {keyword}")
-        
-        # 处理多个页面
-        for page in range(1, 3):  # 每个关键词处理2页
-            try:
-                # 构建搜索URL
-                if page == 1:
-                    url = f"{base_url}{keyword}.html"
-                else:
-                    url = f"{base_url}{keyword}_{page}.html"
-                
-                # 检查URL是否已经处理过
-                if redis_client.sismember(REDIS_KEYS['success_urls'], url):
-                    print(f"URL已存在，跳过: {url}")
-                    continue
-                
-                print(f"添加新URL: {url}")
-                redis_client.sadd(REDIS_KEYS['pending_urls'], url)
-                total_added += 1
-                
-                # 避免请求太快
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"处理URL时出错: {str(e)}")
-                continue
-    
+    start = time.time()
+    total_generated = total_skipped = total_added = 0
+    candidates = iter_candidate_urls(keywords_file, discover)
+
+    while True:
+        batch = list(islice(candidates, batch_size))
+        if not batch:
+            break
+        # 批量检查URL是否已经处理过，已在待爬取队列中的URL由 frontier 跳过
+        processed = success_urls.contains_many(batch)
+        new_urls = [url for url, done in zip(batch, processed) if not done]
+        total_generated += len(batch)
+        total_skipped += len(batch) - len(new_urls)
+        total_added += frontier.push(new_urls)
+        print(f"已生成 {total_generated} 个URL，新增 {total_added} 个")
+
+    elapsed = max(time.time() - start, 1e-6)
     print(f"\n=== URL生成完成 ===")
+    print(f"- 生成URL数: {total_generated}（{total_generated / elapsed:.0f} 个/秒）")
+    print(f"- 已处理跳过: {total_skipped}")
     print(f"- 新增URL数: {total_added}")
-    print(f"- 待处理URL总数: {redis_client.scard(REDIS_KEYS['pending_urls'])}")
-    print(f"- 已处理URL总数: {redis_client.scard(REDIS_KEYS['success_urls'])}")
+    print(f"- 待处理URL总数: {frontier.size()}")
+    print(f"- 已处理URL总数: {success_urls.count()}")
+
 
 if __name__ == '__main__':
-    generate_urls_by_keywords() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='按关键词和页码模板生成列表页URL')
+    parser.add_argument('--keywords-file', help='关键词文件，每行一个，与配置中的关键词合并')
+    parser.add_argument('--discover', action='store_true', default=None, help='请求第一页，按实际的最后一页生成页码')
+    args = parser.parse_args()
+    generate_urls_by_keywords(args.keywords_file, args.discover)
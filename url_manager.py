@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 
 from urllib.parse import urlparse  # URL解析模块
-import dns.resolver  # DNS解析模块
 import redis  # Redis 客户端
+import gzip
 import json
-from config import REDIS_CONFIG, REDIS_KEYS
+from config import REDIS_CONFIG, REDIS_KEYS, SEED_IMPORT_CONFIG
+from frontier import Frontier
+from bloom import SeenSet
+from dns_cache import DNSCache  # DNS解析模块
+from url_canonicalizer import canonicalize_many
 import time
 
 class URLManagerFlink:
@@ -12,6 +16,8 @@ class URLManagerFlink:
         """初始化URL 管理器"""
         self.redis_config = redis_config  # Redis 配置
         self.redis_client = None
+        self.frontier = None
+        self.dns_cache = None
 
     def connect_redis(self):
         """连接Redis"""
@@ -20,47 +26,100 @@ class URLManagerFlink:
                 self.redis_client = redis.Redis(**REDIS_CONFIG)
                 # 测试连接
                 self.redis_client.ping()
+                self.frontier = Frontier(self.redis_client)
+                self.frontier.migrate_legacy()  # 兼容旧版本集合格式的待爬取队列
                 print("Redis连接成功")
         except redis.ConnectionError as e:
             print(f"Redis连接失败: {str(e)}")
             raise
 
+    def add_seed_batch(self, urls):
+        """把一批种子URL写入种子集合，并放入待爬取队列，返回新的种子URL数量。每批只需两次 Redis 请求"""
+        urls = canonicalize_many(urls)  # 规范化并去掉批内重复的URL
+        if not urls:
+            return 0
+        added = self.redis_client.sadd(REDIS_KEYS['seed_urls'], *urls)
+        self.frontier.push(urls)  # 已在待爬取队列中的URL会被跳过
+        return added
+
     def add_seed_urls(self, urls):
-        """添加种子 URL 到 Redis"""
+        """流式添加种子 URL 到 Redis。urls 可以是任意可迭代对象，按批写入，内存占用与URL总数无关"""
         try:
             self.connect_redis()
-            added_count = 0
+            batch_size = SEED_IMPORT_CONFIG['batch_size']
+            progress_interval = SEED_IMPORT_CONFIG['progress_interval']
+            start = time.time()
+            read_count = added_count = 0
+            next_report = progress_interval
+            batch = []
             for url in urls:
-                print(f"正在添加种子URL: {url}")
-                # 添加到种子URL集合
-                if self.redis_client.sadd(REDIS_KEYS['seed_urls'], url):
-                    added_count += 1
-                # 同时添加到待爬取队列
-                if self.redis_client.sadd(REDIS_KEYS['pending_urls'], url):
-                    print(f"URL添加到待爬取队列: {url}")
-            print(f"成功添加 {added_count} 个新的种子URL")
+                batch.append(url)
+                read_count += 1
+                if len(batch) >= batch_size:
+                    added_count += self.add_seed_batch(batch)
+                    batch = []
+                if read_count >= next_report:
+                    elapsed = time.time() - start
+                    print(f"已读取 {read_count} 个种子URL，新增 {added_count} 个，{read_count / elapsed:.0f} 个/秒")
+                    next_report += progress_interval
+            if batch:
+                added_count += self.add_seed_batch(batch)
+
+            elapsed = max(time.time() - start, 1e-6)
+            print(f"成功添加 {added_count} 个新的种子URL（共读取 {read_count} 个，耗时 {elapsed:.1f} 秒，"
+                  f"{read_count / elapsed:.0f} 个/秒）")
 
             # 检查Redis中的URL数量
-            pending_count = self.redis_client.scard(REDIS_KEYS['pending_urls'])
+            pending_count = self.frontier.size()
             print(f"待爬取队列中现有URL数量: {pending_count}")
         except Exception as e:
             print(f"添加种子 URL 时出错: {str(e)}")
 
+    def read_seed_file(self, file_path):
+        """逐行读取种子文件，支持 gzip 压缩的文件（.gz），跳过空行和 # 开头的注释行"""
+        opener = gzip.open if file_path.endswith('.gz') else open
+        with opener(file_path, 'rt', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.strip()  # 去除每行的空白字符，过滤空行
+                if line and not line.startswith('#'):
+                    yield line
+
     def add_seed_urls_from_file(self, file_path):
-        """从文件批量导入种子 URL 到 Redis"""
+        """从文件流式导入种子 URL 到 Redis"""
         try:
-            with open(file_path, 'r') as f:
-                urls = [line.strip() for line in f if line.strip()]  # 去除每行的空白字符，过滤空行
-            self.add_seed_urls(urls)
+            print(f"正在从文件导入种子URL: {file_path}")
+            self.add_seed_urls(self.read_seed_file(file_path))
         except Exception as e:
             print(f"从文件导入种子 URL 时出错: {str(e)}")
 
+    def resume_crawl(self):
+        """启动时所有爬虫都已停止，把上次运行留下的在途URL全部放回待爬取队列。
+        仍有待爬取的URL时返回 True，说明上次的爬取没有完成，应从中断的位置继续而不是重新添加种子"""
+        try:
+            self.connect_redis()
+            reaped = self.frontier.reap_expired(all_leases=True)
+            pending = self.frontier.size()
+            queued = self.frontier.queued_count()  # 已分发到爬虫任务列表的URL不持有租约，留在列表中继续处理
+            if not pending and not queued:
+                return False
+            print(f"从上次中断的位置继续: 放回 {reaped} 个在途URL，待爬取队列中有 {pending} 个URL，"
+                  f"爬虫任务列表中有 {queued} 个URL")
+            return True
+        except Exception as e:
+            print(f"恢复上次的爬取时出错: {str(e)}")
+            return False
+
     def get_domain_ip(self, url):
-        """DNS解析模块"""
+        """DNS解析模块，通过共享的DNS缓存解析，结果按TTL缓存并供爬虫复用"""
+        domain = None
         try:
-            domain = urlparse(url).netloc  # 从URL中提取域名
-            answers = dns.resolver.resolve(domain, 'A')  # 解析域名的A记录
-            ips = [answer.address for answer in answers]  # 提取解析到的IP地址列表
+            self.connect_redis()
+            domain = urlparse(url).hostname  # 从URL中提取域名
+            if self.dns_cache is None:
+                self.dns_cache = DNSCache(self.redis_client)
+            ips = self.dns_cache.get_ips(domain)  # 解析域名的A记录
+            if not ips:
+                return None
             print(f"域名 {domain} 解析到IP: {ips}")
             return ips
         except Exception as e:
@@ -72,7 +131,7 @@ class URLManagerFlink:
         """获取待爬取的URL"""
         try:
             self.connect_redis()  # 确保redis连接已建立
-            url = self.redis_client.spop(REDIS_KEYS['pending_urls'])  # 弹出一个待爬取的URL
+            url = self.frontier.pop()  # 弹出一个待爬取的URL
             if url:
                 print(f"获取到待爬取URL: {url}")
             return url
@@ -85,10 +144,18 @@ class URLManagerFlink:
         try:
             self.connect_redis()
             if status == 'success':
-                self.redis_client.sadd(REDIS_KEYS['success_urls'], url)
+                SeenSet(self.redis_client, 'success_urls').add([url])
                 print(f"URL已标记为成功: {url}")
             else:
-                self.redis_client.sadd(REDIS_KEYS['failed_urls'], url)
+                SeenSet(self.redis_client, 'failed_urls').add([url])
                 print(f"URL已标记为失败: {url}")
         except Exception as e:
-            print(f"标记URL状态时出错: {str(e)}")
\ No newline at end of file
+            print(f"标记URL状态时出错: {str(e)}")
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) != 2:
+        print("用法: python url_manager.py <种子文件（每行一个URL，支持 .gz）>")
+        sys.exit(1)
+    URLManagerFlink(REDIS_CONFIG).add_seed_urls_from_file(sys.argv[1])